@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Planning time and spread of brick layouts against cluster size.
+
+Hosts with mixed 4 and 8 TiB disks are spread over three zones:
+
+    python3 benchmarks/layout.py --hosts 50 100 250 500 --disks 24
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src',
+                                'lib'))
+
+from charm.openstack import layout  # noqa
+
+TB = 1024 ** 4
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hosts', type=int, nargs='+',
+                        default=[50, 100, 250, 500])
+    parser.add_argument('--disks', type=int, default=24)
+    parser.add_argument('--zones', type=int, default=3)
+    parser.add_argument('--cluster-type', default='Distributed-Replicate')
+    parser.add_argument('--replication-level', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print('%6s %7s %10s %6s %10s %12s' % (
+        'hosts', 'disks', 'time (ms)', 'sets', 'unplaced', 'zone-short'))
+    for count in args.hosts:
+        disks = [layout.Disk('host%d' % h, '/dev/disk%d' % d,
+                             rng.choice([4, 8]) * TB,
+                             'az%d' % (h % args.zones))
+                 for h in range(count) for d in range(args.disks)]
+        start = time.perf_counter()
+        plan = layout.plan(disks, args.cluster_type, args.replication_level)
+        elapsed = time.perf_counter() - start
+        size = len(plan.sets[0]) if plan.sets else 0
+        # Sets which couldn't be put in as many zones as they have bricks.
+        short = len([s for s in plan.sets
+                     if len({d.zone for d in s}) < min(size, args.zones)])
+        print('%6d %7d %10.1f %6d %10d %12d' % (
+            count, len(disks), elapsed * 1000, len(plan.sets),
+            len(plan.unplaced), short))
+
+
+if __name__ == '__main__':
+    main()
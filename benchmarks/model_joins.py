@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Memory per object and peer/brick join time of the domain model.
+
+The slotted, UUID-keyed model is compared with plain objects carrying a
+__dict__ and compared field by field in nested loops, as the leader used
+to do when looking for peers without bricks and bricks still to add:
+
+    python3 benchmarks/model_joins.py --bricks 20 200 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src',
+                                'lib'))
+
+from charm.openstack import model  # noqa
+
+
+class PlainPeer(object):
+    def __init__(self, uuid, hostname, status):
+        self.uuid = uuid
+        self.hostname = hostname
+        self.status = status
+
+    def __eq__(self, other):
+        return self.__dict__ == other.__dict__
+
+
+class PlainBrick(object):
+    def __init__(self, brick_uuid, peer, path, is_arbiter):
+        self.brick_uuid = brick_uuid
+        self.peer = peer
+        self.path = path
+        self.is_arbiter = is_arbiter
+
+    def __eq__(self, other):
+        return self.__dict__ == other.__dict__
+
+
+def build(peer_cls, brick_cls, peers, bricks_per_peer):
+    peer_list = [peer_cls(uuid=uuid.uuid4(), hostname='10.0.%d.%d' %
+                          (i // 250, i % 250 + 1), status=None)
+                 for i in range(peers)]
+    bricks = [brick_cls(brick_uuid=None, peer=p, path='/mnt/brick%d' % n,
+                        is_arbiter=False)
+              for n in range(bricks_per_peer) for p in peer_list]
+    return peer_list, bricks
+
+
+def nested_join(peers, bricks, paths):
+    new_peers = []
+    for p in peers:
+        serving = False
+        for b in bricks:
+            if b.peer == p:
+                serving = True
+                break
+        if not serving:
+            new_peers.append(p)
+    missing = []
+    for path in paths:
+        for p in peers:
+            candidate = PlainBrick(None, p, path, False)
+            if not any(candidate == b for b in bricks):
+                missing.append(candidate)
+    return new_peers, missing
+
+
+def keyed_join(peers, bricks, paths):
+    serving = {b.peer.key for b in bricks}
+    existing = {b.key for b in bricks}
+    new_peers = [p for p in peers if p.key not in serving]
+    missing = [model.Brick(None, p, path, False)
+               for path in paths for p in peers
+               if (p.key, path) not in existing]
+    return new_peers, missing
+
+
+def per_object(peer_cls, brick_cls, peers, bricks_per_peer):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    peer_list, bricks = build(peer_cls, brick_cls, peers, bricks_per_peer)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / float(len(peer_list) + len(bricks))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bricks', type=int, nargs='+',
+                        default=[20, 200, 2000])
+    parser.add_argument('--bricks-per-peer', type=int, default=4)
+    args = parser.parse_args()
+
+    print('%7s %14s %14s %12s %12s' % (
+        'bricks', 'plain (B/obj)', 'model (B/obj)', 'nested (ms)',
+        'keyed (ms)'))
+    for count in args.bricks:
+        peers = max(1, count // args.bricks_per_peer)
+        # One more path than the volume has, so every peer gets a new brick.
+        paths = ['/mnt/brick%d' % n for n in range(args.bricks_per_peer + 1)]
+        plain = per_object(PlainPeer, PlainBrick, peers,
+                           args.bricks_per_peer)
+        slotted = per_object(model.Peer, model.Brick, peers,
+                             args.bricks_per_peer)
+        plain_peers, plain_bricks = build(PlainPeer, PlainBrick, peers,
+                                          args.bricks_per_peer)
+        peer_list, bricks = build(model.Peer, model.Brick, peers,
+                                  args.bricks_per_peer)
+        # Half the peers are new and host no brick yet.
+        nested = timed(nested_join, plain_peers,
+                       plain_bricks[:len(plain_bricks) // 2], paths)
+        keyed = timed(keyed_join, peer_list,
+                      bricks[:len(bricks) // 2], paths)
+        print('%7d %14.0f %14.0f %12.2f %12.2f' % (
+            count, plain, slotted, nested * 1000, keyed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parse time and peak memory of volume info and volume status output.
+
+Documents with 10, 100 and 1000 bricks are built from the recorded
+fixtures in unit_tests/ and written to disk. The streaming parsers read
+the file as they would read gluster's stdout; glustercli's parsers are
+given the whole output as communicate() would return it:
+
+    python3 benchmarks/parse_xml.py --bricks 10 100 1000
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src', 'lib'))
+
+import xml.etree.ElementTree as etree  # noqa
+
+import gluster.cli.parsers as gluster_parsers  # noqa
+
+from charm.openstack import parsers  # noqa
+
+
+def _scale(name, record, count):
+    """Replaces the records in a fixture with count generated ones."""
+    with open(os.path.join(ROOT, 'unit_tests', name), 'r') as f:
+        doc = f.read()
+    pattern = re.compile(r'(\s*<%s\b.*?</%s>)' % (record, record), re.S)
+    records = pattern.findall(doc)
+    first = doc.index(records[0])
+    last = doc.index(records[-1]) + len(records[-1])
+    generated = []
+    for i in range(count):
+        generated.append(records[i % len(records)].replace(
+            '/mnt/xvd', '/mnt/brick%d/xvd' % i))
+    return doc[:first] + ''.join(generated) + doc[last:]
+
+
+def _measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def _tree_volume_status(data):
+    """Builds the whole tree first, as glustercli does.
+
+    glustercli's own volume status parser needs status detail output, so
+    this is the equivalent tree walk over plain volume status.
+    """
+    tree = etree.fromstring(data)
+    return [{c.tag: c.text for c in node}
+            for node in tree.findall('volStatus/volumes/volume/node')]
+
+
+def _streaming(path, parser):
+    def run():
+        with open(path, 'rb') as f:
+            return parser(f)
+    return run
+
+
+def _buffered(path, parser):
+    def run():
+        with open(path, 'rb') as f:
+            return parser(f.read())
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bricks', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    cases = [
+        ('volume info', 'vol_info.xml', 'brick',
+         parsers.parse_volume_info, gluster_parsers.parse_volume_info),
+        ('volume status', 'vol_status.xml', 'node',
+         parsers.parse_volume_status, _tree_volume_status),
+    ]
+    print('%-14s %6s %10s %12s %12s %12s %12s' % (
+        'output', 'bricks', 'size (KiB)', 'stream (ms)', 'stream (KiB)',
+        'tree (ms)', 'tree (KiB)'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, fixture, record, streaming, buffered in cases:
+            for count in args.bricks:
+                path = os.path.join(tmp, '%s-%d.xml' % (record, count))
+                with open(path, 'w') as f:
+                    f.write(_scale(fixture, record, count))
+                s_time, s_peak = _measure(_streaming(path, streaming),
+                                          args.repeat)
+                b_time, b_peak = _measure(_buffered(path, buffered),
+                                          args.repeat)
+                print('%-14s %6d %10.1f %12.2f %12.1f %12.2f %12.1f' % (
+                    label, count, os.path.getsize(path) / 1024.0,
+                    s_time * 1000, s_peak / 1024.0,
+                    b_time * 1000, b_peak / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
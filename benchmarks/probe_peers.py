@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Wall-clock time of peer probing against the number of peers.
+
+A fake gluster CLI which sleeps for --latency seconds per probe is put in
+place of the real one, so this can be run anywhere:
+
+    python3 benchmarks/probe_peers.py --latency 0.5 --peers 1 10 30 50
+"""
+
+import argparse
+import os
+import stat
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src',
+                                'lib'))
+
+import gluster.cli.utils as gluster_utils  # noqa
+
+from charm.openstack import peering  # noqa
+
+FAKE_GLUSTER = """#!/bin/sh
+sleep {latency}
+echo "peer probe: success."
+"""
+
+
+def make_fake_gluster(directory, latency):
+    path = os.path.join(directory, 'gluster')
+    with open(path, 'w') as f:
+        f.write(FAKE_GLUSTER.format(latency=latency))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+def run(peer_count, concurrency):
+    targets = [('gluster/%d' % i, '10.0.0.%d' % i)
+               for i in range(peer_count)]
+    start = time.time()
+    results = peering.probe_all(targets, concurrency=concurrency)
+    elapsed = time.time() - start
+    failed = len([r for r in results if r.error])
+    return elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency', type=float, default=0.5,
+                        help='seconds each fake probe takes')
+    parser.add_argument('--peers', type=int, nargs='+',
+                        default=[1, 5, 10, 30, 50])
+    parser.add_argument('--concurrency', type=int,
+                        default=peering.DEFAULT_PROBE_CONCURRENCY)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        gluster_utils.set_gluster_path(make_fake_gluster(tmp, args.latency))
+        print('%6s %12s %12s %8s' % ('peers', 'serial (s)',
+                                     'parallel (s)', 'speedup'))
+        for count in args.peers:
+            serial, _ = run(count, 1)
+            parallel, failed = run(count, args.concurrency)
+            print('%6d %12.2f %12.2f %7.1fx' % (count, serial, parallel,
+                                                serial / parallel))
+            if failed:
+                print('  %d probes failed' % failed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+
+# Load modules from $CHARM_DIR/lib
+sys.path.append('lib')
+
+from charms.layer import basic
+basic.bootstrap_charm_deps()
+basic.init_config_states()
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.unitdata as unitdata
+
+import charm.openstack.instrumentation as instrumentation
+import charm.openstack.options as options
+import charm.openstack.quota as quota
+
+
+def slowest_handlers(*args):
+    """Reports the slowest reactive handlers over recent hooks."""
+    count = hookenv.action_get('count')
+    hooks = hookenv.action_get('hooks')
+    results = {}
+    for rank, cost in enumerate(
+            instrumentation.slowest_handlers(count=count, hooks=hooks), 1):
+        prefix = 'handlers.%d.' % rank
+        results[prefix + 'name'] = cost.name
+        results[prefix + 'calls'] = cost.calls
+        results[prefix + 'max-wall'] = '%.3f' % cost.max_wall
+        results[prefix + 'mean-wall'] = '%.3f' % cost.mean_wall
+        results[prefix + 'total-cpu'] = '%.3f' % cost.total_cpu
+        results[prefix + 'subprocesses'] = cost.subprocesses
+    if not results:
+        results['message'] = 'No hook timeline has been recorded yet'
+    hookenv.action_set(results)
+
+
+def set_volume_options(*args):
+    """Sets the given options on a volume, skipping those already set."""
+    volume = hookenv.action_get('volume')
+    desired = options.parse_options(hookenv.action_get('options') or '')
+    result = options.apply_options(volume, desired,
+                                   dry_run=hookenv.action_get('dry-run'))
+    hookenv.action_set({
+        'changed': ' '.join('%s=%s' % kv for kv in result.changed.items()),
+        'unchanged': ' '.join(result.unchanged),
+        'unknown': ' '.join(result.unknown),
+        'transactions': result.transactions,
+    })
+    if result.failed:
+        hookenv.action_fail('Unable to set %s' % ', '.join(
+            '%s (%s)' % kv for kv in sorted(result.failed.items())))
+
+
+def apply_quotas(*args):
+    """Brings a volume's directory quotas in line with a YAML spec."""
+    volume = hookenv.action_get('volume')
+    spec = quota.parse_spec(hookenv.action_get('spec') or '')
+    result = quota.reconcile(
+        volume, spec, prune=hookenv.action_get('prune'),
+        force=hookenv.action_get('force'), key=quota.ACTION_KEY)
+    hookenv.action_set({
+        'added': len(result.added),
+        'changed': len(result.changed),
+        'removed': len(result.removed),
+        'unchanged': result.unchanged,
+        'skipped': result.skipped,
+        'elapsed': '%.3f' % result.elapsed,
+    })
+    if result.failed:
+        hookenv.action_fail('Unable to set the quota on %s' % ', '.join(
+            '%s (%s)' % kv for kv in sorted(result.failed.items())))
+
+
+def list_volume_quotas(*args):
+    """Lists a page of a volume's quotas, or writes them to a file."""
+    volume = hookenv.action_get('volume')
+    prefix = hookenv.action_get('path-prefix') or None
+    exceeded_only = hookenv.action_get('exceeded-only')
+    offset = hookenv.action_get('offset') or 0
+    limit = hookenv.action_get('limit')
+    if limit is None:
+        limit = quota.DEFAULT_PAGE_SIZE
+    output = hookenv.action_get('output')
+    if output:
+        count = quota.export_quotas(volume, output, prefix, exceeded_only,
+                                    offset, limit)
+        hookenv.action_set({'count': count, 'output': output})
+        return
+
+    page = quota.list_quotas(volume, prefix, exceeded_only, offset, limit)
+    results = {'count': len(page.quotas)}
+    for index, q in enumerate(page.quotas, offset):
+        for key, value in quota.to_dict(q).items():
+            results['quotas.%d.%s' % (index, key)] = value
+    if page.next_offset is not None:
+        results['next-offset'] = page.next_offset
+    hookenv.action_set(results)
+
+
+# Actions to function mapping, to allow for illegal python action names that
+# can map to a python function.
+ACTIONS = {
+    "apply-quotas": apply_quotas,
+    "list-volume-quotas": list_volume_quotas,
+    "set-volume-options": set_volume_options,
+    "slowest-handlers": slowest_handlers,
+}
+
+
+def main(args):
+    action_name = os.path.basename(args[0])
+    try:
+        action = ACTIONS[action_name]
+    except KeyError:
+        return "Action %s undefined" % action_name
+    else:
+        try:
+            action(args)
+        except Exception as e:
+            hookenv.action_fail(str(e))
+        else:
+            # Actions don't run through the reactive main loop, which is
+            # what otherwise commits the unit's key/value store.
+            hookenv._run_atexit()
+            unitdata.kv().flush()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
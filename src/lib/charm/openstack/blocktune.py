@@ -0,0 +1,280 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Block queue tuning for brick devices.
+
+The I/O scheduler and queue attributes of every brick device, and of the
+devices underneath it (the disks of an md array or the paths of a
+multipath or other device-mapper target), are written straight to sysfs
+and recorded in a udev rule so that they are set again at boot or when
+the device reappears.
+"""
+
+import collections
+import os
+import subprocess
+import tempfile
+
+import yaml
+
+UDEV_RULES = '/etc/udev/rules.d/60-glusterfs-brick-queue.rules'
+
+# Queue attributes which may be set through the brick_queue_settings
+# option, besides the scheduler.
+QUEUE_ATTRIBUTES = ('read_ahead_kb', 'nr_requests', 'rq_affinity')
+
+# Legacy single-queue schedulers and their blk-mq counterparts. Kernels
+# only offer one family, so a scheduler named from the other is swapped
+# for its counterpart.
+EQUIVALENTS = {
+    'deadline': 'mq-deadline',
+    'mq-deadline': 'deadline',
+    'noop': 'none',
+    'none': 'noop',
+    'cfq': 'bfq',
+    'bfq': 'cfq',
+}
+
+# What 'auto' picks, in order of preference, for solid state and for
+# rotational devices.
+AUTO = {
+    False: ('none', 'noop'),
+    True: ('mq-deadline', 'deadline'),
+}
+
+# The settings written to one device: its kernel name, the udev match
+# which finds it again after a reboot, and the sysfs queue attributes
+# (scheduler included) to their values.
+Tuning = collections.namedtuple('Tuning', ['name', 'match', 'attributes'])
+
+
+def _read(path, default=None):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return default
+
+
+def _listdir(path):
+    try:
+        return sorted(os.listdir(path))
+    except OSError:
+        return []
+
+
+def parse_scheduler(text):
+    """Parses a queue/scheduler file, e.g. "noop deadline [cfq]".
+
+    :return: (list of available schedulers, the current one or None)
+    """
+    available = []
+    current = None
+    for word in (text or '').split():
+        if word.startswith('[') and word.endswith(']'):
+            word = word[1:-1]
+            current = word
+        available.append(word)
+    if current is None and len(available) == 1:
+        # Queues with a single choice, e.g. md, may not bracket it.
+        current = available[0]
+    return available, current
+
+
+def choose_scheduler(wanted, available, rotational):
+    """Returns the scheduler to use from those the device offers.
+
+    :param wanted: the disk_elevator option, a scheduler name or 'auto'
+    :param available: the schedulers the device offers
+    :param rotational: whether the device is a spinning disk
+    :return: the scheduler name, or None if none fits
+    """
+    if not available:
+        return None
+    if wanted == 'auto':
+        candidates = AUTO[bool(rotational)]
+    else:
+        candidates = (wanted, EQUIVALENTS.get(wanted))
+    for candidate in candidates:
+        if candidate in available:
+            return candidate
+    return None
+
+
+def parse_settings(text):
+    """Parses the brick_queue_settings option.
+
+    :param text: a YAML mapping of queue attribute to value
+    :return: dict of attribute name to str value
+    :raises ValueError: on an unknown attribute or malformed YAML
+    """
+    try:
+        settings = yaml.safe_load(text or '') or {}
+    except yaml.YAMLError as e:
+        raise ValueError('Invalid brick_queue_settings: %s' % e)
+    if not isinstance(settings, dict):
+        raise ValueError('brick_queue_settings must be a mapping')
+    unknown = sorted(set(settings) - set(QUEUE_ATTRIBUTES))
+    if unknown:
+        raise ValueError('Unknown queue attributes %s, expected %s' %
+                         (', '.join(unknown), ', '.join(QUEUE_ATTRIBUTES)))
+    return {k: str(v) for k, v in settings.items()}
+
+
+def _disk(name, sysfs):
+    """Returns the whole disk a partition belongs to, or name itself."""
+    path = os.path.realpath(os.path.join(sysfs, 'class', 'block', name))
+    if os.path.exists(os.path.join(path, 'partition')):
+        return os.path.basename(os.path.dirname(path))
+    return name
+
+
+def stack(name, sysfs='/sys'):
+    """Returns name and every device underneath it, top down.
+
+    Partitions are replaced by their disk, since that is where the queue
+    is, and slaves are followed through any depth of md and device-mapper.
+
+    :param name: a kernel device name, e.g. dm-3 or sdb1
+    :return: list of kernel names, each listed once
+    """
+    found = []
+    pending = [name]
+    while pending:
+        current = _disk(pending.pop(0), sysfs)
+        if current in found:
+            continue
+        found.append(current)
+        pending.extend(_listdir(os.path.join(sysfs, 'block', current,
+                                             'slaves')))
+    return found
+
+
+def udev_match(name, entry=None, sysfs='/sys'):
+    """Returns a udev match which finds the device again after a reboot.
+
+    Disks are matched on their WWN or serial, device-mapper targets on
+    their DM UUID and anything else on its kernel name.
+
+    :param entry: the devices.BlockDevice for name, if known
+    :return: str, e.g. 'ENV{ID_WWN}=="0x5000c500a1b2c3d4"'
+    """
+    if entry is not None and entry.wwn:
+        return 'ENV{ID_WWN}=="%s"' % entry.wwn
+    if entry is not None and entry.serial:
+        return 'ENV{ID_SERIAL}=="%s"' % entry.serial
+    dm_uuid = _read(os.path.join(sysfs, 'block', name, 'dm', 'uuid'))
+    if dm_uuid:
+        return 'ENV{DM_UUID}=="%s"' % dm_uuid
+    return 'KERNEL=="%s"' % name
+
+
+def plan(names, scheduler, settings, index=None, sysfs='/sys'):
+    """Works out the queue settings of every device under names.
+
+    :param names: kernel names of the brick devices
+    :param scheduler: the disk_elevator option
+    :param settings: dict of queue attribute to value, see parse_settings()
+    :param index: a devices.DeviceIndex to find stable udev matches in
+    :return: list of Tuning, one per device
+    """
+    tunings = []
+    seen = set()
+    for name in names:
+        for device in stack(name, sysfs):
+            if device in seen:
+                continue
+            seen.add(device)
+            queue = os.path.join(sysfs, 'block', device, 'queue')
+            if not os.path.isdir(queue):
+                continue
+            attributes = collections.OrderedDict()
+            available, _ = parse_scheduler(
+                _read(os.path.join(queue, 'scheduler')))
+            chosen = choose_scheduler(
+                scheduler, available,
+                _read(os.path.join(queue, 'rotational')) == '1')
+            if chosen:
+                attributes['scheduler'] = chosen
+            for key in QUEUE_ATTRIBUTES:
+                if key not in settings:
+                    continue
+                if os.path.exists(os.path.join(queue, key)):
+                    attributes[key] = settings[key]
+            if not attributes:
+                continue
+            entry = index.get('/dev/%s' % device) if index else None
+            tunings.append(Tuning(name=device,
+                                  match=udev_match(device, entry, sysfs),
+                                  attributes=attributes))
+    return tunings
+
+
+def apply(tunings, sysfs='/sys'):
+    """Writes the tunings to sysfs, skipping values already set.
+
+    The scheduler is written first, since changing it resets nr_requests.
+
+    :return: (list of (device, attribute, value) written,
+              list of (device, attribute, error) which failed)
+    """
+    written = []
+    failed = []
+    for tuning in tunings:
+        queue = os.path.join(sysfs, 'block', tuning.name, 'queue')
+        for key, value in tuning.attributes.items():
+            path = os.path.join(queue, key)
+            current = _read(path)
+            if key == 'scheduler':
+                current = parse_scheduler(current)[1]
+            if current == value:
+                continue
+            try:
+                with open(path, 'w') as f:
+                    f.write(value)
+            except (IOError, OSError) as e:
+                failed.append((tuning.name, key, str(e)))
+                continue
+            written.append((tuning.name, key, value))
+    return written, failed
+
+
+def render_rules(tunings):
+    """Renders the tunings as udev rules, one line per device."""
+    lines = ['# Brick queue settings, written by the gluster charm.']
+    for tuning in tunings:
+        assignments = ', '.join('ATTR{queue/%s}="%s"' % kv
+                                for kv in tuning.attributes.items())
+        lines.append('ACTION=="add|change", SUBSYSTEM=="block", '
+                     'ENV{DEVTYPE}=="disk", %s, %s' %
+                     (tuning.match, assignments))
+    return '\n'.join(lines) + '\n'
+
+
+def write_rules(content, path=UDEV_RULES):
+    """Installs the udev rules if they changed and reloads udev.
+
+    :return: True if the rules changed
+    """
+    if _read(path) == content.strip():
+        return False
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.rules')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(tmp, 0o644)
+    os.rename(tmp, path)
+    subprocess.call(['udevadm', 'control', '--reload-rules'])
+    return True
@@ -0,0 +1,126 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import concurrent.futures
+import os
+import re
+import threading
+
+# Directory under which each brick device is mounted, e.g. /mnt/sdb
+BRICK_MOUNT_ROOT = '/mnt'
+
+# Number of devices behind one controller/HBA prepared at the same time.
+DEFAULT_PER_CONTROLLER = 4
+
+# Matches a PCI function address such as 0000:03:00.0
+PCI_ADDRESS = re.compile(r'^[0-9a-f]{4}:[0-9a-f]{2}:[0-9a-f]{2}\.[0-7]$')
+
+PrepareResult = collections.namedtuple('PrepareResult', ['prepared',
+                                                         'failed'])
+
+
+def brick_mount_point(device):
+    """Returns the mount point used for the brick on device.
+
+    :param device: the device path, e.g. /dev/sdb
+    :return: str, e.g. /mnt/sdb
+    """
+    return os.path.join(BRICK_MOUNT_ROOT, os.path.basename(device))
+
+
+def controller_of(device, sysfs_root='/sys'):
+    """Returns a key identifying the storage controller behind device.
+
+    Devices attached through the same PCI function (HBA, RAID card or NVMe
+    controller) share a key. Devices with no physical parent, such as
+    device-mapper or md devices, share the 'virtual' key.
+
+    :param device: the device path, e.g. /dev/sdb
+    :param sysfs_root: the mount point of sysfs
+    :return: str
+    """
+    name = os.path.basename(os.path.realpath(device))
+    block = os.path.join(sysfs_root, 'class', 'block', name)
+    link = os.path.join(block, 'device')
+    if not os.path.exists(link):
+        # Partitions carry the device link on their parent.
+        link = os.path.join(block, '..', 'device')
+        if not os.path.exists(link):
+            return 'virtual'
+
+    controller = 'virtual'
+    for part in os.path.realpath(link).split(os.sep):
+        if PCI_ADDRESS.match(part):
+            # The innermost PCI function is the controller itself rather
+            # than a bridge in front of it.
+            controller = part
+    return controller
+
+
+def prepare_all(devices, prepare, per_controller=DEFAULT_PER_CONTROLLER,
+                progress=None, controller=controller_of):
+    """Prepares many brick devices concurrently.
+
+    Every device is handed to prepare in its own worker, but no more than
+    per_controller devices behind the same controller run at once so that
+    a single HBA is not saturated by parallel mkfs runs. A failure on one
+    device is recorded and does not stop the others.
+
+    :param devices: an iterable of device paths
+    :param prepare: callable taking a device path, e.g. zap+format+mount
+    :param per_controller: concurrency cap for each controller
+    :param progress: optional callable(done, total, device, error) invoked
+        after each device finishes, serialized by a lock
+    :param controller: callable mapping a device path to a controller key
+    :return: PrepareResult of the prepared device list and a dict of
+        failed device to exception
+    """
+    devices = list(devices)
+    if not devices:
+        return PrepareResult([], {})
+
+    keys = {device: controller(device) for device in devices}
+    limits = {key: threading.BoundedSemaphore(max(1, per_controller))
+              for key in set(keys.values())}
+
+    lock = threading.Lock()
+    state = {'done': 0}
+    prepared = []
+    failed = {}
+
+    def _run(device, limit):
+        error = None
+        with limit:
+            try:
+                prepare(device)
+            except Exception as e:
+                error = e
+        with lock:
+            state['done'] += 1
+            if error is None:
+                prepared.append(device)
+            else:
+                failed[device] = error
+            if progress:
+                progress(state['done'], len(devices), device, error)
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(devices)) as pool:
+        for device in devices:
+            pool.submit(_run, device, limits[keys[device]])
+
+    # Report devices in the order they were given, not completion order.
+    prepared.sort(key=devices.index)
+    return PrepareResult(prepared, failed)
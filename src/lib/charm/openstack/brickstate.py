@@ -0,0 +1,112 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import hashlib
+import json
+
+import charmhelpers.core.unitdata as unitdata
+
+# The options which change how a brick is laid out on disk.
+LAYOUT_OPTIONS = ('filesystem_type', 'inode_size', 'raid_stripe_unit',
+                  'raid_stripe_width')
+
+BrickState = collections.namedtuple('BrickState', [
+    'identity', 'device', 'fs_uuid', 'mount_point', 'config_hash'])
+
+
+def config_hash(config):
+    """Returns a short hash of the options a brick was prepared under.
+
+    :param config: a mapping of charm options, e.g. hookenv.config()
+    :return: str
+    """
+    layout = {k: config.get(k) for k in LAYOUT_OPTIONS}
+    blob = json.dumps(layout, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(blob).hexdigest()[:12]
+
+
+def identity(entry):
+    """Returns a stable identity for a devices.BlockDevice.
+
+    Kernel names such as sdb can change between boots, so the WWN or
+    serial number is preferred when udev knows it.
+    """
+    return entry.wwn or entry.serial or entry.path
+
+
+class BrickStateStore(object):
+    """Remembers which devices this unit has prepared as bricks.
+
+    The state is kept under a single key in the unit's key/value store
+    (charmhelpers unitdata), which lives in the charm directory and is
+    committed at the end of a successful hook.
+    """
+
+    KEY = 'brick-state'
+
+    def __init__(self, kv=None):
+        self._kv = unitdata.kv() if kv is None else kv
+        self._states = {k: BrickState(*v) for k, v in
+                        (self._kv.get(self.KEY) or {}).items()}
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._states)
+
+    def __iter__(self):
+        """Iterates over the recorded BrickStates, ordered by identity."""
+        return iter(sorted(self._states.values()))
+
+    def get(self, entry):
+        """Returns the BrickState recorded for entry, or None."""
+        return self._states.get(identity(entry))
+
+    def is_prepared(self, entry):
+        """Indicates whether entry still holds the brick prepared on it.
+
+        The fingerprint is the device identity and the UUID of the
+        filesystem created on it, both of which come from the udev index
+        without touching the device.
+
+        :param entry: a devices.BlockDevice
+        :return bool:
+        """
+        state = self.get(entry)
+        return (state is not None and state.fs_uuid is not None and
+                state.fs_uuid == entry.fs_uuid)
+
+    def record(self, entry, mount_point, config_hash):
+        """Records that entry was prepared and mounted at mount_point.
+
+        :param entry: a devices.BlockDevice, after formatting
+        :param mount_point: where the brick is mounted
+        :param config_hash: see config_hash()
+        """
+        state = BrickState(identity(entry), entry.path, entry.fs_uuid,
+                           mount_point, config_hash)
+        if self._states.get(state.identity) != state:
+            self._states[state.identity] = state
+            self._dirty = True
+
+    def forget(self, entry):
+        if self._states.pop(identity(entry), None) is not None:
+            self._dirty = True
+
+    def save(self):
+        """Writes the state back to the key/value store if it changed."""
+        if self._dirty:
+            self._kv.set(self.KEY, {k: list(v) for k, v in
+                                    self._states.items()})
+            self._dirty = False
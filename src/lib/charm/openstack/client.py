@@ -0,0 +1,216 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""What clients of the fuse and nfs relations are told.
+
+Every unit publishes on each client relation the volume, the server to
+mount from, the servers to fall back to and the mount options suiting
+the volume_profile, so that clients mount with tuned settings and fail
+over without being configured by hand.
+"""
+
+import collections
+import hashlib
+import json
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.unitdata as unitdata
+
+FUSE_RELATION = 'fuse'
+NFS_RELATION = 'nfs'
+
+# Relation key each unit publishes its number of FUSE clients under, on
+# the peer relation.
+CLIENTS_KEY = 'fuse-clients'
+
+# The relation key a client unit may publish its availability zone under.
+CLIENT_ZONE_KEY = 'availability-zone'
+
+# unitdata key of the hash of the settings last published on each relation.
+PUBLISHED_KEY = 'client-contract'
+
+# FUSE mount options for each volume_profile. Client caching is kept short
+# or off where the volume is shared by writers on several clients (VM
+# images are opened by one hypervisor at a time, but migrate).
+FUSE_OPTIONS = {
+    'default': collections.OrderedDict(),
+    'small-file': collections.OrderedDict([
+        ('attribute-timeout', '600'),
+        ('entry-timeout', '600'),
+        ('negative-timeout', '600'),
+        ('fopen-keep-cache', None),
+    ]),
+    'large-sequential': collections.OrderedDict([
+        ('attribute-timeout', '30'),
+        ('entry-timeout', '30'),
+        ('reader-thread-count', '4'),
+        ('fopen-keep-cache', None),
+    ]),
+    'vm-image': collections.OrderedDict([
+        ('attribute-timeout', '0'),
+        ('entry-timeout', '0'),
+        ('direct-io-mode', 'enable'),
+    ]),
+    'openstack-cinder': collections.OrderedDict([
+        ('attribute-timeout', '0'),
+        ('entry-timeout', '0'),
+        ('direct-io-mode', 'enable'),
+    ]),
+}
+
+# gluster's NFS server is NFSv3 over TCP and reads and writes at most 1MB
+# at a time. Mounts are hard so that I/O waits out a virtual IP failing
+# over instead of returning errors.
+NFS_BASE_OPTIONS = collections.OrderedDict([
+    ('vers', '3'),
+    ('proto', 'tcp'),
+    ('hard', None),
+    ('timeo', '600'),
+    ('retrans', '2'),
+])
+
+# NFS transfer sizes for each volume_profile, in bytes.
+NFS_SIZES = {
+    'default': 1048576,
+    'small-file': 65536,
+    'large-sequential': 1048576,
+    'vm-image': 1048576,
+    'openstack-cinder': 1048576,
+}
+
+# Servers whose client counts differ by less than this are taken as equally
+# loaded, so that clients coming and going don't reorder the backup list,
+# and so rewrite the relation, on every hook.
+LOAD_BUCKET = 10
+
+Server = collections.namedtuple('Server', ['address', 'zone', 'clients'])
+
+
+def order_servers(servers, zones=()):
+    """Orders the servers a client should fall back to.
+
+    Servers in the clients' zones come first, then those with the fewest
+    FUSE clients, so that after a failure the clients spread over the
+    nearest, least loaded servers.
+
+    :param servers: list of Server
+    :param zones: the availability zones of the clients, if known
+    :return: list of addresses
+    """
+    zones = set(z for z in zones if z)
+    return [s.address for s in sorted(servers, key=lambda s: (
+        bool(zones) and s.zone not in zones, (s.clients or 0) // LOAD_BUCKET,
+        s.address))]
+
+
+def format_options(options):
+    """Formats mount options as mount -o takes them."""
+    return ','.join(k if v is None else '%s=%s' % (k, v)
+                    for k, v in options.items())
+
+
+def fuse_options(profile, backups):
+    """Returns the FUSE mount options for a profile.
+
+    :param backups: the addresses of the servers to fall back to
+    :return: OrderedDict of option to value, None for flags
+    """
+    options = collections.OrderedDict()
+    if backups:
+        options['backup-volfile-servers'] = ':'.join(backups)
+    options.update(FUSE_OPTIONS.get(profile, FUSE_OPTIONS['default']))
+    return options
+
+
+def nfs_options(profile):
+    """Returns the NFS mount options for a profile.
+
+    :return: OrderedDict of option to value, None for flags
+    """
+    size = NFS_SIZES.get(profile, NFS_SIZES['default'])
+    options = collections.OrderedDict(NFS_BASE_OPTIONS)
+    options['rsize'] = str(size)
+    options['wsize'] = str(size)
+    return options
+
+
+def fuse_settings(volname, address, backups, profile):
+    """Returns the settings to publish on the fuse relation.
+
+    :param address: the address of this unit
+    :param backups: ordered addresses of the other servers
+    """
+    return {
+        'volume': volname,
+        'volfile-server': address,
+        'backup-volfile-servers': ':'.join(backups),
+        'mount-type': 'glusterfs',
+        'mount-options': format_options(fuse_options(profile, backups)),
+    }
+
+
+def nfs_settings(volname, address, virtual_ips, profile):
+    """Returns the settings to publish on the nfs relation.
+
+    Clients are pointed at the virtual IPs when there are some, since
+    those fail over, and at this unit otherwise.
+
+    :param virtual_ips: the virtual IP addresses, without prefix length
+    """
+    servers = list(virtual_ips) or [address]
+    size = str(NFS_SIZES.get(profile, NFS_SIZES['default']))
+    return {
+        'volume': volname,
+        'server': servers[0],
+        'addresses': ' '.join(servers),
+        'export': '/%s' % volname,
+        'mount-type': 'nfs',
+        'mount-options': format_options(nfs_options(profile)),
+        'rsize': size,
+        'wsize': size,
+    }
+
+
+def client_zones(relation):
+    """Returns the availability zones the client units published on each
+    relation id of relation.
+
+    :return: dict of relation id to set of zones
+    """
+    zones = {}
+    for rid in hookenv.relation_ids(relation):
+        zones[rid] = set()
+        for unit in hookenv.related_units(rid):
+            data = hookenv.relation_get(rid=rid, unit=unit) or {}
+            if data.get(CLIENT_ZONE_KEY):
+                zones[rid].add(data[CLIENT_ZONE_KEY])
+    return zones
+
+
+def publish(rid, settings, kv=None):
+    """Sets settings on relation id rid, unless they were already set.
+
+    :return: True if the settings were published
+    """
+    if kv is None:
+        kv = unitdata.kv()
+    published = kv.get(PUBLISHED_KEY) or {}
+    digest = hashlib.sha256(json.dumps(
+        settings, sort_keys=True).encode('utf-8')).hexdigest()
+    if published.get(rid) == digest:
+        return False
+    hookenv.relation_set(relation_id=rid, relation_settings=settings)
+    published[rid] = digest
+    kv.set(PUBLISHED_KEY, published)
+    return True
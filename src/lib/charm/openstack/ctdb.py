@@ -0,0 +1,353 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""CTDB configuration and virtual IP placement.
+
+Every unit lists every virtual IP in its public_addresses, so that CTDB
+can fail any address over to any surviving unit. Where each address
+lives is planned by the leader: each unit publishes a weight for how
+much client load it can take (its NIC speed) and the number of NFS and
+CIFS clients on each address it holds, and the leader moves addresses
+from the busiest units to the least busy ones, as few as it takes to
+even the load out.
+"""
+
+import collections
+import ipaddress
+import os
+import subprocess
+import tempfile
+
+import netifaces
+
+import charm.openstack.metrics as metrics
+
+NODES_FILE = '/etc/ctdb/nodes'
+PUBLIC_ADDRESSES_FILE = '/etc/ctdb/public_addresses'
+
+# The ports of the NFS and CIFS services clients reach through the virtual
+# IPs.
+CLIENT_PORTS = (2049, 445, 139)
+
+# Relation keys each unit publishes its observations under.
+WEIGHT_KEY = 'ctdb-weight'
+CLIENTS_KEY = 'ctdb-clients'
+
+# Client counts are published rounded down to a multiple of this, so that
+# clients coming and going don't change the relation, and so wake every
+# peer, on every hook.
+CLIENT_BUCKET = 10
+
+# The weight of a unit whose NIC speed can't be read, in Mb/s.
+DEFAULT_WEIGHT = 1000
+
+# An address is only moved if that lowers the load of the busiest unit by
+# more than this fraction, so that client counts changing from one hook to
+# the next don't keep addresses moving.
+DEFAULT_TOLERANCE = 0.1
+
+# A planned change of an address's node: the address, the node holding it
+# now (None if none) and the node it goes to.
+Move = collections.namedtuple('Move', ['address', 'source', 'target'])
+
+
+def parse_addresses(text):
+    """Parses the virtual_ip_addresses option.
+
+    :return: list of ipaddress interfaces, e.g. 10.0.0.6/24, in order
+    :raises ValueError: on an address which isn't a valid cidr
+    """
+    addresses = []
+    for word in (text or '').split():
+        try:
+            address = ipaddress.ip_interface(word)
+        except ValueError:
+            raise ValueError('Invalid virtual IP address %s' % word)
+        if address not in addresses:
+            addresses.append(address)
+    return addresses
+
+
+def interface_for(address, ifaddresses=None):
+    """Returns the local interface on the network of a virtual IP.
+
+    :param address: an ipaddress interface
+    :param ifaddresses: dict of interface name to list of (address, netmask)
+                        pairs, read with netifaces if not given
+    :return: the interface name, or None
+    """
+    if ifaddresses is None:
+        ifaddresses = {}
+        for iface in netifaces.interfaces():
+            for family in (netifaces.AF_INET, netifaces.AF_INET6):
+                for addr in netifaces.ifaddresses(iface).get(family, []):
+                    # IPv6 netmasks come as "ffff:ffff::/64".
+                    netmask = addr.get('netmask', '').rpartition('/')
+                    ifaddresses.setdefault(iface, []).append((
+                        addr['addr'].split('%')[0],
+                        netmask[2] or netmask[0]))
+    for iface in sorted(ifaddresses):
+        for addr, netmask in ifaddresses[iface]:
+            try:
+                network = ipaddress.ip_interface(
+                    '%s/%s' % (addr, netmask) if netmask else addr).network
+            except ValueError:
+                continue
+            if address.ip in network and address.ip != network.network_address:
+                return iface
+    return None
+
+
+def nic_speed(iface, sysfs='/sys'):
+    """Returns the speed of a network interface in Mb/s, or None."""
+    try:
+        with open(os.path.join(sysfs, 'class', 'net', iface, 'speed')) as f:
+            speed = int(f.read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+    return speed if speed > 0 else None
+
+
+def clients_per_address(addresses, proc='/proc'):
+    """Counts the NFS and CIFS clients connected through each address.
+
+    :param addresses: the virtual IPs, as str
+    :return: dict of address to number of distinct clients
+    """
+    clients = metrics.established_clients(CLIENT_PORTS, proc)
+    return {a: len(clients.get(a, ())) for a in addresses}
+
+
+def published_clients(clients):
+    """Returns the client counts worth telling the peers about.
+
+    :param clients: dict of address to number of clients
+    :return: dict of address to the count rounded down to CLIENT_BUCKET,
+             leaving out addresses rounded down to none
+    """
+    rounded = {a: n - n % CLIENT_BUCKET for a, n in clients.items()}
+    return {a: n for a, n in rounded.items() if n}
+
+
+def update_nodes(nodes, addresses):
+    """Updates the CTDB node list for the units now in the cluster.
+
+    A node's number is its line in the nodes file and must not change
+    while CTDB runs, so departed units are commented out rather than
+    removed, new units take the place of a departed one or are appended,
+    and a unit which returns gets its old line back.
+
+    :param nodes: the current list, departed nodes prefixed by '#'
+    :param addresses: the private addresses of the units in the cluster
+    :return: the new list
+    """
+    nodes = list(nodes)
+    present = set(addresses)
+    for index, node in enumerate(nodes):
+        address = node.lstrip('#')
+        nodes[index] = address if address in present else '#' + address
+    known = {node.lstrip('#') for node in nodes}
+    for address in addresses:
+        if address in known:
+            continue
+        for index, node in enumerate(nodes):
+            if node.startswith('#') and node.lstrip('#') not in present:
+                nodes[index] = address
+                break
+        else:
+            nodes.append(address)
+        known.add(address)
+    return nodes
+
+
+def render_nodes(nodes):
+    return ''.join('%s\n' % node for node in nodes)
+
+
+def render_public_addresses(addresses, interfaces):
+    """Renders public_addresses, every virtual IP on its interface.
+
+    :param addresses: list of ipaddress interfaces
+    :param interfaces: dict of address to interface name
+    """
+    lines = []
+    for address in addresses:
+        iface = interfaces.get(address)
+        lines.append('%s %s\n' % (address, iface) if iface else
+                     '%s\n' % address)
+    return ''.join(lines)
+
+
+def write_file(path, content):
+    """Replaces path with content atomically, if it differs.
+
+    :return: True if the file changed
+    """
+    try:
+        with open(path, 'r') as f:
+            if f.read() == content:
+                return False
+    except (IOError, OSError):
+        pass
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.ctdb')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return True
+
+
+def parse_ip_output(text):
+    """Parses the output of ctdb -X ip.
+
+    :return: dict of address to the node number holding it, or None if no
+             node holds it
+    """
+    holders = {}
+    for line in (text or '').splitlines():
+        fields = line.strip().strip('|').split('|')
+        if len(fields) < 2:
+            continue
+        try:
+            pnn = int(fields[1])
+            address = str(ipaddress.ip_address(fields[0]))
+        except ValueError:
+            # The header line, or anything else ctdb adds.
+            continue
+        holders[address] = pnn if pnn >= 0 else None
+    return holders
+
+
+def parse_status(text):
+    """Parses the output of ctdb -X status.
+
+    :return: dict of node number to whether it is healthy, i.e. connected,
+             not banned, disabled, unhealthy, stopped or inactive
+    """
+    healthy = {}
+    for line in (text or '').splitlines():
+        fields = line.strip().strip('|').split('|')
+        if len(fields) < 8:
+            continue
+        try:
+            pnn = int(fields[0])
+            flags = [int(f) for f in fields[2:8]]
+        except ValueError:
+            continue
+        healthy[pnn] = not any(flags)
+    return healthy
+
+
+def plan(addresses, weights, current=None, costs=None,
+         tolerance=DEFAULT_TOLERANCE):
+    """Places the virtual IPs on the nodes.
+
+    Each node's load is the cost of the addresses it holds over its
+    weight. Addresses already on a live node stay there; those without
+    one go to the least loaded node, most costly first. Then addresses
+    are moved one at a time from the most to the least loaded node for as
+    long as that lowers the highest load by more than tolerance.
+
+    :param addresses: the virtual IPs
+    :param weights: dict of node to weight; nodes weighing 0 or less hold
+                    no addresses
+    :param current: dict of address to the node holding it now
+    :param costs: dict of address to its cost, e.g. 1 + its clients; 1 if
+                  not given
+    :return: dict of address to node
+    """
+    weights = {n: float(w) for n, w in weights.items() if w and w > 0}
+    if not weights:
+        return {}
+    costs = costs or {}
+    cost = {a: float(costs.get(a, 1)) for a in addresses}
+    placed = {a: n for a, n in (current or {}).items()
+              if a in cost and n in weights}
+    load = dict.fromkeys(weights, 0.0)
+    for address, node in placed.items():
+        load[node] += cost[address]
+
+    def ratio(node, extra=0.0):
+        return (load[node] + extra) / weights[node]
+
+    for address in sorted((a for a in addresses if a not in placed),
+                          key=lambda a: (-cost[a], str(a))):
+        # Ties go to the node holding the least, then the lowest numbered.
+        node = min(weights, key=lambda n: (ratio(n, cost[address]),
+                                           load[n], n))
+        placed[address] = node
+        load[node] += cost[address]
+
+    for _ in range(len(addresses) * len(weights)):
+        source = max(weights, key=lambda n: (ratio(n), n))
+        best = None
+        for address in sorted(a for a, n in placed.items() if n == source):
+            for target in weights:
+                if target == source:
+                    continue
+                peak = max(ratio(source, -cost[address]),
+                           ratio(target, cost[address]))
+                if best is None or peak < best[0]:
+                    best = (peak, address, target)
+        if best is None or best[0] >= ratio(source) * (1 - tolerance):
+            break
+        _, address, target = best
+        placed[address] = target
+        load[source] -= cost[address]
+        load[target] += cost[address]
+    return placed
+
+
+def moves(current, planned):
+    """Lists the moves which take the addresses from current to planned.
+
+    :return: list of Move, sorted by address
+    """
+    return [Move(address, current.get(address), node)
+            for address, node in sorted(planned.items())
+            if current.get(address) != node]
+
+
+def ctdb_status():
+    """Returns whether each node is healthy, from ctdb -X status."""
+    return parse_status(subprocess.check_output(
+        ['ctdb', '-X', 'status']).decode('utf-8', 'replace'))
+
+
+def ctdb_ip():
+    """Returns the node holding each virtual IP, from ctdb -X ip."""
+    return parse_ip_output(subprocess.check_output(
+        ['ctdb', '-X', 'ip']).decode('utf-8', 'replace'))
+
+
+def move_ip(address, pnn):
+    subprocess.check_call(['ctdb', 'moveip', str(address), str(pnn)])
+
+
+def reload_nodes():
+    subprocess.check_call(['ctdb', 'reloadnodes'])
+
+
+def reload_ips():
+    subprocess.check_call(['ctdb', 'reloadips'])
@@ -0,0 +1,183 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import os
+import subprocess
+import threading
+
+import pyudev
+
+BlockDevice = collections.namedtuple('BlockDevice', [
+    'name', 'path', 'devtype', 'size', 'rotational', 'holders',
+    'partitions', 'fs_type', 'fs_uuid', 'serial', 'wwn', 'links'])
+
+# The index shared by every caller for the lifetime of the hook, and the
+# lock serializing access to it from the brick preparation workers.
+_index = None
+_lock = threading.Lock()
+
+
+def _read(path, default=None):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return default
+
+
+def _listdir(path):
+    try:
+        return sorted(os.listdir(path))
+    except OSError:
+        return []
+
+
+def _properties(device):
+    # pyudev >= 0.21 exposes udev properties through Device.properties,
+    # older releases through the Device mapping itself.
+    return getattr(device, 'properties', device)
+
+
+class DeviceIndex(object):
+    """An in-memory index of the block devices on this unit.
+
+    The index is built from a single udev enumeration of the block
+    subsystem, so it costs no blkid or lsblk forks no matter how many
+    devices the host has. Devices can be looked up by their device node
+    or by any of their /dev/disk/by-* links.
+    """
+
+    def __init__(self, context=None, sysfs_root='/sys'):
+        self._by_name = collections.OrderedDict()
+        self._by_path = {}
+        self._build(context or pyudev.Context(), sysfs_root)
+
+    def _build(self, context, sysfs_root):
+        parents = {}
+        for device in context.list_devices(subsystem='block'):
+            if not device.device_node:
+                continue
+            props = _properties(device)
+            sys_path = device.sys_path
+            name = os.path.basename(sys_path)
+            devtype = device.device_type
+            if devtype == 'partition':
+                parents[name] = os.path.basename(os.path.dirname(sys_path))
+                queue = os.path.join(os.path.dirname(sys_path), 'queue')
+            else:
+                queue = os.path.join(sys_path, 'queue')
+
+            self._by_name[name] = BlockDevice(
+                name=name,
+                path=device.device_node,
+                devtype=devtype,
+                size=int(_read(os.path.join(sys_path, 'size'), 0)) * 512,
+                rotational=_read(os.path.join(queue, 'rotational')) == '1',
+                holders=tuple(_listdir(os.path.join(sys_path, 'holders'))),
+                partitions=(),
+                fs_type=props.get('ID_FS_TYPE') or None,
+                fs_uuid=props.get('ID_FS_UUID') or None,
+                serial=(props.get('ID_SERIAL') or
+                        props.get('ID_SERIAL_SHORT') or None),
+                wwn=props.get('ID_WWN') or None,
+                links=tuple(sorted(device.device_links)))
+
+        children = collections.defaultdict(list)
+        for child, parent in parents.items():
+            children[parent].append(child)
+        for parent, names in children.items():
+            if parent in self._by_name:
+                self._by_name[parent] = self._by_name[parent]._replace(
+                    partitions=tuple(sorted(names)))
+
+        for entry in self._by_name.values():
+            self._by_path[entry.path] = entry
+            for link in entry.links:
+                self._by_path[link] = entry
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def get(self, path):
+        """Looks up a device by device node, by-* link or symlink.
+
+        :param path: e.g. /dev/sdb or /dev/disk/by-id/wwn-0x5000c500a1b2c3d4
+        :return: BlockDevice or None if there is no such block device
+        """
+        entry = self._by_path.get(path)
+        if entry is None and os.path.islink(path):
+            entry = self._by_path.get(os.path.realpath(path))
+        return entry
+
+    def is_available(self, entry):
+        """Indicates whether a device can be used as a new brick.
+
+        A device is not available when it is partitioned or held by
+        another block device such as an md array or a device-mapper target.
+
+        :param entry: the BlockDevice
+        :return bool:
+        """
+        return not entry.partitions and not entry.holders
+
+
+def get_index():
+    """Returns the device index shared for the lifetime of the hook.
+
+    :return: DeviceIndex
+    """
+    global _index
+    with _lock:
+        if _index is None:
+            _index = DeviceIndex()
+        return _index
+
+
+def invalidate():
+    """Drops the shared index, e.g. after creating filesystems."""
+    global _index
+    with _lock:
+        _index = None
+
+
+def probe(path):
+    """Reads the signatures on a device with a low-level blkid probe.
+
+    Unlike the udev index, which udev updates some time after a device
+    changes, this reads the device itself, so it sees a filesystem made a
+    moment ago.
+
+    :param path: the device path, e.g. /dev/sdb
+    :return: dict of blkid tag to value, e.g. TYPE, UUID or PTTYPE, empty
+             if the device carries no signature
+    :raises CalledProcessError: if blkid fails to read the device
+    """
+    try:
+        output = subprocess.check_output(
+            ['blkid', '-p', '-o', 'export', path], stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as e:
+        # blkid exits 2 when it finds nothing to report.
+        if e.returncode == 2:
+            return {}
+        raise
+    tags = {}
+    for line in output.decode('utf-8', 'replace').splitlines():
+        key, sep, value = line.partition('=')
+        if sep:
+            tags[key.strip()] = value.strip()
+    return tags
@@ -0,0 +1,175 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+
+import charmhelpers.core.hookenv as hookenv
+
+from charm.openstack.layout import Disk
+
+PEER_RELATION = 'server'
+
+# Relation keys each unit publishes to its peers.
+BRICKS_KEY = 'bricks'
+ZONE_KEY = 'zone'
+
+# The directory under each brick mount point used as the brick. gluster
+# refuses to use a mount point itself without force.
+BRICK_DIR = 'brick'
+
+# The most replica sets added by a single add-brick command. Each command
+# is one glusterd transaction across the pool.
+DEFAULT_BATCH_SETS = 16
+
+REBALANCE_THROTTLES = ('lazy', 'normal', 'aggressive')
+
+
+def zone():
+    """Returns the availability zone of this unit, or None."""
+    return os.environ.get('JUJU_AVAILABILITY_ZONE') or None
+
+
+def brick_path(mount_point):
+    return os.path.join(mount_point, BRICK_DIR)
+
+
+def local_bricks(mount_points):
+    """Returns [path, size] for each brick mounted at mount_points.
+
+    The brick directory is created if needed, and the size comes from
+    statvfs on the mount point.
+    """
+    bricks = []
+    for mount_point in mount_points:
+        try:
+            st = os.statvfs(mount_point)
+        except OSError as e:
+            hookenv.log('Unable to stat brick %s: %s' % (mount_point, e),
+                        hookenv.WARNING)
+            continue
+        path = brick_path(mount_point)
+        if not os.path.isdir(path):
+            os.mkdir(path, 0o755)
+        bricks.append([path, st.f_blocks * st.f_frsize])
+    return sorted(bricks)
+
+
+def publish_bricks(bricks):
+    """Tells every peer which bricks this unit can offer.
+
+    :param bricks: list of [path, size], see local_bricks()
+    """
+    settings = {BRICKS_KEY: json.dumps(bricks, separators=(',', ':')),
+                ZONE_KEY: zone() or ''}
+    for rid in hookenv.relation_ids(PEER_RELATION):
+        hookenv.relation_set(relation_id=rid, relation_settings=settings)
+
+
+def _disks(host, bricks, zone):
+    return [Disk(host=host, path=path, size=size, zone=zone)
+            for path, size in bricks]
+
+
+def cluster_disks(local_address, bricks, members=None):
+    """Returns the bricks offered by this unit and all of its peers.
+
+    :param local_address: the address peers probed this unit at
+    :param bricks: this unit's bricks, see local_bricks()
+    :param members: the addresses of the peers in the trusted pool. If
+                    given, the bricks of other peers are left out, since
+                    gluster refuses bricks on hosts outside the pool.
+    :return: list of layout.Disk
+    """
+    disks = _disks(local_address, bricks, zone())
+    for rid in hookenv.relation_ids(PEER_RELATION):
+        for unit in hookenv.related_units(rid):
+            data = hookenv.relation_get(rid=rid, unit=unit) or {}
+            address = data.get('private-address')
+            if not address or not data.get(BRICKS_KEY):
+                continue
+            if members is not None and address not in members:
+                hookenv.log('Not using the bricks of %s until it joins the '
+                            'pool' % unit, hookenv.DEBUG)
+                continue
+            try:
+                offered = json.loads(data[BRICKS_KEY])
+            except ValueError:
+                hookenv.log('Ignoring malformed bricks from %s' % unit,
+                            hookenv.WARNING)
+                continue
+            disks.extend(_disks(address, offered,
+                                data.get(ZONE_KEY) or None))
+    return disks
+
+
+def fingerprint(disks):
+    """Returns a short hash of the bricks offered across the cluster.
+
+    When it hasn't changed since the last expansion there is nothing new
+    to add, and neither gluster nor the planner need to be asked.
+    """
+    blob = json.dumps(sorted(disks)).encode('utf-8')
+    return hashlib.sha1(blob).hexdigest()[:12]
+
+
+def batches(plan, max_sets=DEFAULT_BATCH_SETS):
+    """Splits a layout.Plan into add-brick commands of whole sets.
+
+    :return: list of lists of host:path brick names
+    """
+    names = [['%s:%s' % (d.host, d.path) for d in s] for s in plan.sets]
+    return [sum(names[i:i + max_sets], [])
+            for i in range(0, len(names), max(1, max_sets))]
+
+
+def add_brick_options(options):
+    """Returns the layout.Plan options which add-brick accepts.
+
+    Disperse volumes are grown by whole disperse sets without naming the
+    counts again.
+    """
+    return {k: v for k, v in options.items()
+            if k in ('replica', 'stripe', 'arbiter')}
+
+
+def _duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '%dh%02dm' % (seconds // 3600, seconds % 3600 // 60)
+    if seconds >= 60:
+        return '%dm' % (seconds // 60)
+    return '%ds' % seconds
+
+
+def _gib(size):
+    return '%.1f GiB' % ((size or 0) / float(1024 ** 3))
+
+
+def progress_message(volname, status):
+    """Describes rebalance progress for the workload status.
+
+    :param status: the aggregate model.RebalanceStatus
+    :return: str
+    """
+    message = 'Rebalancing %s: %d files, %s moved' % (
+        volname, status.files or 0, _gib(status.size))
+    if status.failures:
+        message += ', %d failures' % status.failures
+    if status.time_left:
+        message += ', ETA %s' % _duration(status.time_left)
+    elif status.runtime:
+        message += ', running %s' % _duration(status.runtime)
+    return message
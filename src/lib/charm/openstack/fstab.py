@@ -0,0 +1,248 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import contextlib
+import os
+import re
+import tempfile
+
+FSTAB = '/etc/fstab'
+
+FsEntry = collections.namedtuple('FsEntry', [
+    'fs_spec', 'mountpoint', 'vfs_type', 'mount_options', 'dump',
+    'fsck_order'])
+
+# An octal escape as getmntent() reads them; anything else is literal.
+_OCTAL = re.compile(r'\\([0-7]{3})')
+
+
+def _unescape(field):
+    """Decodes the octal escapes (e.g. \\040 for space) used in fstab."""
+    if '\\' not in field:
+        return field
+    return _OCTAL.sub(lambda m: chr(int(m.group(1), 8)), field)
+
+
+def _escape(field):
+    return (field.replace('\\', '\\134').replace(' ', '\\040')
+            .replace('\t', '\\011'))
+
+
+def parse_line(line):
+    """Parses one line of fstab.
+
+    :return: FsEntry, or None for comments, blank and malformed lines
+    """
+    fields = line.split()
+    if len(fields) < 3 or fields[0].startswith('#'):
+        return None
+    try:
+        dump = len(fields) > 4 and int(fields[4]) != 0
+        fsck_order = int(fields[5]) if len(fields) > 5 else 0
+    except ValueError:
+        return None
+    options = fields[3].split(',') if len(fields) > 3 else ['defaults']
+    return FsEntry(fs_spec=_unescape(fields[0]),
+                   mountpoint=_unescape(fields[1]),
+                   vfs_type=fields[2],
+                   mount_options=options,
+                   dump=dump,
+                   fsck_order=fsck_order)
+
+
+def format_entry(entry):
+    return '%s %s %s %s %d %d\n' % (
+        _escape(entry.fs_spec), _escape(entry.mountpoint), entry.vfs_type,
+        ','.join(entry.mount_options or ['defaults']),
+        1 if entry.dump else 0, entry.fsck_order)
+
+
+def spec_uuid(fs_spec):
+    """Returns the filesystem UUID named by fs_spec, or None."""
+    if fs_spec.startswith('UUID='):
+        return fs_spec[len('UUID='):].strip('"').lower()
+    if fs_spec.startswith('/dev/disk/by-uuid/'):
+        return os.path.basename(fs_spec).lower()
+    return None
+
+
+def brick_entry(fs_uuid, mountpoint, fstype, options):
+    """Returns the fstab entry for a brick filesystem.
+
+    Bricks are named by filesystem UUID, which unlike /dev/sdX survives
+    devices being added, removed or probed in a different order.
+
+    :param options: dict of mount options, a value of None marks a flag
+    """
+    return FsEntry(fs_spec='UUID=%s' % fs_uuid,
+                   mountpoint=mountpoint,
+                   vfs_type=fstype,
+                   mount_options=[k if v is None else '%s=%s' % (k, v)
+                                  for k, v in sorted(options.items())],
+                   dump=False,
+                   fsck_order=2)
+
+
+class FsTab(object):
+    """fstab, parsed once and indexed by spec, UUID and mount point.
+
+    Comments, blank lines, lines the parser doesn't understand and the
+    layout of untouched entries are kept as they are. Changes are written
+    when they are made, or, inside transaction(), once when the transaction
+    ends. Either way the file is replaced atomically and only if its
+    content changed.
+    """
+
+    def __init__(self, path=FSTAB):
+        self.path = path
+        self.writes = 0
+        self._depth = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                # Each line is (FsEntry or None, its original text).
+                self._lines = [(parse_line(line), line if line.endswith(
+                    '\n') else line + '\n') for line in f]
+        except (IOError, OSError):
+            self._lines = []
+        self._saved = self.render()
+        self._index()
+
+    def _index(self):
+        self._by_spec = {}
+        self._by_uuid = {}
+        self._by_mountpoint = {}
+        for entry in self.entries():
+            self._by_spec[entry.fs_spec] = entry
+            fs_uuid = spec_uuid(entry.fs_spec)
+            if fs_uuid:
+                self._by_uuid[fs_uuid] = entry
+            if entry.mountpoint not in ('none', 'swap'):
+                mountpoint = entry.mountpoint.rstrip('/') or '/'
+                self._by_mountpoint[mountpoint] = entry
+
+    def entries(self):
+        """Returns the FsEntry of every mount, in file order."""
+        return [entry for entry, _ in self._lines if entry is not None]
+
+    def render(self):
+        return ''.join(text or format_entry(entry)
+                       for entry, text in self._lines)
+
+    def get_by_spec(self, fs_spec):
+        return self._by_spec.get(fs_spec)
+
+    def get_by_uuid(self, fs_uuid):
+        return self._by_uuid.get(fs_uuid.lower())
+
+    def get_by_mountpoint(self, mountpoint):
+        return self._by_mountpoint.get(mountpoint.rstrip('/') or '/')
+
+    def add_entry(self, entry):
+        """Adds entry, replacing any entry for the same spec or mount point.
+
+        :return: True if fstab changed
+        """
+        old = [e for e in (self.get_by_spec(entry.fs_spec),
+                           self.get_by_mountpoint(entry.mountpoint)) if e]
+        if old and all(e == entry for e in old):
+            return False
+        # The new entry takes the place of the first one it replaces.
+        lines = []
+        for line in self._lines:
+            if line[0] is not None and line[0] in old:
+                if entry is not None:
+                    lines.append((entry, None))
+                    entry = None
+            else:
+                lines.append(line)
+        if entry is not None:
+            lines.append((entry, None))
+        self._lines = lines
+        self._changed()
+        return True
+
+    def remove_entry(self, mountpoint):
+        """Removes the entry mounted at mountpoint.
+
+        :return: True if fstab changed
+        """
+        entry = self.get_by_mountpoint(mountpoint)
+        if entry is None:
+            return False
+        self._lines = [line for line in self._lines if line[0] != entry]
+        self._changed()
+        return True
+
+    def _changed(self):
+        self._index()
+        if not self._depth:
+            self.save()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Batches the changes made in the block into a single write.
+
+        If the block raises, its changes are discarded.
+        """
+        self._depth += 1
+        lines = list(self._lines)
+        try:
+            yield self
+        except Exception:
+            self._lines = lines
+            self._index()
+            raise
+        finally:
+            self._depth -= 1
+        if not self._depth:
+            self.save()
+
+    def save(self):
+        """Writes fstab if it changed, via a temporary file, fsync and
+        rename, so that a crash leaves either the old or the new file.
+
+        :return: True if the file was written
+        """
+        content = self.render()
+        if content == self._saved:
+            return False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            mode = os.stat(self.path).st_mode & 0o7777
+        except OSError:
+            mode = 0o644
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.fstab')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, mode)
+            os.rename(tmp, self.path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self._saved = content
+        self.writes += 1
+        return True
@@ -0,0 +1,295 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import charmhelpers.core.hookenv as hookenv
+import gluster.cli.bitrot as gluster_bitrot
+import gluster.cli.bricks as gluster_bricks
+import gluster.cli.peer as gluster_peer
+import gluster.cli.quota as gluster_quota
+import gluster.cli.rebalance as gluster_rebalance
+import gluster.cli.volume as gluster_volume
+
+import charm.openstack.parsers as parsers
+
+# Cache tags. Entries for a single volume are tagged '<kind>:<volume>' and
+# those covering every volume '<kind>:*'.
+PEERS = 'peers'
+VOLUMES = 'volumes'
+INFO = 'info'
+STATUS = 'status'
+QUOTA = 'quota'
+BITROT = 'bitrot'
+ALL = '*'
+
+
+def _tag(kind, volname=None):
+    return '%s:%s' % (kind, volname or ALL)
+
+
+def _matches(tag, dropped):
+    """Indicates whether invalidating dropped invalidates tag.
+
+    A change to one volume also invalidates the entries covering every
+    volume, and a change to every volume invalidates all of its kind.
+    """
+    if tag == dropped:
+        return True
+    kind, _, name = tag.partition(':')
+    dropped_kind, _, dropped_name = dropped.partition(':')
+    return kind == dropped_kind and ALL in (name, dropped_name)
+
+
+class GlusterGateway(object):
+    """Runs gluster commands, remembering the result of read-only queries.
+
+    A hook tends to ask glusterd the same questions several times, each
+    one costing a fork and a round trip to glusterd. Queries are answered
+    from memory after the first time until a mutation made through the
+    gateway (or a call to invalidate()) drops the entries it may affect.
+
+    The gateway only lives as long as the hook; see get_gateway().
+    """
+
+    def __init__(self, execute=parsers.execute, stream=parsers.stream):
+        self._execute = execute
+        self._stream = stream
+        self._lock = threading.Lock()
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _query(self, args, parser, tag):
+        key = tuple(args)
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return list(self._cache[key][1])
+            self.misses += 1
+        result = self._execute(args, parser)
+        with self._lock:
+            self._cache[key] = (tag, result)
+        return list(result)
+
+    def invalidate(self, *tags):
+        """Drops cached results which may be affected by tags.
+
+        :param tags: e.g. PEERS, or 'info:<volume>'; none drops everything
+        """
+        with self._lock:
+            if not tags:
+                dropped = list(self._cache)
+            else:
+                dropped = [k for k, (tag, _) in self._cache.items()
+                           if any(_matches(tag, t) for t in tags)]
+            for key in dropped:
+                del self._cache[key]
+            self.invalidations += len(dropped)
+
+    def _mutate(self, tags, func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # A failed command may still have changed something.
+            self.invalidate(*tags)
+
+    def stats(self):
+        """Returns the hit, miss and invalidation counters as a dict."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'invalidations': self.invalidations,
+                    'cached': len(self._cache)}
+
+    # Queries
+
+    def peer_status(self):
+        """:return: list of model.Peer, excluding this node"""
+        return self._query(['peer', 'status'], parsers.parse_peer_status,
+                           PEERS)
+
+    def pool_list(self):
+        """:return: list of model.Peer, including this node"""
+        return self._query(['pool', 'list'], parsers.parse_peer_list, PEERS)
+
+    def volume_list(self):
+        """:return: list of volume names"""
+        return self._query(['volume', 'list'], parsers.parse_volume_list,
+                           VOLUMES)
+
+    def volume_info(self, volname=None):
+        """:return: list of model.Volume"""
+        args = ['volume', 'info'] + ([volname] if volname else [])
+        return self._query(args, parsers.parse_volume_info,
+                           _tag(INFO, volname))
+
+    def volume_get(self, volname):
+        """:return: list of (option, value) for every option of volname,
+                    including those left at their defaults
+        """
+        return self._query(['volume', 'get', volname, 'all'],
+                           parsers.parse_volume_options, _tag(INFO, volname))
+
+    def volume_status(self, volname=None):
+        """:return: list of model.BrickStatus"""
+        args = ['volume', 'status', volname or 'all']
+        return self._query(args, parsers.parse_volume_status,
+                           _tag(STATUS, volname))
+
+    def rebalance_status(self, volname):
+        """:return: list of model.RebalanceStatus, the aggregate last"""
+        return self._query(['volume', 'rebalance', volname, 'status'],
+                           parsers.parse_rebalance_status,
+                           _tag(STATUS, volname))
+
+    def quota_list(self, volname):
+        """:return: list of model.Quota"""
+        return self._query(['volume', 'quota', volname, 'list'],
+                           parsers.parse_quota_list, _tag(QUOTA, volname))
+
+    def iter_quota_list(self, volname):
+        """Yields each model.Quota of volname as gluster lists it.
+
+        A volume may have tens of thousands of limits, so unless
+        quota_list() has already cached them they are streamed straight
+        from gluster and not cached.
+        """
+        key = ('volume', 'quota', volname, 'list')
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if cached is not None:
+            return iter(cached[1])
+        return self._stream(list(key), parsers.iter_quotas)
+
+    def scrub_status(self, volname):
+        """:return: list holding one model.ScrubStatus"""
+        return self._query(['volume', 'bitrot', volname, 'scrub', 'status'],
+                           parsers.parse_scrub_status, _tag(BITROT, volname))
+
+    # Mutations
+
+    def peer_probe(self, host):
+        return self._mutate([PEERS], gluster_peer.probe, host)
+
+    def peer_detach(self, host):
+        return self._mutate([PEERS, _tag(INFO), _tag(STATUS)],
+                            gluster_peer.detach, host)
+
+    def volume_create(self, volname, bricks, **kwargs):
+        return self._mutate([VOLUMES, _tag(INFO, volname),
+                             _tag(STATUS, volname)],
+                            gluster_volume.create, volname, bricks, **kwargs)
+
+    def volume_start(self, volname, force=False):
+        return self._mutate([_tag(INFO, volname), _tag(STATUS, volname)],
+                            gluster_volume.start, volname, force)
+
+    def volume_stop(self, volname, force=False):
+        return self._mutate([_tag(INFO, volname), _tag(STATUS, volname)],
+                            gluster_volume.stop, volname, force)
+
+    def volume_delete(self, volname):
+        return self._mutate([VOLUMES, _tag(INFO, volname),
+                             _tag(STATUS, volname), _tag(QUOTA, volname)],
+                            gluster_volume.delete, volname)
+
+    def volume_add_brick(self, volname, bricks, **kwargs):
+        return self._mutate([_tag(INFO, volname), _tag(STATUS, volname)],
+                            gluster_bricks.add, volname, bricks, **kwargs)
+
+    def volume_set(self, volname, options):
+        return self._mutate([_tag(INFO, volname)], gluster_volume.optset,
+                            volname, options)
+
+    def volume_reset(self, volname, option=None, force=False):
+        return self._mutate([_tag(INFO, volname)], gluster_volume.optreset,
+                            volname, option, force)
+
+    def rebalance_start(self, volname, force=False):
+        return self._mutate([_tag(STATUS, volname)],
+                            gluster_rebalance.start, volname, force)
+
+    def bitrot_enable(self, volname):
+        return self._mutate([_tag(INFO, volname), _tag(BITROT, volname)],
+                            gluster_bitrot.enable, volname)
+
+    def bitrot_disable(self, volname):
+        return self._mutate([_tag(INFO, volname), _tag(BITROT, volname)],
+                            gluster_bitrot.disable, volname)
+
+    def scrub_throttle(self, volname, throttle):
+        return self._mutate([_tag(INFO, volname), _tag(BITROT, volname)],
+                            gluster_bitrot.scrub_throttle, volname, throttle)
+
+    def scrub_frequency(self, volname, frequency):
+        return self._mutate([_tag(INFO, volname), _tag(BITROT, volname)],
+                            gluster_bitrot.scrub_frequency, volname,
+                            frequency)
+
+    def scrub_pause(self, volname):
+        return self._mutate([_tag(INFO, volname), _tag(BITROT, volname)],
+                            gluster_bitrot.scrub_pause, volname)
+
+    def scrub_resume(self, volname):
+        return self._mutate([_tag(INFO, volname), _tag(BITROT, volname)],
+                            gluster_bitrot.scrub_resume, volname)
+
+    def quota_enable(self, volname):
+        return self._mutate([_tag(INFO, volname), _tag(QUOTA, volname)],
+                            gluster_quota.enable, volname)
+
+    def quota_disable(self, volname):
+        return self._mutate([_tag(INFO, volname), _tag(QUOTA, volname)],
+                            gluster_quota.disable, volname)
+
+    def quota_limit_usage(self, volname, path, size, percent=None):
+        return self._mutate([_tag(QUOTA, volname)],
+                            gluster_quota.limit_usage, volname, path, size,
+                            percent)
+
+    def quota_remove_path(self, volname, path):
+        return self._mutate([_tag(QUOTA, volname)],
+                            gluster_quota.remove_path, volname, path)
+
+
+_gateway = None
+
+
+def _log_stats():
+    if _gateway is not None:
+        stats = _gateway.stats()
+        hookenv.log('gluster gateway: %(hits)d cached, %(misses)d run, '
+                    '%(invalidations)d invalidated' % stats, hookenv.DEBUG)
+
+
+def get_gateway():
+    """Returns the gateway for the current hook invocation."""
+    global _gateway
+    if _gateway is None:
+        _gateway = GlusterGateway()
+        hookenv.atexit(_log_stats)
+    return _gateway
+
+
+def invalidate():
+    """Drops everything the gateway remembers, e.g. after running gluster
+    directly rather than through the gateway.
+    """
+    if _gateway is not None:
+        _gateway.invalidate()
@@ -16,14 +16,40 @@ import charms_openstack.adapters as os_adapters
 import charms_openstack.charm.classes as os_classes
 import charms.reactive as reactive
 
-import gluster.cli.peer as gluster_peer
+import charm.openstack.blocktune as blocktune
+import charm.openstack.bricks as bricks
+import charm.openstack.brickstate as brickstate
+import charm.openstack.client as client
+import charm.openstack.ctdb as ctdb
+import charm.openstack.devices as devices
+import charm.openstack.expansion as expansion
+import charm.openstack.fstab as fstab
+import charm.openstack.gateway as gateway
+import charm.openstack.heal as heal
+import charm.openstack.layout as layout
+import charm.openstack.metrics as metrics
+import charm.openstack.mkfs as mkfs
+import charm.openstack.model as model
+import charm.openstack.mounts as mounts
+import charm.openstack.options as options
+import charm.openstack.peering as peering
+import charm.openstack.profiles as profiles
+import charm.openstack.quota as quota
+import charm.openstack.resolver as resolver
+import charm.openstack.scrub as scrub
+
 import gluster.cli.utils as gluster_utils
 
+import charmhelpers.contrib.storage.linux.utils as storage_utils
 import charmhelpers.core.hookenv as hookenv
 import charmhelpers.core.host as host
+import charmhelpers.core.unitdata as unitdata
 
+import json
 import os
 import subprocess
+import time
+import yaml
 
 
 def install():
@@ -39,8 +65,53 @@ def probe_peers(peer):
     GlusterFSCharm.singleton.probe_peers(peer)
 
 
-def create_bricks():
-    GlusterFSCharm.singleton.create_bricks()
+def assess_status():
+    """Sets the workload status of the unit."""
+    GlusterFSCharm.singleton.assess_status()
+
+
+def prepare_storage():
+    """Prepare every configured brick device which isn't in use yet.
+
+    @returns: None
+    """
+    charm = GlusterFSCharm.singleton
+    charm.prepare_bricks(charm.brick_devices())
+    charm.tune_brick_queues()
+    if charm.publish_bricks():
+        reactive.set_state('bricks.available')
+
+
+def create_volume():
+    GlusterFSCharm.singleton.create_volume()
+
+
+def expand_volume():
+    GlusterFSCharm.singleton.expand_volume()
+
+
+def apply_sysctl():
+    GlusterFSCharm.singleton.apply_sysctl()
+
+
+def control_scrub():
+    GlusterFSCharm.singleton.control_scrub()
+
+
+def apply_quotas():
+    GlusterFSCharm.singleton.apply_quotas()
+
+
+def configure_ctdb():
+    GlusterFSCharm.singleton.configure_ctdb()
+
+
+def publish_client_contract():
+    GlusterFSCharm.singleton.publish_client_contract()
+
+
+def apply_volume_profile():
+    GlusterFSCharm.singleton.apply_volume_profile()
 
 
 class BaseGlusterCharm(os_classes.BaseOpenStackCharm,
@@ -77,11 +148,7 @@ class StorageMixin(object):
         :param device: the path to check if mounted
         :return bool: True if the path is mounted, False otherwise
         """
-        for mount_point, dev in host.mounts():
-            if dev == path or mount_point == path:
-                return True
-
-        return False
+        return mounts.get_mount_table().is_mounted(path)
 
     def get_mount_point(self, device):
         """
@@ -89,11 +156,7 @@ class StorageMixin(object):
         :param device:
         :return:
         """
-        for mount_point, dev in host.mounts():
-            if dev == device:
-                return mount_point
-
-        return None
+        return mounts.get_mount_table().mount_point(device)
 
     def unmount(self, path):
         """
@@ -105,7 +168,10 @@ class StorageMixin(object):
         if not os.path.exists(path):
             return True
 
-        return host.umount(path)
+        try:
+            return host.umount(path)
+        finally:
+            mounts.invalidate()
 
     def ephemeral_unmount(self, path):
         """
@@ -113,7 +179,7 @@ class StorageMixin(object):
         :param path:
         :return:
         """
-        ephemeral_mountpoint = (hookenv.config('ephemeral-mountpoint') or
+        ephemeral_mountpoint = (hookenv.config('ephemeral_unmount') or
                                 '').strip()
         if not ephemeral_mountpoint:
             return
@@ -122,50 +188,88 @@ class StorageMixin(object):
             self.unmount(ephemeral_mountpoint)
 
     def mount(self, device, mount_point=None, fstype=None, **options):
+        """Mounts device, creating the mount point if necessary.
+
+        :param device: the device to mount
+        :param mountpoint: where to mount it, defaults to the brick mount
+            point for the device
+        :param fstype: the filesystem type of the device
+        :param options: mount options, a value of None marks a flag
+        :return bool: True if the device was mounted, False otherwise
         """
+        mount_point = mount_point or bricks.brick_mount_point(device)
+        host.mkdir(mount_point, perms=0o755)
+        opts = ','.join(k if v is None else '%s=%s' % (k, v)
+                        for k, v in sorted(options.items()))
+        try:
+            return host.mount(device, mount_point, options=opts or None,
+                              filesystem=fstype or 'ext3')
+        finally:
+            mounts.invalidate()
 
-        :param device:
-        :param mountpoint:
-        :param fstype:
-        :param options:
-        :return:
+    def mkfs_plan(self, fstype, geometry=mkfs.DEFAULT_GEOMETRY):
+        """Plans mkfs for fstype with the raid_stripe_unit,
+        raid_stripe_width and inode_size options.
+
+        :param geometry: the device geometry, see mkfs.read_geometry
+        :return: the mkfs command as a list, without the device
+        :raises ValueError: if the options are inconsistent
         """
-        pass
+        return mkfs.plan(fstype, geometry,
+                         stripe_unit_kb=hookenv.config('raid_stripe_unit'),
+                         stripe_width=hookenv.config('raid_stripe_width'),
+                         inode_size=hookenv.config('inode_size'))
 
     def format(self, device, fstype, **options):
-        """
+        """Creates a filesystem on device aligned to its geometry.
 
-        :param device:
-        :param fstype:
-        :param options:
-        :return:
+        The mkfs options are planned by mkfs.plan from the device geometry
+        in sysfs and the raid_stripe_unit, raid_stripe_width and inode_size
+        options.
+
+        :param device: the device to format
+        :param fstype: the filesystem type, one of xfs, ext4 or btrfs
+        :param options: extra mkfs options, passed as -key value
+        :return: None, raises CalledProcessError on failure
         """
-        # TODO(wolsen) make this a bit more generic
-        cmd = ['mkfs.xfs']
-        if options:
-            for key, value in options:
-                cmd.extend(['-%s' % key, value])
+        self._mkfs(device, self.mkfs_plan(fstype,
+                                          mkfs.read_geometry(device)),
+                   **options)
+
+    def _mkfs(self, device, cmd, **options):
+        cmd = list(cmd)
+        for key, value in sorted(options.items()):
+            cmd.extend(['-%s' % key, value])
 
         cmd.append(device)
 
         try:
-            out = subprocess.check_output(cmd)
+            subprocess.check_output(cmd, stderr=subprocess.STDOUT)
         except subprocess.CalledProcessError as e:
             hookenv.log('Error formatting filesystem on disk %s: %s' %
-                        (device, e), hookenv.ERROR)
+                        (device, e.output), hookenv.ERROR)
             raise
 
     def reformat(self, device):
-        """
+        """Wipes device and creates a brick filesystem on it.
 
-        :param device:
-        :return:
+        The mkfs command is planned first, so that options mkfs.plan
+        rejects fail before anything is wiped.
+
+        :param device: the device path, e.g. /dev/sdb
+        :return: None, raises on failure
         """
+        cmd = self.mkfs_plan(self.brick_filesystem(),
+                             mkfs.read_geometry(device))
         if self.is_mounted(device):
             self.unmount(device)
 
         self.zap_disk(device)
-        self.format(device, 'xfs', i="size=512", n="size=8192")
+        self._mkfs(device, cmd)
+
+    def brick_filesystem(self):
+        """Returns the filesystem type configured for bricks."""
+        return (hookenv.config('filesystem_type') or 'xfs').strip()
 
     def zap_disk(self, device):
         """
@@ -173,10 +277,179 @@ class StorageMixin(object):
         :param device:
         :return:
         """
-        pass
+        storage_utils.zap_disk(device)
+
+    def prepare_brick(self, device):
+        """Wipes, formats and mounts device so it can serve as a brick.
+
+        :param device: the device path, e.g. /dev/sdb
+        :return: the blkid tags of the new filesystem, see devices.probe()
+        :raises IOError: if the filesystem has no UUID to mount it by at
+                         boot, or can't be mounted
+        """
+        self.reformat(device)
+        # udev learns the new UUID some time after mkfs, so read it from
+        # the device.
+        tags = devices.probe(device)
+        if not tags.get('UUID'):
+            raise IOError('No filesystem UUID on %s after formatting' %
+                          device)
+        if not self.mount(device, fstype=self.brick_filesystem(),
+                          **self.mount_options()):
+            raise IOError('Unable to mount %s' % device)
+        return tags
+
+    def prepare_bricks(self, paths):
+        """Prepares the given devices as bricks concurrently.
+
+        Devices recorded in the brick state store whose filesystem is still
+        the one the charm created are only (re)mounted, never formatted
+        again. Other devices which are already mounted are left alone, and
+        so are those carrying a filesystem or partition table the charm
+        didn't create, unless force_reformat is set.
+        Every brick is recorded and added to /etc/fstab by the filesystem
+        UUID read back from the device, with one write per batch; a brick
+        whose UUID can't be read counts as failed. Progress is reported
+        through the unit's workload status.
+
+        :param paths: a list of device paths
+        :return: bricks.PrepareResult
+        """
+        index = devices.get_index()
+        store = brickstate.BrickStateStore()
+        layout = brickstate.config_hash(hookenv.config())
+
+        table = fstab.FsTab()
+
+        force = hookenv.config('force_reformat')
+        pending = []
+        remounted = []
+        refused = []
+        entries = {}
+        for path in paths:
+            entry = entries[path] = index.get(path)
+            if entry is None:
+                # Without an entry there is nothing to recognise the brick
+                # by on the next hook.
+                hookenv.log('%s is not a known block device, not using it '
+                            'as a brick' % path, hookenv.WARNING)
+                continue
+            if store.is_prepared(entry):
+                state = store.get(entry)
+                if state.config_hash != layout:
+                    hookenv.log('Brick %s was prepared under different '
+                                'filesystem options; leaving it as is' %
+                                path, hookenv.WARNING)
+                if not self.is_mounted(path):
+                    self.mount(path, state.mount_point, fstype=entry.fs_type,
+                               **self.mount_options(entry.fs_type))
+                remounted.append((entry, state.mount_point))
+                continue
+            if self.is_mounted(path):
+                hookenv.log('%s is already mounted, not using it as a brick' %
+                            path, hookenv.DEBUG)
+                continue
+            if not force:
+                # Bricks this unit made were recognised above, so any
+                # signature left is someone else's data.
+                tags = devices.probe(path)
+                if tags.get('TYPE') or tags.get('PTTYPE'):
+                    hookenv.log('%s holds a %s which this unit did not '
+                                'create, not wiping it' % (
+                                    path, tags.get('TYPE') or
+                                    'partition table'), hookenv.WARNING)
+                    refused.append(path)
+                    continue
+            pending.append(path)
+
+        with table.transaction():
+            for entry, mount_point in remounted:
+                self.persist_mount(table, entry, mount_point)
+
+        refused_status = ('Devices hold existing data, set force_reformat '
+                          'to wipe them: %s' % ', '.join(refused))
+        if not pending:
+            if refused:
+                hookenv.status_set('blocked', refused_status)
+            return bricks.PrepareResult([], {})
+
+        # Settings mkfs.plan rejects would otherwise only show once the
+        # first device had been wiped.
+        try:
+            self.mkfs_plan(self.brick_filesystem())
+        except ValueError as e:
+            hookenv.log('Not preparing bricks: %s' % e, hookenv.ERROR)
+            hookenv.status_set('blocked', str(e))
+            return bricks.PrepareResult([], {})
+
+        self.ephemeral_unmount(None)
+
+        def progress(done, total, device, error):
+            if error:
+                hookenv.log('Error preparing brick %s: %s' % (device, error),
+                            hookenv.ERROR)
+            hookenv.status_set('maintenance',
+                               'Preparing bricks: %d/%d done' % (done, total))
+
+        hookenv.status_set('maintenance',
+                           'Preparing %d bricks' % len(pending))
+        per_controller = (hookenv.config('brick_prepare_per_controller') or
+                          bricks.DEFAULT_PER_CONTROLLER)
+        probed = {}
+
+        def prepare(path):
+            probed[path] = self.prepare_brick(path)
+
+        result = bricks.prepare_all(pending, prepare,
+                                    per_controller=per_controller,
+                                    progress=progress)
+
+        devices.invalidate()
+        with table.transaction():
+            for path in result.prepared:
+                tags = probed[path]
+                entry = entries[path]._replace(fs_type=tags.get('TYPE'),
+                                               fs_uuid=tags['UUID'])
+                mount_point = self.get_mount_point(path)
+                store.record(entry, mount_point, layout)
+                self.persist_mount(table, entry, mount_point)
+        store.save()
+
+        if result.failed:
+            hookenv.status_set('blocked', 'Failed to prepare bricks: %s' %
+                               ', '.join(sorted(result.failed)))
+        elif refused:
+            hookenv.status_set('blocked', refused_status)
+        return result
+
+    def mount_options(self, fstype=None):
+        """Returns the brick mount options for fstype.
+
+        :param fstype: the filesystem type, defaults to filesystem_type
+        :return: dict of mount options, a value of None marks a flag
+        """
+        options = {'noatime': None}
+        if (fstype or self.brick_filesystem()) == 'xfs':
+            options['inode64'] = None
+            # The largest log buffers cut log writes under metadata load.
+            options['logbsize'] = '256k'
+        return options
+
+    def persist_mount(self, table, entry, mount_point):
+        """Adds the fstab entry which mounts a brick at boot.
+
+        :param table: the fstab.FsTab to add to
+        :param entry: the devices.BlockDevice of the brick
+        :param mount_point: where the brick is mounted
+        """
+        if entry is None or not entry.fs_uuid or not mount_point:
+            return
+        table.add_entry(fstab.brick_entry(
+            entry.fs_uuid, mount_point, entry.fs_type,
+            self.mount_options(entry.fs_type)))
 
 
-class GlusterFSCharm(BaseGlusterCharm):
+class GlusterFSCharm(StorageMixin, BaseGlusterCharm):
     """
 
     """
@@ -191,12 +464,77 @@ class GlusterFSCharm(BaseGlusterCharm):
 
         :return:
         """
-        bricks = (hookenv.config('brick_devices') or '').split(' ')
-        bricks = [i for i in filter(lambda y: not y == "",
-                                    map(lambda x: x.strip(), bricks))]
-        unmount = hookenv.config('ephemeral_unmount')
-        reformat = hookenv.config('reformat_bricks')
+        self.prepare_bricks(self.brick_devices())
+        self.tune_brick_queues()
+
+    def _brick_candidates(self):
+        """Returns the brick_devices option and Juju storage locations."""
+        candidates = (hookenv.config('brick_devices') or '').split(' ')
+        candidates = [i for i in filter(lambda y: not y == "",
+                                        map(lambda x: x.strip(),
+                                            candidates))]
+        for storage_id in hookenv.storage_list('brick'):
+            candidates.append(hookenv.storage_get('location', storage_id))
+        return candidates
+
+    def tune_brick_queues(self):
+        """Applies disk_elevator and brick_queue_settings to every brick
+        device and the devices underneath it, and persists them in a udev
+        rule.
+        """
+        try:
+            settings = blocktune.parse_settings(
+                hookenv.config('brick_queue_settings'))
+        except ValueError as e:
+            hookenv.log(str(e), hookenv.ERROR)
+            hookenv.status_set('blocked', 'Invalid brick_queue_settings')
+            return
+        index = devices.get_index()
+        names = []
+        for candidate in self._brick_candidates():
+            entry = index.get(candidate)
+            if entry is not None:
+                names.append(entry.name)
+        tunings = blocktune.plan(names,
+                                 hookenv.config('disk_elevator') or 'auto',
+                                 settings, index=index)
+        written, failed = blocktune.apply(tunings)
+        for name, key, value in written:
+            hookenv.log('Set %s %s to %s' % (name, key, value),
+                        hookenv.DEBUG)
+        for name, key, error in failed:
+            hookenv.log('Unable to set %s %s: %s' % (name, key, error),
+                        hookenv.WARNING)
+        blocktune.write_rules(blocktune.render_rules(tunings))
+
+    def brick_devices(self):
+        """Returns the devices available to become bricks on this unit.
+
+        Candidates are the devices listed in the brick_devices option and
+        those attached through Juju storage as brick. Each one is resolved
+        against the udev device index; devices which don't exist or are
+        partitioned or held by another device are skipped.
+
+        :return: list of device paths
+        """
+        index = devices.get_index()
+        found = []
+        for candidate in self._brick_candidates():
+            entry = index.get(candidate)
+            if entry is None:
+                hookenv.log('Brick device %s not found' % candidate,
+                            hookenv.WARNING)
+                continue
+            if not index.is_available(entry):
+                hookenv.log('Brick device %s is in use by %s' %
+                            (candidate, ', '.join(entry.partitions +
+                                                  entry.holders)),
+                            hookenv.WARNING)
+                continue
+            if entry.path not in found:
+                found.append(entry.path)
 
+        return found
 
     def probe_peers(self, peer):
         """
@@ -208,26 +546,653 @@ class GlusterFSCharm(BaseGlusterCharm):
             return
 
         hookenv.log('Probing peers')
-        probed_units = hookenv.leader_get('probed-units') or []
-        new_units = []
-        for (unit, address) in peer.ip_map():
-            if unit in probed_units:
-                hookenv.debug('unit %s already probed.' % unit)
+        ledger = peering.ProbeLedger.load()
+        peers = list(peer.ip_map())
+        # Unit names are never reused, so a departed unit can go for good.
+        for unit in set(ledger) - set(unit for unit, _ in peers):
+            ledger.forget(unit)
+        targets = []
+        for (unit, address) in peers:
+            if not ledger.needs_probe(unit, address):
+                hookenv.log('unit %s already probed.' % unit, hookenv.DEBUG)
                 continue
+            targets.append((unit, address))
 
-            hookenv.log('probing host %s at %s' % (unit, address))
-            hookenv.status_set('maintenance', 'Probing peer %s' % unit)
-            try:
-                out = gluster_peer.probe(address)
-                hookenv.log('successfully probed %s: %s' % (unit, out),
-                            hookenv.DEBUG)
-                new_units.append(unit)
-            except gluster_utils.GlusterCmdException as e:
-                hookenv.log('Error probing host %s: %s' % (unit, e),
+        if not targets:
+            ledger.save()
+            reactive.set_state('peering.complete')
+            return
+
+        # Until the new peers are in the pool there is nothing to expand
+        # the volume onto.
+        reactive.remove_state('peering.complete')
+        hookenv.status_set('maintenance', 'Probing %d peers' % len(targets))
+        concurrency = (hookenv.config('peer_probe_concurrency') or
+                       peering.DEFAULT_PROBE_CONCURRENCY)
+        timeout = (hookenv.config('peer_probe_timeout') or
+                   peering.DEFAULT_PROBE_TIMEOUT)
+        probed = []
+        for result in peering.probe_all(targets, concurrency=concurrency,
+                                        timeout=timeout):
+            if result.error:
+                hookenv.log('Error probing host %s at %s: %s' %
+                            (result.unit, result.address, result.error),
                             hookenv.ERROR)
+                continue
+
+            hookenv.log('successfully probed %s in %.1fs: %s' %
+                        (result.unit, result.elapsed, result.output),
+                        hookenv.DEBUG)
+            probed.append(result)
 
-        if new_units:
-            settings = {'probed-units': probed_units.extend(new_units)}
-            hookenv.leader_set(settings)
+        if probed:
+            gateway.invalidate()
+            uuids = self._peer_uuids()
+            for result in probed:
+                ledger.record(result.unit, result.address,
+                              uuids.get(result.address))
+            ledger.save()
             # This isn't right, but just figure out what to assess here.
             hookenv.status_set('active', 'ready')
+
+        if not any(ledger.needs_probe(unit, address)
+                   for (unit, address) in peers):
+            reactive.set_state('peering.complete')
+
+    def publish_bricks(self):
+        """Offers the bricks prepared on this unit to the leader.
+
+        :return: list of [path, size]
+        """
+        store = brickstate.BrickStateStore()
+        offered = expansion.local_bricks([s.mount_point for s in store])
+        expansion.publish_bricks(offered)
+        return offered
+
+    def _pool_members(self):
+        """Returns the addresses, and hostnames, of the peers in the trusted
+        pool: those glusterd has in the cluster and those the leader has
+        recorded probing.
+
+        :return: set
+        """
+        ledger = peering.ProbeLedger.load()
+        members = set(ledger.address(unit) for unit in ledger)
+        try:
+            peers = gateway.get_gateway().peer_status()
+        except gluster_utils.GlusterCmdException as e:
+            hookenv.log('Unable to get the peer status: %s' % e,
+                        hookenv.WARNING)
+            return members
+        names = [p.hostname for p in peers
+                 if p.status == model.State.PeerInCluster]
+        members.update(names)
+        # Peers probed by address may be listed by name.
+        members.update(a for a in resolver.resolve_all(names).values() if a)
+        return members
+
+    def _cluster_disks(self):
+        """Returns the bricks offered by this unit and those of its peers
+        in the trusted pool.
+
+        :return: list of layout.Disk
+        """
+        store = brickstate.BrickStateStore()
+        return expansion.cluster_disks(
+            hookenv.unit_private_ip(),
+            expansion.local_bricks([s.mount_point for s in store]),
+            members=self._pool_members())
+
+    def _plan(self, disks, existing=()):
+        """Plans disks into sets for the configured cluster_type.
+
+        :param existing: the host:path names already in the volume
+        :return: layout.Plan
+        """
+        return layout.plan(disks, hookenv.config('cluster_type'),
+                           hookenv.config('replication_level'),
+                           hookenv.config('extra_level'), existing=existing)
+
+    def create_volume(self):
+        """Creates and starts the volume from the bricks offered so far.
+
+        Only the leader creates the volume. The first batch of replica sets
+        is given to volume create and any others are added with add-brick.
+        A volume left stopped by an earlier failed attempt is started; the
+        volume only counts as created once it is started.
+        """
+        if not hookenv.is_leader():
+            return
+        volname = hookenv.config('volume_name')
+        gw = gateway.get_gateway()
+        if volname in gw.volume_list():
+            # A previous attempt may have created the volume and failed
+            # before starting it.
+            volumes = gw.volume_info(volname)
+            if volumes and volumes[0].status != 'Started':
+                try:
+                    gw.volume_start(volname)
+                except gluster_utils.GlusterCmdException as e:
+                    hookenv.log('Unable to start volume %s: %s' %
+                                (volname, e), hookenv.ERROR)
+                    hookenv.status_set('blocked', 'Unable to start volume '
+                                                  '%s' % volname)
+                    return
+            reactive.set_state('volume.created')
+            return
+
+        disks = self._cluster_disks()
+        plan = self._plan(disks)
+        if not plan.sets:
+            hookenv.status_set('waiting', 'Waiting for enough peers with '
+                                          'bricks to create %s' % volname)
+            return
+        commands = expansion.batches(plan)
+        hookenv.status_set('maintenance', 'Creating volume %s with %d '
+                                          'bricks' % (volname,
+                                                      len(plan.bricks)))
+        try:
+            gw.volume_create(volname, commands[0], **plan.options)
+            for batch in commands[1:]:
+                gw.volume_add_brick(
+                    volname, batch,
+                    **expansion.add_brick_options(plan.options))
+            gw.volume_start(volname)
+        except gluster_utils.GlusterCmdException as e:
+            hookenv.log('Unable to create volume %s: %s' % (volname, e),
+                        hookenv.ERROR)
+            hookenv.status_set('blocked', 'Unable to create volume %s' %
+                               volname)
+            return
+        unitdata.kv().set('expansion-fingerprint',
+                          expansion.fingerprint(disks))
+        reactive.set_state('volume.created')
+        hookenv.status_set('active', 'Volume %s created' % volname)
+
+    def expand_volume(self):
+        """Adds the bricks offered since the volume was last grown.
+
+        Nothing already in the volume moves: new bricks are added in whole
+        replica sets with batched add-brick commands and a rebalance is
+        started to spread the existing data onto them. Nothing is asked of
+        gluster unless the bricks offered by the peers have changed.
+        """
+        if not hookenv.is_leader():
+            return
+        volname = hookenv.config('volume_name')
+        disks = self._cluster_disks()
+        kv = unitdata.kv()
+        fingerprint = expansion.fingerprint(disks)
+        if kv.get('expansion-fingerprint') == fingerprint:
+            return
+
+        gw = gateway.get_gateway()
+        volumes = gw.volume_info(volname)
+        if not volumes:
+            return
+        plan = self._plan(disks, [b.name for b in volumes[0].bricks])
+        if plan.unplaced:
+            hookenv.log('%d bricks wait for more peers to complete a set' %
+                        len(plan.unplaced), hookenv.INFO)
+        if plan.sets:
+            hookenv.status_set('maintenance', 'Adding %d bricks to %s' %
+                               (len(plan.bricks), volname))
+            try:
+                for batch in expansion.batches(plan):
+                    gw.volume_add_brick(
+                        volname, batch,
+                        **expansion.add_brick_options(plan.options))
+            except gluster_utils.GlusterCmdException as e:
+                hookenv.log('Unable to add bricks to %s: %s' % (volname, e),
+                            hookenv.ERROR)
+                hookenv.status_set('blocked', 'Unable to add bricks to %s' %
+                                   volname)
+                return
+            self.start_rebalance(volname)
+        kv.set('expansion-fingerprint', fingerprint)
+
+    def start_rebalance(self, volname):
+        """Starts spreading volname's data over its bricks.
+
+        The rebalance is throttled with the rebalance_throttle option so
+        that clients keep their throughput while it runs.
+        """
+        throttle = hookenv.config('rebalance_throttle') or 'normal'
+        if throttle not in expansion.REBALANCE_THROTTLES:
+            hookenv.log('Invalid rebalance_throttle %s, using normal' %
+                        throttle, hookenv.WARNING)
+            throttle = 'normal'
+        gw = gateway.get_gateway()
+        try:
+            options.apply_options(volname,
+                                  {'cluster.rebal-throttle': throttle}, gw=gw)
+            gw.rebalance_start(volname)
+        except gluster_utils.GlusterCmdException as e:
+            hookenv.log('Unable to start rebalancing %s: %s' % (volname, e),
+                        hookenv.ERROR)
+            return
+        reactive.set_state('volume.rebalancing')
+
+    def apply_sysctl(self):
+        """Sets the sysctls of the volume_profile option, overridden by
+        those of the sysctl option, on this unit.
+        """
+        try:
+            settings = profiles.sysctl_settings(
+                hookenv.config('volume_profile'), hookenv.config('sysctl'))
+            profiles.apply_sysctl(settings)
+        except (ValueError, yaml.YAMLError) as e:
+            hookenv.log('Invalid sysctl settings: %s' % e, hookenv.ERROR)
+            hookenv.status_set('blocked', 'Invalid sysctl or volume_profile')
+        except subprocess.CalledProcessError:
+            hookenv.status_set('blocked', 'Unable to apply sysctls, see the '
+                                          'unit log')
+
+    def apply_volume_profile(self):
+        """Tunes the volume for the workload named by volume_profile.
+
+        Only the leader changes the volume, and only when the option has
+        changed since the profile was last applied successfully. A profile
+        gluster rejects is rolled back and retried on a later hook; any
+        other outcome sets volume.profiled, which a change to the option
+        clears.
+        """
+        if not hookenv.is_leader():
+            return
+        name = hookenv.config('volume_profile') or 'default'
+        kv = unitdata.kv()
+        previous = kv.get('volume-profile')
+        if previous == name:
+            reactive.set_state('volume.profiled')
+            return
+        volname = hookenv.config('volume_name')
+        try:
+            result = profiles.apply_profile(volname, name, previous)
+        except ValueError as e:
+            hookenv.log(str(e), hookenv.ERROR)
+            hookenv.status_set('blocked', 'Unknown volume_profile %s' % name)
+            # Nothing changes until the option does.
+            reactive.set_state('volume.profiled')
+            return
+        except gluster_utils.GlusterCmdException as e:
+            hookenv.log('Unable to apply volume_profile %s to %s: %s' %
+                        (name, volname, e), hookenv.ERROR)
+            return
+        if result.failed:
+            hookenv.status_set('blocked', 'volume_profile %s rejected: %s' % (
+                name, ', '.join(sorted(result.failed))))
+            return
+        hookenv.log('Applied volume_profile %s to %s with %d volume sets' %
+                    (name, volname, result.transactions), hookenv.INFO)
+        kv.set('volume-profile', name)
+        reactive.set_state('volume.profiled')
+
+    def apply_quotas(self):
+        """Brings the volume's directory quotas in line with the quotas
+        option.
+
+        Only the leader changes the volume. The spec last applied is
+        remembered, so this costs nothing until the option changes; a
+        spec which partly failed is tried again on the next hook. Any
+        other outcome sets quotas.applied, which a change to the option
+        clears.
+        """
+        if not hookenv.is_leader():
+            return
+        volname = hookenv.config('volume_name')
+        try:
+            spec = quota.parse_spec(hookenv.config('quotas') or '')
+        except ValueError as e:
+            hookenv.log(str(e), hookenv.ERROR)
+            hookenv.status_set('blocked', 'Invalid quotas')
+            reactive.set_state('quotas.applied')
+            return
+        try:
+            result = quota.reconcile(volname, spec)
+        except gluster_utils.GlusterCmdException as e:
+            hookenv.log('Unable to list the quotas of %s: %s' % (volname, e),
+                        hookenv.ERROR)
+            return
+        if result.skipped:
+            reactive.set_state('quotas.applied')
+            return
+        hookenv.log('Quotas on %s: %d added, %d changed, %d removed, %d '
+                    'unchanged, %d failed in %.1fs' % (
+                        volname, len(result.added), len(result.changed),
+                        len(result.removed), result.unchanged,
+                        len(result.failed), result.elapsed), hookenv.INFO)
+        if result.failed:
+            hookenv.status_set('blocked', 'Unable to set %d quotas, see the '
+                                          'unit log' % len(result.failed))
+            return
+        reactive.set_state('quotas.applied')
+
+    def configure_ctdb(self):
+        """Writes the CTDB node list and virtual IPs and balances the
+        virtual IPs over the units.
+
+        Every unit lists every virtual IP in its public_addresses and
+        publishes its weight (the speed of the NIC the virtual IPs are on)
+        and the NFS and CIFS clients on the virtual IPs it holds, rounded
+        so that the relation only changes when the load does. The
+        leader keeps the node list, in which a unit's line never changes,
+        and moves the fewest virtual IPs it takes to spread the clients
+        over the healthy units in proportion to their weight.
+        """
+        try:
+            addresses = ctdb.parse_addresses(
+                hookenv.config('virtual_ip_addresses'))
+        except ValueError as e:
+            hookenv.log(str(e), hookenv.ERROR)
+            hookenv.status_set('blocked', 'Invalid virtual_ip_addresses')
+            return
+        if not addresses:
+            return
+
+        interfaces = {a: ctdb.interface_for(a) for a in addresses}
+        speeds = [ctdb.nic_speed(i) for i in set(interfaces.values()) if i]
+        weight = min([s for s in speeds if s] or [ctdb.DEFAULT_WEIGHT])
+        clients = ctdb.published_clients(ctdb.clients_per_address(
+            [str(a.ip) for a in addresses]))
+        settings = {ctdb.WEIGHT_KEY: str(weight),
+                    ctdb.CLIENTS_KEY: json.dumps(clients, sort_keys=True)}
+        peers = {hookenv.unit_private_ip(): (weight, clients)}
+        for rid in hookenv.relation_ids('server'):
+            published = hookenv.relation_get(
+                rid=rid, unit=hookenv.local_unit()) or {}
+            if any(published.get(k) != v for k, v in settings.items()):
+                hookenv.relation_set(relation_id=rid,
+                                     relation_settings=settings)
+            for unit in hookenv.related_units(rid):
+                data = hookenv.relation_get(rid=rid, unit=unit) or {}
+                if not data.get('private-address'):
+                    continue
+                try:
+                    peers[data['private-address']] = (
+                        float(data.get(ctdb.WEIGHT_KEY) or
+                              ctdb.DEFAULT_WEIGHT),
+                        json.loads(data.get(ctdb.CLIENTS_KEY) or '{}'))
+                except ValueError:
+                    continue
+
+        if hookenv.is_leader():
+            nodes = ctdb.update_nodes(
+                json.loads(hookenv.leader_get('ctdb-nodes') or '[]'),
+                sorted(peers))
+            hookenv.leader_set({'ctdb-nodes': json.dumps(nodes)})
+        else:
+            nodes = json.loads(hookenv.leader_get('ctdb-nodes') or '[]')
+        if not nodes:
+            return
+
+        nodes_changed = ctdb.write_file(ctdb.NODES_FILE,
+                                        ctdb.render_nodes(nodes))
+        ips_changed = ctdb.write_file(
+            ctdb.PUBLIC_ADDRESSES_FILE,
+            ctdb.render_public_addresses(addresses, interfaces))
+        if not host.service_running('ctdb'):
+            return
+        try:
+            if nodes_changed:
+                ctdb.reload_nodes()
+            if ips_changed:
+                ctdb.reload_ips()
+            if hookenv.is_leader():
+                self._balance_ctdb(addresses, nodes, peers)
+        except (subprocess.CalledProcessError, OSError) as e:
+            hookenv.log('Unable to update ctdb: %s' % e, hookenv.WARNING)
+
+    def _balance_ctdb(self, addresses, nodes, peers):
+        """Moves virtual IPs between the healthy CTDB nodes.
+
+        :param nodes: the CTDB node list, see ctdb.update_nodes()
+        :param peers: dict of unit address to (weight, dict of virtual IP
+                      to clients)
+        """
+        healthy = ctdb.ctdb_status()
+        weights = {}
+        costs = {str(a.ip): 1 for a in addresses}
+        for pnn, node in enumerate(nodes):
+            if node.startswith('#') or node not in peers:
+                continue
+            weight, clients = peers[node]
+            if healthy.get(pnn):
+                weights[pnn] = weight
+            for address, count in clients.items():
+                if address in costs:
+                    costs[address] += count
+        current = ctdb.ctdb_ip()
+        planned = ctdb.plan(sorted(costs), weights, current, costs)
+        for move in ctdb.moves(current, planned):
+            hookenv.log('Moving virtual IP %s from node %s to node %s' %
+                        move, hookenv.INFO)
+            try:
+                ctdb.move_ip(move.address, move.target)
+            except subprocess.CalledProcessError as e:
+                hookenv.log('Unable to move %s: %s' % (move.address, e),
+                            hookenv.WARNING)
+
+    def publish_client_contract(self):
+        """Tells fuse and nfs clients how to mount the volume.
+
+        FUSE clients get this unit as their volfile server and the other
+        units as backups, those in the clients' zones and with the fewest
+        FUSE clients first, along with mount options for the
+        volume_profile. NFS clients get the virtual IPs if there are some,
+        and rsize and wsize for the profile. Each relation is only written
+        when what it would be told changes. This runs when the volume is
+        created and then only once the options, the clients or the peers
+        change, which clears clients.published, and the count of FUSE
+        clients this unit publishes to its peers is refreshed then too.
+        """
+        volname = hookenv.config('volume_name')
+        profile = hookenv.config('volume_profile') or 'default'
+        address = hookenv.unit_private_ip()
+
+        peers = []
+        # FUSE clients fetch the volfile from glusterd; peers connect to
+        # it too and aren't clients.
+        remotes = metrics.established_remotes(metrics.GLUSTERD_PORT)
+        for rid in hookenv.relation_ids(expansion.PEER_RELATION):
+            for unit in hookenv.related_units(rid):
+                data = hookenv.relation_get(rid=rid, unit=unit) or {}
+                if not data.get('private-address'):
+                    continue
+                try:
+                    clients = int(data.get(client.CLIENTS_KEY) or 0)
+                except ValueError:
+                    clients = 0
+                peers.append(client.Server(
+                    data['private-address'],
+                    data.get(expansion.ZONE_KEY) or None, clients))
+        # Rounded, so that peers only hear of changes which can reorder
+        # their backup lists.
+        count = len(remotes - {p.address for p in peers})
+        count = str(count - count % client.LOAD_BUCKET)
+        for rid in hookenv.relation_ids(expansion.PEER_RELATION):
+            published = hookenv.relation_get(
+                rid=rid, unit=hookenv.local_unit()) or {}
+            if published.get(client.CLIENTS_KEY) != count:
+                hookenv.relation_set(relation_id=rid,
+                                     relation_settings={
+                                         client.CLIENTS_KEY: count})
+
+        for rid, zones in client.client_zones(client.FUSE_RELATION).items():
+            backups = client.order_servers(peers, zones or [expansion.zone()])
+            client.publish(rid, client.fuse_settings(volname, address,
+                                                     backups, profile))
+        try:
+            virtual_ips = [str(a.ip) for a in ctdb.parse_addresses(
+                hookenv.config('virtual_ip_addresses'))]
+        except ValueError:
+            virtual_ips = []
+        for rid in hookenv.relation_ids(client.NFS_RELATION):
+            client.publish(rid, client.nfs_settings(volname, address,
+                                                    virtual_ips, profile))
+        reactive.set_state('clients.published')
+
+    def control_scrub(self):
+        """Configures the bitrot scrubber and runs it only when the disks
+        can spare the bandwidth.
+
+        Every unit publishes its self-heal backlog and brick disk latency
+        to its peers and keeps its own scrub progress for status and
+        metrics. The leader applies bitrot_detection, scrub_throttle and
+        scrub_frequency, and pauses the scrubber outside scrub_window or
+        while any unit is over scrub_max_heal_pending or
+        scrub_max_disk_latency_ms, resuming it afterwards.
+        """
+        volname = hookenv.config('volume_name')
+        local = metrics.local_addresses()
+        # The same brick list as custom_assess_status_check, so the heal
+        # summary comes from the same cache entry.
+        bricks = [(volume, path) for volume, _, path in
+                  metrics.local_bricks(local)]
+        summary = heal.cached_summary(bricks).get(volname)
+        pressure = scrub.Pressure(
+            summary.pending if summary else 0,
+            scrub.disk_latency(scrub.device_names(
+                [path for volume, path in bricks if volume == volname])))
+        scrub.publish_pressure(pressure)
+
+        enabled = bool(hookenv.config('bitrot_detection'))
+        gw = gateway.get_gateway()
+        try:
+            if hookenv.is_leader():
+                paused = self._control_scrub(gw, volname, enabled, pressure)
+                hookenv.leader_set({'scrub-paused': paused or ''})
+            else:
+                paused = hookenv.leader_get('scrub-paused') or None
+            node = None
+            if enabled:
+                node = scrub.local_node(gw.scrub_status(volname)[0], local)
+        except (gluster_utils.GlusterCmdException, IndexError) as e:
+            hookenv.log('Unable to control the scrubber of %s: %s' %
+                        (volname, e), hookenv.WARNING)
+            return
+        scrub.save_status(volname, node, paused)
+
+    def _control_scrub(self, gw, volname, enabled, pressure):
+        """Applies the scrub options on the leader.
+
+        :return: the reason the scrubber is paused, or None
+        """
+        volumes = gw.volume_info(volname)
+        if not volumes:
+            return None
+        current = volumes[0].options
+        if not enabled:
+            if current.get(scrub.BITROT_OPTION) == 'on':
+                gw.bitrot_disable(volname)
+            return None
+        if current.get(scrub.BITROT_OPTION) != 'on':
+            gw.bitrot_enable(volname)
+        throttle = hookenv.config('scrub_throttle') or 'lazy'
+        if throttle not in scrub.THROTTLES:
+            hookenv.log('Invalid scrub_throttle %s, using lazy' % throttle,
+                        hookenv.WARNING)
+            throttle = 'lazy'
+        if current.get(scrub.THROTTLE_OPTION) != throttle:
+            gw.scrub_throttle(volname, throttle)
+        frequency = hookenv.config('scrub_frequency') or 'weekly'
+        if frequency not in scrub.FREQUENCIES:
+            hookenv.log('Invalid scrub_frequency %s, using weekly' %
+                        frequency, hookenv.WARNING)
+            frequency = 'weekly'
+        if current.get(scrub.FREQUENCY_OPTION) != frequency:
+            gw.scrub_frequency(volname, frequency)
+
+        try:
+            window = scrub.parse_window(hookenv.config('scrub_window'))
+        except ValueError as e:
+            hookenv.log(str(e), hookenv.ERROR)
+            window = None
+        was_paused = (current.get(scrub.SCRUB_OPTION) or '').lower() in (
+            'pause', 'paused')
+        run, reason = scrub.decide(
+            scrub.in_window(window, time.localtime()),
+            scrub.cluster_pressure(pressure),
+            hookenv.config('scrub_max_heal_pending') or 0,
+            hookenv.config('scrub_max_disk_latency_ms') or 0,
+            paused=was_paused)
+        if run and was_paused:
+            hookenv.log('Resuming the scrubber of %s' % volname,
+                        hookenv.INFO)
+            gw.scrub_resume(volname)
+        elif not run and not was_paused:
+            hookenv.log('Pausing the scrubber of %s: %s' % (volname, reason),
+                        hookenv.INFO)
+            gw.scrub_pause(volname)
+        return reason
+
+    def rebalance_status_check(self):
+        """Reports the progress of a rebalance the charm started.
+
+        One rebalance status query is made per call, normally from
+        update-status.
+
+        :return: (state, message), or (None, None) if not rebalancing
+        """
+        if not reactive.is_state('volume.rebalancing'):
+            return None, None
+        volname = hookenv.config('volume_name')
+        try:
+            status = gateway.get_gateway().rebalance_status(volname)[-1]
+        except (gluster_utils.GlusterCmdException, IndexError) as e:
+            hookenv.log('Unable to get rebalance status of %s: %s' %
+                        (volname, e), hookenv.WARNING)
+            return None, None
+        if status.status in ('in progress', 'not started'):
+            return 'active', expansion.progress_message(volname, status)
+        reactive.remove_state('volume.rebalancing')
+        hookenv.log('Rebalance of %s %s: %d files, %d failures' %
+                    (volname, status.status, status.files or 0,
+                     status.failures or 0), hookenv.INFO)
+        if status.status != 'completed':
+            return 'blocked', 'Rebalance of %s %s' % (volname, status.status)
+        return None, None
+
+    def custom_assess_status_check(self):
+        """Reports a rebalance in progress, a paused or failing bitrot
+        scrub, or a self-heal backlog on any of this unit's volumes.
+
+        The backlog is counted from the bricks' heal indices at most once
+        every heal.DEFAULT_TTL seconds; see heal.cached_summary().
+
+        :return: (state, message), or (None, None) if nothing is healing
+        """
+        state, message = self.rebalance_status_check()
+        if state:
+            return state, message
+        message = scrub.status_message(scrub.load_status())
+        if message:
+            return 'active', message
+        bricks = [(volume, path) for volume, _, path in
+                  metrics.local_bricks(metrics.local_addresses())]
+        summary = heal.cached_summary(bricks)
+        message = heal.status_message(summary)
+        if message:
+            return 'active', message
+        return None, None
+
+    def _peer_uuids(self):
+        """Returns a dict of peer hostname, and address, to peer UUID from
+        the pool list.
+
+        :return: dict, empty if the pool could not be listed
+        """
+        try:
+            pool = gateway.get_gateway().pool_list()
+        except gluster_utils.GlusterCmdException as e:
+            hookenv.log('Unable to list the storage pool: %s' % e,
+                        hookenv.WARNING)
+            return {}
+        # Peers probed by address may be listed by name, so each peer is
+        # also found under the address its name resolves to.
+        addresses = resolver.resolve_all(p.hostname for p in pool)
+        uuids = {}
+        for p in pool:
+            uuids[p.hostname] = str(p.uuid)
+            if addresses.get(p.hostname):
+                uuids.setdefault(addresses[p.hostname], str(p.uuid))
+        return uuids
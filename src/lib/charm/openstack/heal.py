@@ -0,0 +1,146 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import charmhelpers.core.unitdata as unitdata
+
+# Entries needing self-heal are hard links in this index on each brick.
+INDEX = os.path.join('.glusterfs', 'indices', 'xattrop')
+# The index's own base file is named xattrop-<gfid> and isn't an entry.
+BASE_PREFIX = 'xattrop'
+
+DEFAULT_CONCURRENCY = 8
+
+# Stop counting a brick after this many entries when summarising. The
+# status only needs to say that a large backlog exists.
+DEFAULT_LIMIT = 10000
+
+# Seconds a cached heal summary is trusted for.
+DEFAULT_TTL = 300
+
+HealSummary = collections.namedtuple('HealSummary', [
+    'volume', 'pending', 'bricks', 'truncated'])
+
+
+def _brick_path(brick):
+    return getattr(brick, 'path', brick)
+
+
+def get_self_heal_count(brick, threshold=None):
+    """Counts the entries waiting for self-heal on a brick.
+
+    The index is streamed with os.scandir so memory use is constant no
+    matter how many millions of entries a recovering brick holds.
+
+    :param brick: a brick path, or an object with a path attribute
+    :param threshold: stop once the count exceeds this, if given
+    :return: int, at most threshold + 1 when threshold is given
+    """
+    count = 0
+    try:
+        entries = os.scandir(os.path.join(_brick_path(brick), INDEX))
+    except OSError:
+        return 0
+    try:
+        for entry in entries:
+            if entry.name.startswith(BASE_PREFIX):
+                continue
+            count += 1
+            if threshold is not None and count > threshold:
+                break
+    except OSError:
+        pass
+    finally:
+        if hasattr(entries, 'close'):
+            entries.close()
+    return count
+
+
+def is_healing(brick, threshold=0):
+    """Indicates whether more than threshold entries await self-heal."""
+    return get_self_heal_count(brick, threshold) > threshold
+
+
+def scan_bricks(bricks, threshold=None, concurrency=DEFAULT_CONCURRENCY):
+    """Counts the self-heal backlog of several bricks at once.
+
+    :param bricks: brick paths, or objects with a path attribute
+    :param threshold: see get_self_heal_count()
+    :param concurrency: the number of bricks scanned at the same time
+    :return: list of counts, in the order of bricks
+    """
+    bricks = list(bricks)
+    if len(bricks) < 2:
+        return [get_self_heal_count(b, threshold) for b in bricks]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return list(pool.map(lambda b: get_self_heal_count(b, threshold),
+                             bricks))
+
+
+def summarise(bricks, limit=DEFAULT_LIMIT, concurrency=DEFAULT_CONCURRENCY):
+    """Summarises the self-heal backlog of local bricks per volume.
+
+    :param bricks: list of (volume, path) pairs
+    :param limit: the most entries counted on a single brick
+    :return: dict of volume name to HealSummary
+    """
+    bricks = list(bricks)
+    counts = scan_bricks([path for _, path in bricks], limit, concurrency)
+    summary = {}
+    for (volume, _), count in zip(bricks, counts):
+        s = summary.get(volume, HealSummary(volume, 0, 0, False))
+        summary[volume] = HealSummary(volume, s.pending + min(count, limit),
+                                      s.bricks + 1,
+                                      s.truncated or count > limit)
+    return summary
+
+
+def cached_summary(bricks, ttl=DEFAULT_TTL, limit=DEFAULT_LIMIT, kv=None,
+                   now=None):
+    """Returns summarise(bricks), rescanning at most once every ttl seconds.
+
+    The summary is kept in the unit's key/value store so that
+    update-status and the other hooks calling assess_status don't walk
+    every brick's index each time.
+
+    :param bricks: list of (volume, path) pairs
+    :param ttl: seconds the cached summary is valid for
+    :return: dict of volume name to HealSummary
+    """
+    if kv is None:
+        kv = unitdata.kv()
+    now = time.time() if now is None else now
+    key = sorted('%s:%s' % b for b in bricks)
+    cached = kv.get('heal-summary')
+    if (cached and cached.get('bricks') == key and
+            0 <= now - cached.get('ts', 0) < ttl):
+        return {v: HealSummary(*s) for v, s in cached['volumes'].items()}
+    summary = summarise(bricks, limit)
+    kv.set('heal-summary', {'ts': now, 'bricks': key,
+                            'volumes': {v: list(s)
+                                        for v, s in summary.items()}})
+    return summary
+
+
+def status_message(summary):
+    """Describes the volumes with a self-heal backlog, or returns None."""
+    healing = ['%s (%d%s)' % (s.volume, s.pending, '+' if s.truncated else '')
+               for s in sorted(summary.values()) if s.pending]
+    if not healing:
+        return None
+    return 'Self-heal pending: %s' % ', '.join(healing)
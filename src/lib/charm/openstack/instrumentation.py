@@ -0,0 +1,255 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+
+import charmhelpers.core.hookenv as hookenv
+
+# Name of the JSON-lines timeline file in the charm directory.
+TIMELINE = 'hook-timeline.jsonl'
+
+# Number of hook invocations kept in the timeline.
+MAX_HOOKS = 500
+
+_lock = threading.Lock()
+_state = {
+    'installed': False,
+    'depth': 0,
+    'start': None,
+    'cpu': None,
+    'subprocesses': 0,
+    'handlers': [],
+    'commands': {},
+}
+
+_Popen = subprocess.Popen
+
+
+def _cpu_time():
+    """Returns CPU seconds used by this process and its reaped children."""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def _command_name(args):
+    if isinstance(args, (list, tuple)):
+        args = args[0] if args else ''
+    else:
+        args = str(args).split(' ', 1)[0]
+    return os.path.basename(str(args))
+
+
+def _record_command(name, elapsed):
+    with _lock:
+        count, total = _state['commands'].get(name, (0, 0.0))
+        _state['commands'][name] = (count + 1, total + elapsed)
+
+
+class _TrackedPopen(_Popen):
+    """A Popen which records each external command it runs.
+
+    Every command run through the subprocess module (gluster, mkfs, mount,
+    apt, the juju hook tools, ...) is counted, and its wall time from
+    spawn until it was waited for is attributed to its program name.
+    """
+
+    def __init__(self, args, *pargs, **kwargs):
+        self._tracked_name = _command_name(args)
+        self._tracked_start = time.time()
+        self._tracked_done = False
+        super(_TrackedPopen, self).__init__(args, *pargs, **kwargs)
+        with _lock:
+            _state['subprocesses'] += 1
+
+    def wait(self, *args, **kwargs):
+        rc = super(_TrackedPopen, self).wait(*args, **kwargs)
+        if not self._tracked_done:
+            self._tracked_done = True
+            _record_command(self._tracked_name,
+                            time.time() - self._tracked_start)
+        return rc
+
+
+def install():
+    """Starts recording the current hook invocation.
+
+    Registers the timeline to be written when the hook exits. Calling it
+    more than once has no further effect.
+    """
+    with _lock:
+        if _state['installed']:
+            return
+        _state['installed'] = True
+        _state['start'] = time.time()
+        _state['cpu'] = _cpu_time()
+    hookenv.atexit(flush)
+
+
+@contextlib.contextmanager
+def tracking():
+    """Counts the external commands run within the block.
+
+    subprocess.Popen is replaced for the length of the block only, so that
+    importing the charm doesn't change it for everything else in the
+    process.
+    """
+    with _lock:
+        _state['depth'] += 1
+        if _state['depth'] == 1:
+            subprocess.Popen = _TrackedPopen
+    try:
+        yield
+    finally:
+        with _lock:
+            _state['depth'] -= 1
+            if not _state['depth']:
+                subprocess.Popen = _Popen
+
+
+def timed(handler):
+    """Decorator recording the cost of a reactive handler.
+
+    Apply it below the charms.reactive decorators. The wrapper carries the
+    action ids of handler, which charms.reactive would otherwise build
+    from the wrapper's code object, the same for every handler, and so
+    register them all as one.
+    """
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        start, cpu = time.time(), _cpu_time()
+        with _lock:
+            spawned = _state['subprocesses']
+        try:
+            with tracking():
+                return handler(*args, **kwargs)
+        finally:
+            with _lock:
+                _state['handlers'].append({
+                    'name': handler.__name__,
+                    'wall': round(time.time() - start, 4),
+                    'cpu': round(_cpu_time() - cpu, 4),
+                    'subprocesses': _state['subprocesses'] - spawned,
+                })
+    code = handler.__code__
+    wrapper._action_id = '%s:%s:%s' % (
+        code.co_filename, code.co_firstlineno, code.co_name)
+    wrapper._short_action_id = '%s:%s:%s' % (
+        os.path.relpath(code.co_filename, hookenv.charm_dir() or '.'),
+        code.co_firstlineno, code.co_name)
+    return wrapper
+
+
+def _timeline_path():
+    return os.path.join(hookenv.charm_dir() or '.', TIMELINE)
+
+
+def snapshot():
+    """Returns the record of the current hook invocation as a dict."""
+    with _lock:
+        return {
+            'hook': hookenv.hook_name(),
+            'ts': round(_state['start'] or time.time(), 3),
+            'wall': round(time.time() - (_state['start'] or time.time()), 4),
+            'cpu': round(_cpu_time() - (_state['cpu'] or 0.0), 4),
+            'subprocesses': _state['subprocesses'],
+            'handlers': list(_state['handlers']),
+            'commands': {k: [c, round(t, 4)] for k, (c, t) in
+                         _state['commands'].items()},
+        }
+
+
+def flush(path=None):
+    """Appends the current hook invocation to the timeline file.
+
+    The file is trimmed to the last MAX_HOOKS invocations.
+    """
+    path = path or _timeline_path()
+    line = json.dumps(snapshot(), separators=(',', ':'), sort_keys=True)
+    try:
+        lines = read_timeline(path, raw=True)
+        lines.append(line)
+        if len(lines) > MAX_HOOKS:
+            tmp = path + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write('\n'.join(lines[-MAX_HOOKS:]) + '\n')
+            os.rename(tmp, path)
+        else:
+            with open(path, 'a') as f:
+                f.write(line + '\n')
+    except (IOError, OSError) as e:
+        hookenv.log('Unable to write hook timeline: %s' % e,
+                    hookenv.WARNING)
+
+
+def read_timeline(path=None, raw=False):
+    """Reads the timeline file.
+
+    :param path: the timeline file, defaults to the one in the charm dir
+    :param raw: return the JSON lines rather than decoded records
+    :return: list, oldest invocation first
+    """
+    path = path or _timeline_path()
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if raw:
+        return lines
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+HandlerCost = collections.namedtuple('HandlerCost', [
+    'name', 'calls', 'max_wall', 'mean_wall', 'total_cpu',
+    'subprocesses'])
+
+
+def slowest_handlers(count=10, hooks=50, records=None):
+    """Aggregates handler costs over recent hook invocations.
+
+    :param count: the number of handlers to return
+    :param hooks: the number of most recent hook invocations to consider
+    :param records: timeline records, read from the timeline file if None
+    :return: list of HandlerCost, slowest (by max wall time) first
+    """
+    if records is None:
+        records = read_timeline()
+    stats = {}
+    for record in records[-hooks:]:
+        for h in record.get('handlers', []):
+            calls, max_wall, total_wall, cpu, spawned = stats.get(
+                h['name'], (0, 0.0, 0.0, 0.0, 0))
+            stats[h['name']] = (calls + 1, max(max_wall, h['wall']),
+                                total_wall + h['wall'], cpu + h['cpu'],
+                                spawned + h['subprocesses'])
+
+    costs = [HandlerCost(name, calls, max_wall, total_wall / calls, cpu,
+                         spawned)
+             for name, (calls, max_wall, total_wall, cpu, spawned)
+             in stats.items()]
+    costs.sort(key=lambda c: c.max_wall, reverse=True)
+    return costs[:count]
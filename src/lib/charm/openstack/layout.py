@@ -0,0 +1,186 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import heapq
+
+# A device which can hold a brick. zone is the host's availability zone,
+# or None if the cloud doesn't have zones.
+Disk = collections.namedtuple('Disk', ['host', 'path', 'size', 'zone'])
+
+
+class Plan(collections.namedtuple('Plan', ['sets', 'unplaced', 'options'])):
+    """The bricks to create or add, grouped into replica (or stripe or
+    disperse) sets.
+
+    :param sets: list of lists of Disk, one list per set
+    :param unplaced: the Disks which couldn't be put in a full set
+    :param options: the keyword arguments for volume create or add-brick,
+                    e.g. {'replica': 3}
+    """
+    __slots__ = ()
+
+    @property
+    def bricks(self):
+        """The host:path brick names, set by set, as gluster expects."""
+        return ['%s:%s' % (d.host, d.path) for s in self.sets for d in s]
+
+
+def volume_options(cluster_type, replication_level, extra_level):
+    """Returns how a cluster_type groups bricks.
+
+    :param cluster_type: the cluster_type option, e.g. Distributed-Replicate
+    :param replication_level: the replication_level option
+    :param extra_level: the extra_level option
+    :return: (set size, create options, whether more than one set is
+              allowed)
+    :raises ValueError: if cluster_type isn't supported
+    """
+    replica = replication_level
+    types = {
+        'Distribute': (1, {}, True),
+        'Replicate': (replica, {'replica': replica}, False),
+        'Distributed-Replicate': (replica, {'replica': replica}, True),
+        # The last extra_level bricks of each set are the arbiters.
+        'Arbiter': (replica, {'replica': replica, 'arbiter': extra_level},
+                    True),
+        'Stripe': (replica, {'stripe': replica}, False),
+        'Distributed-Stripe': (replica, {'stripe': replica}, True),
+        'Striped-Replicate': (replica * extra_level,
+                              {'replica': replica, 'stripe': extra_level},
+                              False),
+        'Distributed-Striped-Replicate': (replica * extra_level,
+                                          {'replica': replica,
+                                           'stripe': extra_level}, True),
+        'Disperse': (replica, {'disperse': replica,
+                               'redundancy': extra_level}, False),
+        'Distributed-Disperse': (replica, {'disperse': replica,
+                                           'redundancy': extra_level}, True),
+    }
+    if cluster_type not in types:
+        raise ValueError('Unsupported cluster_type %s' % cluster_type)
+    return types[cluster_type]
+
+
+class _Pool(object):
+    """The unused disks of every host, ordered for picking.
+
+    Hosts are kept in one heap per zone, keyed on the number of disks they
+    have left and then the size of their largest, and zones are kept in a
+    heap keyed on their total disks left. Picking a set costs
+    O(set size * log hosts).
+    """
+
+    def __init__(self, disks):
+        self.disks = collections.defaultdict(list)
+        self.zone_of = {}
+        for disk in disks:
+            self.disks[disk.host].append(disk)
+            self.zone_of.setdefault(disk.host, disk.zone)
+        for host_disks in self.disks.values():
+            # pop() returns the largest disk, and of equal disks the first
+            # by path.
+            host_disks.sort(key=lambda d: (-d.size, d.path), reverse=True)
+        self.hosts = collections.defaultdict(list)
+        self.left = collections.Counter()
+        for host, host_disks in self.disks.items():
+            zone = self._zone(host)
+            heapq.heappush(self.hosts[zone], self._host_key(host))
+            self.left[zone] += len(host_disks)
+        self.zones = [(-left, zone) for zone, left in self.left.items()]
+        heapq.heapify(self.zones)
+
+    def _zone(self, host):
+        # None doesn't order against strings in the heaps.
+        zone = self.zone_of[host]
+        return '' if zone is None else zone
+
+    def _host_key(self, host):
+        host_disks = self.disks[host]
+        return (-len(host_disks), -host_disks[-1].size, host)
+
+    def pick(self, count):
+        """Takes one disk from each of count different hosts.
+
+        Hosts are taken from as many different zones as possible, and
+        from those with the most disks left.
+
+        :return: list of Disk, or None if fewer than count hosts are left
+        """
+        zones = []
+        while self.zones and len(zones) < count:
+            zones.append(heapq.heappop(self.zones)[1])
+        chosen = []
+        while len(chosen) < count:
+            progress = False
+            for zone in zones:
+                if len(chosen) < count and self.hosts[zone]:
+                    chosen.append(heapq.heappop(self.hosts[zone])[2])
+                    progress = True
+            if not progress:
+                break
+
+        picked = None
+        if len(chosen) == count:
+            picked = [self.disks[host].pop() for host in chosen]
+        for host in chosen:
+            zone = self._zone(host)
+            if picked is not None:
+                self.left[zone] -= 1
+            if self.disks[host]:
+                heapq.heappush(self.hosts[zone], self._host_key(host))
+        for zone in zones:
+            if self.left[zone]:
+                heapq.heappush(self.zones, (-self.left[zone], zone))
+        return picked
+
+    def remaining(self):
+        return [d for host in sorted(self.disks) for d in self.disks[host]]
+
+
+def plan(disks, cluster_type='Distributed-Replicate', replication_level=3,
+         extra_level=1, existing=()):
+    """Plans which disks become bricks and how they are grouped in sets.
+
+    Every set has its bricks on different hosts and, where there are
+    enough zones, in different zones. Sets are made from hosts with the
+    most unused disks first, so that hosts fill evenly, and from each
+    host's largest disk first, so that the bricks in a set are of similar
+    size and little capacity is lost to the smallest replica.
+
+    Bricks already in the volume are never moved. Disks which can't go in
+    a full set, for example because only one new host has joined a
+    replica 3 volume, are left unplaced until more hosts or disks arrive.
+
+    :param disks: list of Disk, including those already used by the volume
+    :param cluster_type: see volume_options()
+    :param existing: host:path names of the bricks in the volume
+    :return: Plan
+    """
+    set_size, options, distributed = volume_options(
+        cluster_type, replication_level, extra_level)
+    existing = set(existing)
+    free = [d for d in disks if '%s:%s' % (d.host, d.path) not in existing]
+    max_sets = None if distributed else (0 if existing else 1)
+
+    pool = _Pool(free)
+    sets = []
+    while max_sets is None or len(sets) < max_sets:
+        picked = pool.pick(set_size)
+        if picked is None:
+            break
+        # Largest first; the smallest bricks are the ones used as arbiters.
+        picked.sort(key=lambda d: d.size, reverse=True)
+        sets.append(picked)
+    return Plan(sets=sets, unplaced=pool.remaining(), options=options)
@@ -0,0 +1,343 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import os
+import socket
+
+import charm.openstack.heal as heal
+import charm.openstack.resolver as resolver
+
+GLUSTERD_DIR = '/var/lib/glusterd'
+GLUSTER_RUN_DIR = '/var/run/gluster'
+
+# Where node_exporter's textfile collector picks up *.prom files.
+DEFAULT_TEXTFILE_DIR = '/var/lib/prometheus/node-exporter'
+TEXTFILE_NAME = 'gluster.prom'
+
+GLUSTERD_PORT = 24007
+TCP_ESTABLISHED = '01'
+
+GB = 1024 ** 3
+MB = 1024 ** 2
+
+BrickSample = collections.namedtuple('BrickSample', [
+    'volume', 'hostname', 'path', 'online', 'size_total', 'size_used',
+    'heal_pending', 'cpu_seconds', 'rss_bytes'])
+
+PeerSample = collections.namedtuple('PeerSample', [
+    'uuid', 'hostname', 'in_cluster', 'connected'])
+
+# scrub is (volume, model.ScrubNode or None, paused reason) as kept by
+# scrub.save_status(), or None if bitrot isn't being controlled.
+Sample = collections.namedtuple('Sample', ['bricks', 'peers', 'scrub'])
+
+
+def _read_info(path):
+    """Reads a glusterd key=value store file into a dict."""
+    info = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                key, sep, value = line.rstrip('\n').partition('=')
+                if sep:
+                    info[key] = value
+    except (IOError, OSError):
+        pass
+    return info
+
+
+def _listdir(path):
+    try:
+        return sorted(os.listdir(path))
+    except OSError:
+        return []
+
+
+def local_addresses():
+    """Returns the set of addresses and names this host is known by."""
+    return resolver.get_resolver().local_addresses()
+
+
+def local_bricks(local, glusterd_dir=GLUSTERD_DIR):
+    """Lists the bricks hosted by this unit from glusterd's own state.
+
+    :param local: the set of addresses this host is known by
+    :param glusterd_dir: glusterd's working directory
+    :return: list of (volume, hostname, path) tuples
+    """
+    bricks = []
+    vols = os.path.join(glusterd_dir, 'vols')
+    for volume in _listdir(vols):
+        brick_dir = os.path.join(vols, volume, 'bricks')
+        for name in _listdir(brick_dir):
+            info = _read_info(os.path.join(brick_dir, name))
+            hostname, path = info.get('hostname'), info.get('path')
+            if hostname in local and path:
+                bricks.append((volume, hostname, path))
+    return bricks
+
+
+def brick_pid(volume, hostname, path, run_dir=GLUSTER_RUN_DIR):
+    """Returns the pid of the running brick process, or None."""
+    pidfile = os.path.join(run_dir, 'vols', volume, '%s-%s.pid' % (
+        hostname, path.strip('/').replace('/', '-')))
+    try:
+        with open(pidfile, 'r') as f:
+            pid = int(f.read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+    return pid if os.path.exists('/proc/%d' % pid) else None
+
+
+def process_usage(pid, proc='/proc'):
+    """Returns (cpu seconds, rss bytes) of pid from /proc.
+
+    :return: tuple, (0.0, 0) if the process can't be read
+    """
+    try:
+        with open(os.path.join(proc, str(pid), 'stat'), 'r') as f:
+            # The command name may contain spaces, so split after it.
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(os.path.join(proc, str(pid), 'statm'), 'r') as f:
+            rss_pages = int(f.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return 0.0, 0
+    ticks = os.sysconf('SC_CLK_TCK')
+    # utime and stime are fields 14 and 15 of stat, 12 and 13 after pid
+    # and comm have been split off.
+    cpu = (int(fields[11]) + int(fields[12])) / float(ticks)
+    return cpu, rss_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def _hex_to_ip(value):
+    raw = bytes.fromhex(value)
+    if len(raw) == 4:
+        return socket.inet_ntop(socket.AF_INET, raw[::-1])
+    # IPv6 addresses are four host-endian 32 bit words.
+    words = b''.join(raw[i:i + 4][::-1] for i in range(0, 16, 4))
+    address = socket.inet_ntop(socket.AF_INET6, words)
+    if address.startswith('::ffff:') and '.' in address:
+        return address[7:]
+    return address
+
+
+def established_remotes(port, proc='/proc'):
+    """Returns the remote addresses with an established TCP connection
+    to or from port on this host, read directly from /proc/net.
+    """
+    remotes = set()
+    for name in ('tcp', 'tcp6'):
+        try:
+            with open(os.path.join(proc, 'net', name), 'r') as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 4 or fields[3] != TCP_ESTABLISHED:
+                        continue
+                    local_ip, local_port = fields[1].split(':')
+                    remote_ip, remote_port = fields[2].split(':')
+                    if port in (int(local_port, 16), int(remote_port, 16)):
+                        remotes.add(_hex_to_ip(remote_ip))
+        except (IOError, OSError, StopIteration, ValueError):
+            continue
+    return remotes
+
+
+def established_clients(ports, proc='/proc'):
+    """Returns the remote addresses connected to each local address on
+    any of ports, read directly from /proc/net.
+
+    :param ports: the local ports clients connect to
+    :return: dict of local address to set of remote addresses
+    """
+    clients = {}
+    for name in ('tcp', 'tcp6'):
+        try:
+            with open(os.path.join(proc, 'net', name), 'r') as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 4 or fields[3] != TCP_ESTABLISHED:
+                        continue
+                    local_ip, local_port = fields[1].split(':')
+                    if int(local_port, 16) not in ports:
+                        continue
+                    remote_ip = fields[2].split(':')[0]
+                    clients.setdefault(_hex_to_ip(local_ip), set()).add(
+                        _hex_to_ip(remote_ip))
+        except (IOError, OSError, StopIteration, ValueError):
+            continue
+    return clients
+
+
+def peers(glusterd_dir=GLUSTERD_DIR, proc='/proc'):
+    """Samples the peers of this unit from glusterd's state and the
+    established connections to glusterd.
+
+    :return: list of PeerSample
+    """
+    connected = established_remotes(GLUSTERD_PORT, proc)
+    samples = []
+    peer_dir = os.path.join(glusterd_dir, 'peers')
+    for name in _listdir(peer_dir):
+        info = _read_info(os.path.join(peer_dir, name))
+        names = [v for k, v in sorted(info.items())
+                 if k.startswith('hostname')]
+        samples.append(PeerSample(
+            uuid=info.get('uuid', name),
+            hostname=names[0] if names else None,
+            # 3 is "Peer in Cluster" in glusterd's friend state machine.
+            in_cluster=info.get('state') == '3',
+            connected=any(n in connected for n in names)))
+    return samples
+
+
+def collect(glusterd_dir=GLUSTERD_DIR, run_dir=GLUSTER_RUN_DIR,
+            proc='/proc', scrub=None):
+    """Samples every local brick and peer in a single pass.
+
+    Nothing is forked: capacity comes from statvfs, process usage from
+    /proc and everything else from glusterd's working directory.
+
+    :param scrub: the scrub progress last saved by update-status
+
+    :return: Sample
+    """
+    local = local_bricks(local_addresses(), glusterd_dir)
+    heals = heal.scan_bricks([path for _, _, path in local])
+    bricks = []
+    for (volume, hostname, path), pending in zip(local, heals):
+        try:
+            st = os.statvfs(path)
+            total = st.f_blocks * st.f_frsize
+            used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        except OSError:
+            total = used = 0
+        pid = brick_pid(volume, hostname, path, run_dir)
+        cpu, rss = process_usage(pid, proc) if pid else (0.0, 0)
+        bricks.append(BrickSample(
+            volume=volume, hostname=hostname, path=path,
+            online=pid is not None, size_total=total, size_used=used,
+            heal_pending=pending, cpu_seconds=cpu, rss_bytes=rss))
+    return Sample(bricks=bricks, peers=peers(glusterd_dir, proc),
+                  scrub=scrub)
+
+
+def juju_metrics(sample):
+    """Aggregates a Sample into the metrics declared in metrics.yaml.
+
+    :return: dict of metric name to value, suitable for add-metric
+    """
+    bricks = sample.bricks
+    metrics = {
+        'gb-used': round(sum(b.size_used for b in bricks) / GB, 3),
+        'gb-total': round(sum(b.size_total for b in bricks) / GB, 3),
+        'bricks-online': len([b for b in bricks if b.online]),
+        'bricks-offline': len([b for b in bricks if not b.online]),
+        'heal-pending': sum(b.heal_pending for b in bricks),
+        'brick-cpu-seconds': round(sum(b.cpu_seconds for b in bricks), 2),
+        'brick-rss-mb': round(sum(b.rss_bytes for b in bricks) / MB, 1),
+        'peers-connected': len([p for p in sample.peers if p.connected]),
+        'peers-total': len(sample.peers),
+    }
+    node = sample.scrub[1] if sample.scrub else None
+    if node is not None:
+        metrics['scrub-files'] = node.scrubbed or 0
+        metrics['scrub-errors'] = node.errors or 0
+    return metrics
+
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\')
+                                 .replace('"', '\\"'))
+                    for k, v in sorted(labels.items()))
+
+
+def prometheus_text(sample):
+    """Renders a Sample in the Prometheus text exposition format.
+
+    :return: str
+    """
+    series = collections.OrderedDict([
+        ('gluster_brick_size_bytes', ('gauge', 'Brick filesystem size.')),
+        ('gluster_brick_used_bytes', ('gauge', 'Brick filesystem usage.')),
+        ('gluster_brick_online', ('gauge', 'Whether the brick process is '
+                                           'running.')),
+        ('gluster_brick_heal_pending', ('gauge', 'Entries queued for '
+                                                 'self-heal.')),
+        ('gluster_brick_cpu_seconds_total', ('counter', 'CPU time used by '
+                                                        'the brick process.')),
+        ('gluster_brick_rss_bytes', ('gauge', 'Resident memory of the brick '
+                                              'process.')),
+        ('gluster_peer_connected', ('gauge', 'Whether glusterd is connected '
+                                             'to the peer.')),
+        ('gluster_scrub_files', ('gauge', 'Files checked by the last bitrot '
+                                          'scrub.')),
+        ('gluster_scrub_errors', ('gauge', 'Corrupted files found by the '
+                                           'bitrot scrubber.')),
+        ('gluster_scrub_duration_seconds', ('gauge', 'Duration of the last '
+                                                     'bitrot scrub.')),
+        ('gluster_scrub_paused', ('gauge', 'Whether the charm has paused '
+                                           'the bitrot scrubber.')),
+    ])
+    values = collections.defaultdict(list)
+    for b in sample.bricks:
+        labels = _labels(volume=b.volume,
+                         brick='%s:%s' % (b.hostname, b.path))
+        values['gluster_brick_size_bytes'].append((labels, b.size_total))
+        values['gluster_brick_used_bytes'].append((labels, b.size_used))
+        values['gluster_brick_online'].append((labels, int(b.online)))
+        values['gluster_brick_heal_pending'].append((labels,
+                                                     b.heal_pending))
+        values['gluster_brick_cpu_seconds_total'].append((labels,
+                                                          b.cpu_seconds))
+        values['gluster_brick_rss_bytes'].append((labels, b.rss_bytes))
+    for p in sample.peers:
+        values['gluster_peer_connected'].append(
+            (_labels(uuid=p.uuid, hostname=p.hostname), int(p.connected)))
+    if sample.scrub:
+        volume, node, paused = sample.scrub
+        labels = _labels(volume=volume)
+        if node is not None:
+            values['gluster_scrub_files'].append((labels, node.scrubbed or 0))
+            values['gluster_scrub_errors'].append((labels, node.errors or 0))
+            values['gluster_scrub_duration_seconds'].append(
+                (labels, node.duration or 0))
+        values['gluster_scrub_paused'].append((labels, int(bool(paused))))
+
+    lines = []
+    for name, (kind, help_text) in series.items():
+        if not values[name]:
+            continue
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for labels, value in values[name]:
+            lines.append('%s{%s} %s' % (name, labels, value))
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(text, directory=DEFAULT_TEXTFILE_DIR):
+    """Atomically replaces the textfile collector file in directory.
+
+    node_exporter may read the file at any time, so it is written to a
+    temporary file which is renamed into place.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o755)
+    path = os.path.join(directory, TEXTFILE_NAME)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.rename(tmp, path)
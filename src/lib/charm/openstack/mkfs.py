@@ -0,0 +1,198 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import os
+
+KiB = 1024
+MiB = 1024 * KiB
+GiB = 1024 * MiB
+
+# The largest log stripe unit mkfs.xfs accepts.
+XFS_MAX_LOG_SU = 256 * KiB
+
+# The log stripe unit mkfs.xfs falls back to for larger data stripe units.
+XFS_DEFAULT_LOG_SU = 32 * KiB
+
+SUPPORTED = ('xfs', 'ext4', 'btrfs')
+
+Geometry = collections.namedtuple('Geometry', [
+    'logical_block_size', 'physical_block_size', 'minimum_io_size',
+    'optimal_io_size', 'size', 'rotational'])
+
+# The geometry assumed when nothing could be read from sysfs.
+DEFAULT_GEOMETRY = Geometry(logical_block_size=512, physical_block_size=512,
+                            minimum_io_size=512, optimal_io_size=0,
+                            size=0, rotational=True)
+
+Stripe = collections.namedtuple('Stripe', ['unit', 'width'])
+
+
+def _read_int(path, default):
+    try:
+        with open(path, 'r') as f:
+            return int(f.read().strip())
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def read_geometry(device, sysfs_root='/sys'):
+    """Reads the I/O geometry of a block device from sysfs.
+
+    :param device: the device path, e.g. /dev/sdb
+    :param sysfs_root: the mount point of sysfs
+    :return: Geometry, with defaults for anything which couldn't be read
+    """
+    name = os.path.basename(os.path.realpath(device))
+    block = os.path.join(sysfs_root, 'class', 'block', name)
+    queue = os.path.join(block, 'queue')
+    if not os.path.isdir(queue):
+        # Partitions share the request queue of their parent disk.
+        queue = os.path.join(block, '..', 'queue')
+
+    d = DEFAULT_GEOMETRY
+    return Geometry(
+        logical_block_size=_read_int(
+            os.path.join(queue, 'logical_block_size'), d.logical_block_size),
+        physical_block_size=_read_int(
+            os.path.join(queue, 'physical_block_size'),
+            d.physical_block_size),
+        minimum_io_size=_read_int(
+            os.path.join(queue, 'minimum_io_size'), d.minimum_io_size),
+        optimal_io_size=_read_int(
+            os.path.join(queue, 'optimal_io_size'), d.optimal_io_size),
+        size=_read_int(os.path.join(block, 'size'), 0) * 512,
+        rotational=bool(_read_int(os.path.join(queue, 'rotational'),
+                                  d.rotational)))
+
+
+def _is_power_of_two(n):
+    return n > 0 and n & (n - 1) == 0
+
+
+def stripe_for(geometry, stripe_unit_kb=None, stripe_width=None):
+    """Works out the RAID stripe to align a filesystem to.
+
+    The raid_stripe_unit/raid_stripe_width options take precedence.
+    Otherwise md and most hardware RAID drivers export the chunk size as
+    minimum_io_size and the full stripe as optimal_io_size, from which the
+    stripe is derived. That is only done for rotational devices: SSD and
+    NVMe drives report their erase block or preferred write size there,
+    which is no RAID stripe.
+
+    :param geometry: the Geometry of the device
+    :param stripe_unit_kb: the configured stripe unit in KiB
+    :param stripe_width: the configured number of data disks
+    :return: Stripe in bytes and data disks, or None if not striped
+    """
+    if stripe_unit_kb or stripe_width:
+        if not (stripe_unit_kb and stripe_width):
+            raise ValueError('raid_stripe_unit and raid_stripe_width must '
+                             'be specified together')
+        if not _is_power_of_two(stripe_unit_kb):
+            raise ValueError('raid_stripe_unit must be a power of 2, got '
+                             '%s' % stripe_unit_kb)
+        return Stripe(stripe_unit_kb * KiB, stripe_width)
+
+    if not geometry.rotational:
+        return None
+    unit = geometry.minimum_io_size
+    optimal = geometry.optimal_io_size
+    if (unit > geometry.logical_block_size and optimal > unit and
+            optimal % unit == 0 and _is_power_of_two(unit)):
+        return Stripe(unit, optimal // unit)
+    return None
+
+
+def _size_arg(n):
+    if n % MiB == 0:
+        return '%dm' % (n // MiB)
+    return '%dk' % (n // KiB)
+
+
+def _xfs_log_size(size, log_su, rotational=True):
+    """Scales the internal log with the device, between 64MiB and 512MiB.
+
+    A large log turns metadata updates into long sequential writes, which
+    matters on spinning disks. Flash has no seek cost to amortise, so the
+    log is capped at 128MiB there to keep log recovery short.
+    """
+    log_size = min(max(size // 2048, 64 * MiB),
+                   512 * MiB if rotational else 128 * MiB)
+    log_size -= log_size % MiB
+    if log_su:
+        log_size -= log_size % log_su
+    return log_size
+
+
+def plan(fstype, geometry=DEFAULT_GEOMETRY, stripe_unit_kb=None,
+         stripe_width=None, inode_size=512):
+    """Plans the mkfs command line for a brick.
+
+    This is a pure function of its arguments so the outcome for a given
+    device and configuration can be checked without touching any disks.
+
+    :param fstype: one of xfs, ext4 or btrfs
+    :param geometry: the Geometry of the device, see read_geometry
+    :param stripe_unit_kb: the raid_stripe_unit option (KiB)
+    :param stripe_width: the raid_stripe_width option (data disks)
+    :param inode_size: the inode_size option (bytes)
+    :return: the mkfs command as a list, without the device
+    """
+    if fstype not in SUPPORTED:
+        raise ValueError('Unsupported brick filesystem %s, expected one of '
+                         '%s' % (fstype, ', '.join(SUPPORTED)))
+
+    if fstype == 'btrfs':
+        # btrfs does its own allocation and has no stripe alignment knobs.
+        cmd = ['mkfs.btrfs', '-f']
+        if geometry.physical_block_size > 4096:
+            cmd += ['-s', str(geometry.physical_block_size)]
+        return cmd
+
+    stripe = stripe_for(geometry, stripe_unit_kb, stripe_width)
+    sector = max(geometry.logical_block_size, geometry.physical_block_size)
+
+    if fstype == 'xfs':
+        cmd = ['mkfs.xfs', '-f', '-n', 'size=8192']
+        if inode_size:
+            cmd += ['-i', 'size=%d' % inode_size]
+        if sector > 512:
+            cmd += ['-s', 'size=%d' % sector]
+
+        log = []
+        log_su = None
+        if stripe:
+            cmd += ['-d', 'su=%s,sw=%d' % (_size_arg(stripe.unit),
+                                           stripe.width)]
+            log_su = (stripe.unit if stripe.unit <= XFS_MAX_LOG_SU
+                      else XFS_DEFAULT_LOG_SU)
+            log.append('su=%s' % _size_arg(log_su))
+        if geometry.size:
+            log.append('size=%s' % _size_arg(
+                _xfs_log_size(geometry.size, log_su, geometry.rotational)))
+        if log:
+            cmd += ['-l', ','.join(log)]
+        return cmd
+
+    # ext4
+    block_size = 4096
+    cmd = ['mkfs.ext4', '-F', '-b', str(block_size)]
+    if inode_size:
+        cmd += ['-I', str(inode_size)]
+    if stripe:
+        stride = max(1, stripe.unit // block_size)
+        cmd += ['-E', 'stride=%d,stripe_width=%d' % (stride,
+                                                     stride * stripe.width)]
+    return cmd
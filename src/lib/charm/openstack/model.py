@@ -0,0 +1,128 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+from enum import Enum
+
+
+class State(Enum):
+    """The states of glusterd's peer (friend) state machine.
+
+    The values are the <state> numbers reported by peer status --xml.
+    """
+    EstablishingConnection = 0
+    ProbeSentToPeer = 1
+    ProbeReceivedFromPeer = 2
+    PeerInCluster = 3
+    AcceptedPeerRequest = 4
+    SentAndReceivedPeerRequest = 5
+    PeerRejected = 6
+    PeerDetachInProgress = 7
+    ProbeReceivedFromPeerUnconfirmed = 8
+    ConnectedToPeer = 9
+    PeerIsConnectedAndAccepted = 10
+    InvalidState = 11
+
+
+class Peer(collections.namedtuple('Peer', ['uuid', 'hostname', 'status'])):
+    """A member of the trusted storage pool.
+
+    Peers are immutable and compare and hash on their UUID alone, so the
+    same peer seen in pool list and in a volume's bricks is one set member
+    whatever its hostname or state. The hostname stands in for the UUID if
+    it isn't known.
+    """
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return self.uuid if self.uuid is not None else self.hostname
+
+    def __eq__(self, other):
+        return isinstance(other, Peer) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+class Brick(collections.namedtuple('Brick', [
+        'brick_uuid', 'peer', 'path', 'is_arbiter'])):
+    """A brick, identified by the UUID of its peer and its path."""
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return self.peer.key, self.path
+
+    @property
+    def name(self):
+        """The host:path name gluster uses for the brick."""
+        return '%s:%s' % (self.peer.hostname, self.path)
+
+    def __eq__(self, other):
+        return isinstance(other, Brick) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+BrickStatus = collections.namedtuple('BrickStatus', [
+    'brick', 'tcp_port', 'rdma_port', 'online', 'pid'])
+
+
+class Volume(collections.namedtuple('Volume', [
+        'name', 'vol_id', 'vol_type', 'status', 'snapshot_count',
+        'dist_count', 'stripe_count', 'replica_count', 'arbiter_count',
+        'disperse_count', 'redundancy_count', 'transport', 'bricks',
+        'options'])):
+    """A volume, identified by its UUID (or name, if that isn't known)."""
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return self.vol_id if self.vol_id is not None else self.name
+
+    def __eq__(self, other):
+        return isinstance(other, Volume) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+Quota = collections.namedtuple('Quota', [
+    'path', 'hard_limit', 'soft_limit', 'soft_limit_percentage', 'used',
+    'avail', 'soft_limit_exceeded', 'hard_limit_exceeded'])
+
+# One node's progress in rebalance status output. The aggregate over all
+# nodes has a node of None. Sizes are in bytes and times in seconds.
+RebalanceStatus = collections.namedtuple('RebalanceStatus', [
+    'node', 'files', 'size', 'lookups', 'failures', 'skipped', 'status',
+    'runtime', 'time_left'])
+
+# Bitrot scrubbing on one node. last_scrub is as gluster prints it and
+# duration is in seconds.
+ScrubNode = collections.namedtuple('ScrubNode', [
+    'node', 'scrubbed', 'skipped', 'last_scrub', 'duration', 'errors'])
+
+ScrubStatus = collections.namedtuple('ScrubStatus', [
+    'volume', 'state', 'frequency', 'throttle', 'nodes'])
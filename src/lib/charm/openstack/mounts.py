@@ -0,0 +1,150 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import select
+import threading
+
+MOUNTINFO = '/proc/self/mountinfo'
+
+# The table shared by every caller for the lifetime of the hook, and the
+# lock serializing access to it from the brick preparation workers.
+_table = None
+_lock = threading.Lock()
+
+# The kernel writes space, tab, newline and backslash in mountinfo as \NNN.
+_OCTAL = re.compile(r'\\([0-7]{3})')
+
+
+def _unescape(field):
+    """Decodes the octal escapes (e.g. \\040 for space) used in mountinfo."""
+    if '\\' not in field:
+        return field
+    return _OCTAL.sub(lambda m: chr(int(m.group(1), 8)), field)
+
+
+def parse_mountinfo(lines):
+    """Parses the lines of a mountinfo file.
+
+    :param lines: an iterable of lines in proc(5) mountinfo format
+    :return: a list of (mount_point, device, fstype) tuples, in mount order
+    """
+    mounts = []
+    for line in lines:
+        fields = line.split()
+        try:
+            sep = fields.index('-', 6)
+        except ValueError:
+            continue
+        mounts.append((_unescape(fields[4]), _unescape(fields[sep + 2]),
+                       fields[sep + 1]))
+    return mounts
+
+
+class MountTable(object):
+    """A parsed snapshot of the mount table with lookup indexes.
+
+    The snapshot keeps /proc/self/mountinfo open and polls it, which the
+    kernel flags with POLLPRI as soon as anything is mounted or unmounted,
+    so stale() is a single syscall rather than a re-read of the table.
+    """
+
+    def __init__(self, path=MOUNTINFO):
+        self.path = path
+        self.mounts = []
+        self._by_device = {}
+        self._by_mount_point = {}
+        self._poller = None
+        self._file = None
+        self._load()
+
+    def _load(self):
+        self._file = open(self.path, 'r')
+        try:
+            self.mounts = parse_mountinfo(self._file)
+        except Exception:
+            self.close()
+            raise
+
+        try:
+            self._poller = select.poll()
+            self._poller.register(self._file,
+                                  select.POLLPRI | select.POLLERR)
+        except (AttributeError, ValueError, OSError):
+            # No change notification available; the snapshot is then only
+            # refreshed when it is invalidated explicitly.
+            self._poller = None
+
+        for mount_point, device, _ in self.mounts:
+            # A device mounted in several places is reported at its first
+            # mount point, matching host.mounts() ordering.
+            self._by_device.setdefault(device, mount_point)
+            # Later mounts on the same path shadow earlier ones.
+            self._by_mount_point[mount_point] = device
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._poller = None
+
+    def stale(self):
+        """Indicates whether the mount table changed since the snapshot.
+
+        :return bool: True if a mount or unmount has happened since the
+            snapshot was taken, False otherwise
+        """
+        if self._file is None:
+            return True
+        if self._poller is None:
+            return False
+        return bool(self._poller.poll(0))
+
+    def is_mounted(self, path):
+        """Indicates whether path is a mounted device or a mount point."""
+        return path in self._by_device or path in self._by_mount_point
+
+    def mount_point(self, device):
+        """Returns the mount point of device, or None if it isn't mounted."""
+        return self._by_device.get(device)
+
+    def device(self, mount_point):
+        """Returns the device mounted at mount_point, or None."""
+        return self._by_mount_point.get(mount_point)
+
+
+def get_mount_table():
+    """Returns the shared mount table, re-reading it only if it changed.
+
+    :return: MountTable
+    """
+    global _table
+    with _lock:
+        if _table is None or _table.stale():
+            _close()
+            _table = MountTable()
+        return _table
+
+
+def _close():
+    global _table
+    if _table is not None:
+        _table.close()
+        _table = None
+
+
+def invalidate():
+    """Drops the shared mount table; call this after mount or umount."""
+    with _lock:
+        _close()
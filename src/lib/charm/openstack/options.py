@@ -0,0 +1,170 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+import charmhelpers.core.hookenv as hookenv
+import gluster.cli.utils as gluster_utils
+
+import charm.openstack.gateway as gateway
+
+# The most key/value pairs passed to one volume set. Every volume set is a
+# glusterd transaction which locks the volume on every peer, but a very
+# long command line makes a failure hard to pin on one option.
+MAX_OPTIONS_PER_SET = 8
+
+# Options which glusterd only accepts on their own in a volume set.
+SOLO_OPTIONS = ('group',)
+
+# Spellings glusterd accepts for booleans, and the one it reports.
+_BOOLEANS = {
+    'on': 'on', 'off': 'off',
+    'true': 'on', 'false': 'off',
+    'yes': 'on', 'no': 'off',
+    'enable': 'on', 'disable': 'off',
+    'enabled': 'on', 'disabled': 'off',
+}
+
+_DEFAULT_SUFFIX = ' (DEFAULT)'
+
+# The outcome of applying options to a volume.
+#
+# changed: OrderedDict of the options set, to their new value
+# unchanged: sorted names of the options which already had their value
+# unknown: sorted names of options the volume doesn't have
+# failed: dict of option name to the error gluster gave
+# transactions: the number of volume set commands run
+Result = collections.namedtuple('Result', [
+    'changed', 'unchanged', 'unknown', 'failed', 'transactions'])
+
+
+def normalise(value):
+    """Returns value as volume get reports it, for comparison."""
+    value = str(value).strip()
+    if value.endswith(_DEFAULT_SUFFIX):
+        value = value[:-len(_DEFAULT_SUFFIX)]
+    return _BOOLEANS.get(value.lower(), value)
+
+
+def diff(current, desired):
+    """Compares the options a volume has with those wanted.
+
+    :param current: dict of option to value, as from volume get all
+    :param desired: dict of option to value
+    :return: (OrderedDict of the options to change, sorted unchanged names,
+              sorted unknown names)
+    """
+    changed = collections.OrderedDict()
+    unchanged = []
+    unknown = []
+    for key in sorted(desired):
+        value = str(desired[key])
+        if key in SOLO_OPTIONS:
+            # group applies a set of options and is never reported itself.
+            changed[key] = value
+        elif key not in current:
+            unknown.append(key)
+        elif normalise(current[key]) == normalise(value):
+            unchanged.append(key)
+        else:
+            changed[key] = value
+    return changed, unchanged, unknown
+
+
+def transactions(changed, size=MAX_OPTIONS_PER_SET):
+    """Groups the options to change into as few volume set commands as
+    glusterd allows.
+
+    :param changed: OrderedDict of option to value
+    :return: list of OrderedDict, each one volume set
+    """
+    groups = []
+    batch = collections.OrderedDict()
+    for key, value in changed.items():
+        if key in SOLO_OPTIONS:
+            groups.append(collections.OrderedDict([(key, value)]))
+            continue
+        batch[key] = value
+        if len(batch) >= size:
+            groups.append(batch)
+            batch = collections.OrderedDict()
+    if batch:
+        groups.append(batch)
+    return groups
+
+
+def apply_options(volname, desired, dry_run=False,
+                  size=MAX_OPTIONS_PER_SET, gw=None):
+    """Sets the options of volname which differ from desired.
+
+    The volume's options are read once with volume get all, and only the
+    changed ones are set, several per volume set. If a volume set fails
+    its options are retried one by one, so that one bad value doesn't
+    keep the others from being applied and the error is pinned on it.
+
+    :param volname: the volume to change
+    :param desired: dict of option to value
+    :param dry_run: if True, work out what would change but don't set it
+    :return: Result
+    """
+    gw = gw or gateway.get_gateway()
+    current = dict(gw.volume_get(volname))
+    changed, unchanged, unknown = diff(current, desired)
+    for key in unknown:
+        hookenv.log('Volume %s has no option %s, skipping' % (volname, key),
+                    hookenv.WARNING)
+    if dry_run:
+        return Result(changed=changed, unchanged=unchanged, unknown=unknown,
+                      failed={}, transactions=0)
+
+    done = collections.OrderedDict()
+    failed = {}
+    count = 0
+    for group in transactions(changed, size):
+        count += 1
+        try:
+            gw.volume_set(volname, group)
+            done.update(group)
+            continue
+        except gluster_utils.GlusterCmdException as e:
+            if len(group) == 1:
+                failed.update({k: str(e) for k in group})
+                continue
+        for key, value in group.items():
+            count += 1
+            try:
+                gw.volume_set(volname, {key: value})
+                done[key] = value
+            except gluster_utils.GlusterCmdException as e:
+                failed[key] = str(e)
+    for key, error in sorted(failed.items()):
+        hookenv.log('Unable to set %s on volume %s: %s' %
+                    (key, volname, error), hookenv.ERROR)
+    return Result(changed=done, unchanged=unchanged, unknown=unknown,
+                  failed=failed, transactions=count)
+
+
+def parse_options(text):
+    """Parses whitespace separated key=value pairs.
+
+    :return: dict of option to value
+    :raises ValueError: if a pair has no =
+    """
+    desired = {}
+    for pair in text.split():
+        key, sep, value = pair.partition('=')
+        if not sep or not key:
+            raise ValueError('Expected key=value, got %s' % pair)
+        desired[key.strip()] = value.strip()
+    return desired
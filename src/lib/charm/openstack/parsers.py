@@ -0,0 +1,392 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streaming parsers for the output of gluster --xml.
+
+Each document is read with ElementTree.iterparse and every record (a
+peer, brick, option or quota limit) is turned into a model object and
+cleared from the tree as soon as it is complete, so the parse never holds
+more than one record's elements. Parsers accept a str, bytes or a binary
+file object such as a pipe from gluster.
+"""
+
+import io
+import subprocess
+import tempfile
+import uuid
+import xml.etree.ElementTree as etree
+
+import gluster.cli.utils as gluster_utils
+
+from charm.openstack.model import (
+    Brick,
+    BrickStatus,
+    Peer,
+    Quota,
+    RebalanceStatus,
+    ScrubNode,
+    ScrubStatus,
+    State,
+    Volume,
+)
+
+TRANSPORTS = {'0': 'tcp', '1': 'rdma', '2': 'tcp,rdma'}
+
+
+def _source(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if isinstance(data, bytes):
+        return io.BytesIO(data)
+    return data
+
+
+def _records(data, tags):
+    """Yields each complete element whose tag is in tags.
+
+    The element is cleared once the consumer moves on, so the tree never
+    holds more than the record being parsed and the empty shells of those
+    before it. A non-zero opRet raises GlusterCmdException with the
+    opErrstr.
+    """
+    ret = 0
+    for _, elem in etree.iterparse(_source(data)):
+        if elem.tag == 'opRet':
+            ret = int(elem.text or 0)
+        elif elem.tag == 'opErrstr' and ret != 0:
+            raise gluster_utils.GlusterCmdException(
+                (ret, '', (elem.text or '').strip()))
+        elif elem.tag in tags:
+            yield elem
+            elem.clear()
+
+
+def _text(elem, tag, default=None):
+    child = elem.find(tag)
+    if child is None or child.text is None:
+        return default
+    return child.text.strip()
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _uuid(value):
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _peer(elem):
+    state = _int(_text(elem, 'state'))
+    return Peer(uuid=_uuid(_text(elem, 'uuid')),
+                hostname=_text(elem, 'hostname'),
+                status=State(state) if state is not None else None)
+
+
+def iter_peers(data):
+    """Yields a Peer for each peer in peer status or pool list output."""
+    for elem in _records(data, ('peer',)):
+        yield _peer(elem)
+
+
+def parse_peer_status(data):
+    """Parses the output of peer status --xml.
+
+    :return: list of Peer
+    """
+    return list(iter_peers(data))
+
+
+def parse_peer_list(data):
+    """Parses the output of pool list --xml.
+
+    Unlike peer status this includes the local node, as localhost and
+    without a state.
+
+    :return: list of Peer
+    """
+    return list(iter_peers(data))
+
+
+def parse_volume_list(data):
+    """Parses the output of volume list --xml.
+
+    :return: list of volume names
+    """
+    return [(e.text or '').strip() for e in _records(data, ('volume',))]
+
+
+def _brick(elem):
+    hostname, _, path = _text(elem, 'name', '').rpartition(':')
+    return Brick(brick_uuid=None,
+                 peer=Peer(uuid=_uuid(_text(elem, 'hostUuid')),
+                           hostname=hostname, status=None),
+                 path=path,
+                 is_arbiter=_text(elem, 'isArbiter') == '1')
+
+
+def iter_volumes(data):
+    """Yields a Volume for each volume in volume info --xml output."""
+    bricks, options = [], {}
+    for elem in _records(data, ('brick', 'option', 'volume')):
+        if elem.tag == 'brick':
+            bricks.append(_brick(elem))
+        elif elem.tag == 'option':
+            options[_text(elem, 'name')] = _text(elem, 'value')
+        else:
+            yield Volume(
+                name=_text(elem, 'name'),
+                vol_id=_uuid(_text(elem, 'id')),
+                vol_type=_text(elem, 'typeStr'),
+                status=_text(elem, 'statusStr'),
+                snapshot_count=_int(_text(elem, 'snapshotCount')),
+                dist_count=_int(_text(elem, 'distCount')),
+                stripe_count=_int(_text(elem, 'stripeCount')),
+                replica_count=_int(_text(elem, 'replicaCount')),
+                arbiter_count=_int(_text(elem, 'arbiterCount')),
+                disperse_count=_int(_text(elem, 'disperseCount')),
+                redundancy_count=_int(_text(elem, 'redundancyCount')),
+                transport=TRANSPORTS.get(_text(elem, 'transport')),
+                bricks=bricks,
+                options=options)
+            bricks, options = [], {}
+
+
+def parse_volume_info(data):
+    """Parses the output of volume info --xml.
+
+    :return: list of Volume
+    """
+    return list(iter_volumes(data))
+
+
+def iter_brick_status(data):
+    """Yields a BrickStatus for each brick in volume status --xml output.
+
+    The NFS server, self-heal and other daemons listed alongside the
+    bricks are skipped.
+    """
+    for elem in _records(data, ('node',)):
+        path = _text(elem, 'path', '')
+        if not path.startswith('/'):
+            continue
+        peer = Peer(uuid=_uuid(_text(elem, 'peerid')),
+                    hostname=_text(elem, 'hostname'), status=None)
+        yield BrickStatus(
+            brick=Brick(brick_uuid=None, peer=peer, path=path,
+                        is_arbiter=False),
+            tcp_port=_int(_text(elem, 'ports/tcp')),
+            rdma_port=_int(_text(elem, 'ports/rdma')),
+            online=_text(elem, 'status') == '1',
+            pid=_int(_text(elem, 'pid')))
+
+
+def parse_volume_status(data):
+    """Parses the output of volume status --xml.
+
+    :return: list of BrickStatus
+    """
+    return list(iter_brick_status(data))
+
+
+def iter_quotas(data):
+    """Yields a Quota for each limit in volume quota list --xml output."""
+    for elem in _records(data, ('limit',)):
+        yield Quota(
+            path=_text(elem, 'path'),
+            hard_limit=_int(_text(elem, 'hard_limit')),
+            soft_limit=_int(_text(elem, 'soft_limit_value')),
+            soft_limit_percentage=_text(elem, 'soft_limit_percent'),
+            used=_int(_text(elem, 'used_space')),
+            avail=_int(_text(elem, 'avail_space')),
+            soft_limit_exceeded=_text(elem, 'sl_exceeded'),
+            hard_limit_exceeded=_text(elem, 'hl_exceeded'))
+
+
+def parse_quota_list(data):
+    """Parses the output of volume quota list --xml.
+
+    :return: list of Quota
+    """
+    return list(iter_quotas(data))
+
+
+def iter_volume_options(data):
+    """Yields an (option, value) pair for each option in volume get --xml
+    output.
+    """
+    for elem in _records(data, ('Opt',)):
+        yield _text(elem, 'Option'), _text(elem, 'Value', '')
+
+
+def parse_volume_options(data):
+    """Parses the output of volume get <volume> all --xml.
+
+    :return: list of (option, value), in gluster's order
+    """
+    return list(iter_volume_options(data))
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_rebalance_status(data):
+    """Yields a RebalanceStatus for each node in volume rebalance status
+    --xml output, then one for the aggregate with a node of None.
+
+    time_left is only reported by gluster 3.10 and later.
+    """
+    for elem in _records(data, ('node', 'aggregate')):
+        yield RebalanceStatus(
+            node=_text(elem, 'nodeName') if elem.tag == 'node' else None,
+            files=_int(_text(elem, 'files')),
+            size=_int(_text(elem, 'size')),
+            lookups=_int(_text(elem, 'lookups')),
+            failures=_int(_text(elem, 'failures')),
+            skipped=_int(_text(elem, 'skipped')),
+            status=_text(elem, 'statusStr'),
+            runtime=_float(_text(elem, 'runtime')),
+            time_left=_int(_text(elem, 'time-left')))
+
+
+def parse_rebalance_status(data):
+    """Parses the output of volume rebalance status --xml.
+
+    :return: list of RebalanceStatus, the aggregate last
+    """
+    return list(iter_rebalance_status(data))
+
+
+def _duration(value):
+    """Parses a scrub duration, seconds or days:hours:minutes:seconds."""
+    try:
+        parts = [int(p) for p in value.split(':')]
+    except (AttributeError, ValueError):
+        return None
+    seconds = 0
+    for unit, part in zip((86400, 3600, 60, 1)[-len(parts):], parts):
+        seconds += unit * part
+    return seconds
+
+
+def iter_scrub_status(data):
+    """Yields the ScrubStatus in volume bitrot <volume> scrub status --xml
+    output.
+    """
+    fields = {}
+    nodes = []
+    for elem in _records(data, ('volName', 'state', 'frequency',
+                                'throttle', 'node')):
+        if elem.tag != 'node':
+            fields[elem.tag] = (elem.text or '').strip()
+            continue
+        nodes.append(ScrubNode(
+            node=_text(elem, 'nodeName'),
+            scrubbed=_int(_text(elem, 'numberOfScrubbedFiles')),
+            skipped=_int(_text(elem, 'numberOfSkippedFiles')),
+            last_scrub=_text(elem, 'lastCompletedScrubTime'),
+            duration=_duration(_text(elem, 'durationOfLastScrub')),
+            errors=_int(_text(elem, 'errorCount'))))
+    if fields or nodes:
+        yield ScrubStatus(volume=fields.get('volName'),
+                          state=fields.get('state'),
+                          frequency=fields.get('frequency'),
+                          throttle=fields.get('throttle'),
+                          nodes=nodes)
+
+
+def parse_scrub_status(data):
+    """Parses the output of volume bitrot <volume> scrub status --xml.
+
+    :return: list holding one ScrubStatus
+    """
+    return list(iter_scrub_status(data))
+
+
+def _command(args):
+    cmd = [gluster_utils.GLUSTERCMD]
+    if gluster_utils.GLUSTERD_SOCKET:
+        cmd.append('--glusterd-sock=%s' % gluster_utils.GLUSTERD_SOCKET)
+    return cmd + ['--mode=script'] + list(args) + ['--xml']
+
+
+def execute(args, parser):
+    """Runs gluster with --xml and parses its output as it is produced.
+
+    :param args: the gluster arguments, e.g. ['volume', 'info']
+    :param parser: one of the parse_* or iter_* functions in this module;
+                   an iter_* parser is consumed into a list
+    :return: what the parser returns
+    :raises GlusterCmdException: if gluster fails
+    """
+    # stderr goes to a file so that a chatty gluster can't block on a full
+    # pipe while its stdout is being parsed.
+    with tempfile.TemporaryFile() as err:
+        p = subprocess.Popen(_command(args), stdout=subprocess.PIPE,
+                             stderr=err)
+        try:
+            result = list(parser(p.stdout))
+        except etree.ParseError:
+            result = None
+        finally:
+            p.stdout.close()
+            rc = p.wait()
+        if rc != 0 or result is None:
+            err.seek(0)
+            raise gluster_utils.GlusterCmdException(
+                (rc, '', err.read().decode('utf-8', 'replace').strip()))
+    return result
+
+
+def stream(args, parser):
+    """Runs gluster with --xml and yields each record as it is parsed.
+
+    Unlike execute(), nothing is held once it has been yielded, so a
+    listing of any length is read in constant memory. If the consumer
+    stops early, gluster is killed rather than waited for. A failure is
+    only known once gluster exits, after the records it did produce.
+
+    :param parser: one of the iter_* functions in this module
+    :raises GlusterCmdException: if gluster fails
+    """
+    with tempfile.TemporaryFile() as err:
+        p = subprocess.Popen(_command(args), stdout=subprocess.PIPE,
+                             stderr=err)
+        parsed = False
+        try:
+            for record in parser(p.stdout):
+                yield record
+            parsed = True
+        except etree.ParseError:
+            pass
+        except GeneratorExit:
+            p.kill()
+            raise
+        finally:
+            p.stdout.close()
+            rc = p.wait()
+        if rc != 0 or not parsed:
+            err.seek(0)
+            raise gluster_utils.GlusterCmdException(
+                (rc, '', err.read().decode('utf-8', 'replace').strip()))
@@ -0,0 +1,204 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import concurrent.futures
+import json
+import subprocess
+import time
+
+import gluster.cli.utils as gluster_utils
+
+import charmhelpers.core.hookenv as hookenv
+
+# Number of peer probes which may be in flight at the same time.
+DEFAULT_PROBE_CONCURRENCY = 8
+
+# Seconds to wait for a single `gluster peer probe` before giving up on it.
+DEFAULT_PROBE_TIMEOUT = 60
+
+ProbeResult = collections.namedtuple('ProbeResult', ['unit', 'address',
+                                                     'output', 'error',
+                                                     'elapsed'])
+
+
+def probe(address, timeout=DEFAULT_PROBE_TIMEOUT):
+    """Probes a single host into the trusted storage pool.
+
+    This mirrors gluster.cli.peer.probe, but kills the gluster CLI when it
+    does not return within timeout seconds so that an unreachable host
+    cannot hold up the rest of the probes.
+
+    :param address: the hostname or address of the peer to probe
+    :param timeout: the number of seconds to wait for the probe to finish
+    :return: the output of the peer probe command, raises
+        GlusterCmdException((rc, out, err)) on error or timeout
+    """
+    cmd = [gluster_utils.GLUSTERCMD]
+    if gluster_utils.GLUSTERD_SOCKET:
+        cmd.append('--glusterd-sock={0}'.format(
+            gluster_utils.GLUSTERD_SOCKET))
+    cmd += ['--mode=script', 'peer', 'probe', address]
+
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        out, err = p.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        p.kill()
+        out, err = p.communicate()
+        raise gluster_utils.GlusterCmdException(
+            (-1, out, 'peer probe timed out after {0}s'.format(timeout)))
+
+    if p.returncode != 0:
+        raise gluster_utils.GlusterCmdException((p.returncode, out, err))
+
+    return out.strip()
+
+
+def _timed_probe(unit, address, timeout):
+    start = time.time()
+    try:
+        out = probe(address, timeout=timeout)
+        return ProbeResult(unit, address, out, None, time.time() - start)
+    except gluster_utils.GlusterCmdException as e:
+        return ProbeResult(unit, address, None, e, time.time() - start)
+
+
+def probe_all(targets, concurrency=DEFAULT_PROBE_CONCURRENCY,
+              timeout=DEFAULT_PROBE_TIMEOUT):
+    """Probes many peers concurrently.
+
+    At most concurrency probes run at once. A failed or timed out probe is
+    recorded in its result and does not affect the other probes.
+
+    :param targets: an iterable of (unit, address) tuples to probe
+    :param concurrency: the maximum number of probes in flight
+    :param timeout: the per-probe timeout in seconds
+    :return: a list of ProbeResult, in the same order as targets
+    """
+    targets = list(targets)
+    if not targets:
+        return []
+
+    workers = max(1, min(concurrency, len(targets)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_timed_probe, unit, address, timeout)
+                   for (unit, address) in targets]
+        return [f.result() for f in futures]
+
+
+class ProbeLedger(object):
+    """Records which units the leader has already probed into the pool.
+
+    The ledger lives in leader storage as a single compact JSON document::
+
+        {"g": 3, "u": {"gluster/1": ["<peer uuid>", "10.0.0.1", 2], ...}}
+
+    where "g" is the generation of the last save and each unit maps to the
+    peer UUID, the address it was probed at and the generation in which it
+    was probed. It is read once with load(), updated in memory and written
+    back once by save(), and only if something changed.
+    """
+
+    LEADER_KEY = 'probed-units'
+
+    def __init__(self, entries=None, generation=0):
+        self.generation = generation
+        self._entries = dict(entries or {})
+        self._dirty = False
+
+    @classmethod
+    def load(cls):
+        """Reads the ledger from leader storage.
+
+        :return: ProbeLedger. Unreadable or legacy values yield an empty
+            ledger so that every unit is probed once more.
+        """
+        raw = hookenv.leader_get(cls.LEADER_KEY)
+        if not raw:
+            return cls()
+
+        try:
+            data = json.loads(raw)
+            return cls(entries={u: tuple(e) for u, e in data['u'].items()},
+                       generation=data['g'])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            hookenv.log('Ignoring unreadable %s ledger' % cls.LEADER_KEY,
+                        hookenv.WARNING)
+            return cls()
+
+    def __contains__(self, unit):
+        return unit in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        """Iterates over the recorded unit names, in order."""
+        return iter(sorted(self._entries))
+
+    def address(self, unit):
+        """Returns the address unit was probed at, or None."""
+        entry = self._entries.get(unit)
+        return entry[1] if entry else None
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    def needs_probe(self, unit, address):
+        """Indicates whether the unit has to be probed at address.
+
+        :param unit: the name of the unit, e.g. gluster/1
+        :param address: the address the unit is currently reachable at
+        :return bool: True if the unit has never been probed or was probed
+            at a different address, False otherwise
+        """
+        entry = self._entries.get(unit)
+        return entry is None or entry[1] != address
+
+    def record(self, unit, address, uuid=None):
+        """Records a successful probe of unit at address.
+
+        :param unit: the name of the unit which was probed
+        :param address: the address it was probed at
+        :param uuid: the gluster peer UUID of the unit, if known
+        """
+        entry = (uuid, address, self.generation + 1)
+        current = self._entries.get(unit)
+        if current and current[:2] == entry[:2]:
+            return
+        self._entries[unit] = entry
+        self._dirty = True
+
+    def forget(self, unit):
+        """Removes unit from the ledger, e.g. when it departs."""
+        if self._entries.pop(unit, None) is not None:
+            self._dirty = True
+
+    def save(self):
+        """Writes the ledger to leader storage if it has changed.
+
+        :return bool: True if leader storage was written, False otherwise
+        """
+        if not self._dirty:
+            return False
+
+        self.generation += 1
+        data = {'g': self.generation,
+                'u': {u: list(e) for u, e in self._entries.items()}}
+        hookenv.leader_set({self.LEADER_KEY: json.dumps(
+            data, separators=(',', ':'), sort_keys=True)})
+        self._dirty = False
+        return True
@@ -0,0 +1,231 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Workload tuning presets for the volume_profile option.
+
+A profile is a bundle of volume options, set once on the volume by the
+leader, and sysctls, set on every unit. Either half is applied as a
+whole or not at all: if gluster rejects an option, the options already
+changed are put back, and if the kernel rejects a sysctl, the previous
+file and values are restored.
+"""
+
+import collections
+import os
+import subprocess
+import tempfile
+
+import yaml
+
+import charmhelpers.core.hookenv as hookenv
+
+import charm.openstack.gateway as gateway
+import charm.openstack.options as options
+
+SYSCTL_FILE = '/etc/sysctl.d/50-glusterfs-charm.conf'
+
+Profile = collections.namedtuple('Profile', ['options', 'sysctl'])
+
+# Options shared by the profiles for VM disk images, from gluster's virt
+# group. features.shard is deliberately left out: it only applies to files
+# created after it is turned on and can never be turned off again.
+_VIRT = {
+    'performance.quick-read': 'off',
+    'performance.read-ahead': 'off',
+    'performance.io-cache': 'off',
+    'performance.low-prio-threads': '32',
+    'network.remote-dio': 'enable',
+    'cluster.eager-lock': 'enable',
+    'cluster.quorum-type': 'auto',
+    'cluster.server-quorum-type': 'server',
+    'cluster.data-self-heal-algorithm': 'full',
+    'cluster.locking-scheme': 'granular',
+    'cluster.shd-max-threads': '8',
+    'cluster.shd-wait-qlength': '10000',
+    'client.event-threads': '4',
+    'server.event-threads': '4',
+}
+
+PROFILES = {
+    # Leave the volume at gluster's defaults.
+    'default': Profile(options={}, sysctl={}),
+    # Many small files and directory listings: cache metadata and negative
+    # lookups on the client, and list directories in parallel.
+    'small-file': Profile(options={
+        'features.cache-invalidation': 'on',
+        'features.cache-invalidation-timeout': '600',
+        'performance.stat-prefetch': 'on',
+        'performance.cache-invalidation': 'on',
+        'performance.md-cache-timeout': '600',
+        'network.inode-lru-limit': '200000',
+        'performance.nl-cache': 'on',
+        'performance.nl-cache-timeout': '600',
+        'performance.readdir-ahead': 'on',
+        'performance.parallel-readdir': 'on',
+        'cluster.lookup-optimize': 'on',
+        'client.event-threads': '4',
+        'server.event-threads': '4',
+    }, sysctl={
+        'vm.dirty_ratio': 5,
+        'vm.dirty_background_ratio': 2,
+        'vm.vfs_cache_pressure': 50,
+    }),
+    # Large files read and written end to end: read ahead and write behind
+    # further, and give io-cache and the brick io-threads more room.
+    'large-sequential': Profile(options={
+        'performance.read-ahead': 'on',
+        'performance.read-ahead-page-count': '16',
+        'performance.write-behind': 'on',
+        'performance.write-behind-window-size': '4MB',
+        'performance.io-cache': 'on',
+        'performance.cache-size': '256MB',
+        'performance.io-thread-count': '32',
+        'client.event-threads': '4',
+        'server.event-threads': '4',
+    }, sysctl={
+        'vm.dirty_ratio': 20,
+        'vm.dirty_background_ratio': 10,
+        'net.core.rmem_max': 16777216,
+        'net.core.wmem_max': 16777216,
+    }),
+    # Hypervisors with their disk images on the volume.
+    'vm-image': Profile(options=dict(_VIRT), sysctl={
+        'vm.dirty_ratio': 5,
+        'vm.dirty_background_ratio': 2,
+    }),
+    # Cinder volumes attached over FUSE or libgfapi, which needs qemu to be
+    # let in from unprivileged ports.
+    'openstack-cinder': Profile(options=dict(_VIRT, **{
+        'server.allow-insecure': 'on',
+        'network.ping-timeout': '30',
+    }), sysctl={
+        'vm.dirty_ratio': 5,
+        'vm.dirty_background_ratio': 2,
+    }),
+}
+
+
+def get_profile(name):
+    """Returns the Profile called name.
+
+    :raises ValueError: if there is no such profile
+    """
+    try:
+        return PROFILES[name or 'default']
+    except KeyError:
+        raise ValueError('Unknown volume_profile %s, expected one of %s' %
+                         (name, ', '.join(sorted(PROFILES))))
+
+
+def sysctl_settings(name, extra=None):
+    """Returns the sysctls for a profile, overridden by extra.
+
+    :param extra: the sysctl option, a YAML mapping or dict
+    :return: dict of sysctl name to value
+    """
+    settings = dict(get_profile(name).sysctl)
+    if isinstance(extra, str):
+        extra = yaml.safe_load(extra)
+    settings.update(extra or {})
+    return settings
+
+
+def _read_sysctl(key, proc):
+    try:
+        with open(os.path.join(proc, key.replace('.', '/'))) as f:
+            return ' '.join(f.read().split())
+    except (IOError, OSError):
+        return None
+
+
+def apply_sysctl(settings, path=SYSCTL_FILE, proc='/proc/sys'):
+    """Makes settings the persistent sysctls of this unit.
+
+    The file is replaced atomically and loaded with sysctl -p. If that
+    fails, the previous file and the previous value of every setting are
+    restored.
+
+    :param settings: dict of sysctl name to value
+    :return: True if anything changed
+    :raises CalledProcessError: if the kernel refused the settings
+    """
+    content = ''.join('%s=%s\n' % (k, settings[k]) for k in sorted(settings))
+    try:
+        with open(path) as f:
+            previous = f.read()
+    except (IOError, OSError):
+        previous = None
+    if content == (previous or ''):
+        return False
+
+    live = {k: _read_sysctl(k, proc) for k in settings}
+    _write(path, content)
+    try:
+        subprocess.check_output(['sysctl', '-p', path],
+                                stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as e:
+        hookenv.log('Unable to apply sysctls, restoring the previous ones: '
+                    '%s' % e.output, hookenv.ERROR)
+        if previous is None:
+            os.unlink(path)
+        else:
+            _write(path, previous)
+        for key, value in sorted(live.items()):
+            if value is not None:
+                subprocess.call(['sysctl', '-q', '-w', '%s=%s' % (key, value)])
+        raise
+    return True
+
+
+def _write(path, content):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.sysctl')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(tmp, 0o644)
+    os.rename(tmp, path)
+
+
+def apply_profile(volname, name, previous=None, gw=None):
+    """Sets the volume options of profile name on volname.
+
+    Options set by the previous profile which the new one doesn't set are
+    reset to gluster's default. If gluster rejects any option, every option
+    already changed is set back to the value it had, so the volume is never
+    left half way between two profiles. Options this version of gluster
+    doesn't have are skipped.
+
+    :param previous: the name of the profile last applied, if any
+    :return: options.Result
+    """
+    gw = gw or gateway.get_gateway()
+    profile = get_profile(name)
+    before = dict(gw.volume_get(volname))
+    result = options.apply_options(volname, profile.options, gw=gw)
+    if result.failed:
+        rollback = {k: options.normalise(before[k]) for k in result.changed}
+        if rollback:
+            hookenv.log('Rolling back %s on %s' % (
+                ', '.join(sorted(rollback)), volname), hookenv.WARNING)
+            for group in options.transactions(rollback):
+                gw.volume_set(volname, group)
+        return result
+
+    stale = set()
+    if previous in PROFILES:
+        stale = set(PROFILES[previous].options) - set(profile.options)
+    for key in sorted(stale):
+        gw.volume_reset(volname, key)
+    return result
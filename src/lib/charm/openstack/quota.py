@@ -0,0 +1,401 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import hashlib
+import itertools
+import json
+import os
+import re
+import tempfile
+import time
+
+import yaml
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.unitdata as unitdata
+import gluster.cli.utils as gluster_utils
+
+import charm.openstack.gateway as gateway
+
+# The most quotas reported by one list-volume-quotas run unless a limit is
+# given. Action results are size limited, so a page is kept small.
+DEFAULT_PAGE_SIZE = 100
+
+# Attempts at each quota command, and the seconds before the first retry,
+# doubled after each. Each command is a glusterd transaction holding the
+# volume lock, so the charm runs them one at a time; glusterd still
+# refuses one while an administrator or another peer holds the lock.
+DEFAULT_ATTEMPTS = 4
+DEFAULT_BACKOFF = 0.5
+
+# unitdata keys of the last spec applied from the quotas option and from
+# the apply-quotas action.
+APPLIED_KEY = 'quota-spec'
+ACTION_KEY = 'quota-spec-action'
+
+_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3,
+          'TB': 1024 ** 4, 'PB': 1024 ** 5}
+_SIZE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGTP]?B?)\s*$', re.I)
+
+# A directory's wanted quota: the hard limit in bytes and the soft limit
+# as a percentage of it, or None for gluster's default.
+QuotaSpec = collections.namedtuple('QuotaSpec', [
+    'path', 'hard_limit', 'soft_limit_percent'])
+
+# What reconcile() did.
+#
+# added, changed, removed: sorted paths
+# unchanged: the number of quotas already as wanted
+# failed: dict of path to the error gluster gave
+# elapsed: seconds taken
+# skipped: True if the spec matched the last one applied and nothing ran
+Reconciled = collections.namedtuple('Reconciled', [
+    'added', 'changed', 'removed', 'unchanged', 'failed', 'elapsed',
+    'skipped'])
+
+# quotas: list of model.Quota on the page
+# next_offset: the offset of the next page, or None if this is the last
+Page = collections.namedtuple('Page', ['quotas', 'next_offset'])
+
+
+def under(path, prefix):
+    """Indicates whether path is prefix or a directory below it."""
+    if not prefix:
+        return True
+    prefix = prefix.rstrip('/')
+    return not prefix or path == prefix or path.startswith(prefix + '/')
+
+
+def exceeded(quota):
+    """Indicates whether quota is over its soft or hard limit."""
+    return 'yes' in ((quota.soft_limit_exceeded or '').lower(),
+                     (quota.hard_limit_exceeded or '').lower())
+
+
+def select(quotas, prefix=None, exceeded_only=False):
+    """Yields the quotas matching the filters, without reading ahead."""
+    for quota in quotas:
+        if not under(quota.path or '', prefix):
+            continue
+        if exceeded_only and not exceeded(quota):
+            continue
+        yield quota
+
+
+def page(quotas, offset=0, limit=DEFAULT_PAGE_SIZE):
+    """Takes one page from a stream of quotas.
+
+    Reading stops at the first quota past the page, which is enough to
+    know there is another page; the rest is never parsed.
+
+    :param limit: the page size, 0 for no limit
+    :return: Page
+    """
+    taken = []
+    for index, quota in enumerate(quotas):
+        if index < offset:
+            continue
+        if limit and len(taken) == limit:
+            return Page(taken, index)
+        taken.append(quota)
+    return Page(taken, None)
+
+
+def list_quotas(volname, prefix=None, exceeded_only=False, offset=0,
+                limit=DEFAULT_PAGE_SIZE, gw=None):
+    """Lists one page of a volume's quotas, streamed from gluster.
+
+    :return: Page
+    """
+    gw = gw or gateway.get_gateway()
+    stream = gw.iter_quota_list(volname)
+    try:
+        return page(select(stream, prefix, exceeded_only), offset, limit)
+    finally:
+        # Stop gluster if the page ended before its output did.
+        if hasattr(stream, 'close'):
+            stream.close()
+
+
+def to_dict(quota):
+    return collections.OrderedDict([
+        ('path', quota.path),
+        ('hard-limit', quota.hard_limit),
+        ('soft-limit', quota.soft_limit),
+        ('used', quota.used),
+        ('avail', quota.avail),
+        ('soft-limit-exceeded', quota.soft_limit_exceeded),
+        ('hard-limit-exceeded', quota.hard_limit_exceeded),
+    ])
+
+
+def write_quotas(quotas, path):
+    """Writes quotas to path as JSON lines, replacing it atomically.
+
+    :param quotas: an iterable of model.Quota, consumed as it is written
+    :return: the number of quotas written
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.quotas')
+    count = 0
+    try:
+        with os.fdopen(fd, 'w') as f:
+            for quota in quotas:
+                f.write(json.dumps(to_dict(quota)) + '\n')
+                count += 1
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return count
+
+
+def export_quotas(volname, path, prefix=None, exceeded_only=False,
+                  offset=0, limit=0, gw=None):
+    """Writes a volume's matching quotas to path, see write_quotas().
+
+    :param limit: the most quotas to write, 0 for all of them
+    :return: the number of quotas written
+    """
+    gw = gw or gateway.get_gateway()
+    stream = gw.iter_quota_list(volname)
+    try:
+        return write_quotas(itertools.islice(
+            select(stream, prefix, exceeded_only), offset,
+            offset + limit if limit else None), path)
+    finally:
+        if hasattr(stream, 'close'):
+            stream.close()
+
+
+def parse_size(value):
+    """Returns a size such as 10GB, 512MB or 1073741824 in bytes.
+
+    :raises ValueError: if value isn't a size
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    match = _SIZE.match(str(value))
+    if not match:
+        raise ValueError('Invalid size %s' % value)
+    number, unit = match.groups()
+    unit = unit.upper()
+    if unit and not unit.endswith('B'):
+        unit += 'B'
+    return int(float(number) * _UNITS[unit])
+
+
+def _percent(value):
+    if value is None:
+        return None
+    text = str(value).strip().rstrip('%')
+    try:
+        percent = int(text)
+    except ValueError:
+        raise ValueError('Invalid soft limit %s' % value)
+    if not 0 < percent < 100:
+        raise ValueError('Invalid soft limit %s' % value)
+    return percent
+
+
+def parse_spec(text):
+    """Parses a quota spec.
+
+    The spec is a YAML mapping of directory to hard limit, or to a mapping
+    of hard-limit and soft-limit, e.g.::
+
+        /projects/a: 10GB
+        /projects/b: {hard-limit: 1TB, soft-limit: 90%}
+
+    :param text: YAML, or an already loaded mapping
+    :return: OrderedDict of path to QuotaSpec, sorted by path
+    :raises ValueError: if the spec is malformed
+    """
+    if isinstance(text, str):
+        try:
+            text = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError('Invalid quota spec: %s' % e)
+    if not text:
+        return collections.OrderedDict()
+    if not isinstance(text, dict):
+        raise ValueError('A quota spec must be a mapping of path to limit')
+    spec = collections.OrderedDict()
+    for path in sorted(text):
+        value = text[path]
+        if not str(path).startswith('/'):
+            raise ValueError('Quota path %s must be absolute' % path)
+        path = str(path).rstrip('/') or '/'
+        if isinstance(value, dict):
+            unknown = set(value) - {'hard-limit', 'soft-limit'}
+            if unknown or 'hard-limit' not in value:
+                raise ValueError('Quota on %s needs hard-limit and may have '
+                                 'soft-limit' % path)
+            spec[path] = QuotaSpec(path, parse_size(value['hard-limit']),
+                                   _percent(value.get('soft-limit')))
+        else:
+            spec[path] = QuotaSpec(path, parse_size(value), None)
+    return spec
+
+
+def spec_hash(volname, spec, prune=False):
+    """Returns a digest of everything reconcile() would be asked to do."""
+    document = json.dumps([volname, prune, [list(s) for s in spec.values()]])
+    return hashlib.sha256(document.encode('utf-8')).hexdigest()
+
+
+def _matches(quota, wanted):
+    if quota.hard_limit != wanted.hard_limit:
+        return False
+    if wanted.soft_limit_percent is None:
+        return True
+    try:
+        percent = _percent(quota.soft_limit_percentage)
+    except ValueError:
+        return False
+    return percent == wanted.soft_limit_percent
+
+
+def diff(current, spec, managed=(), prune=False):
+    """Works out how to bring a volume's quotas to spec.
+
+    :param current: the volume's quotas, an iterable of model.Quota
+    :param spec: OrderedDict of path to QuotaSpec, see parse_spec()
+    :param managed: paths set by a previous spec; those no longer in spec
+                    are removed
+    :param prune: remove every quota not in spec, not only managed ones
+    :return: (list of QuotaSpec to add, list of QuotaSpec to change,
+              list of paths to remove, number unchanged)
+    """
+    add, change, remove = [], [], []
+    unchanged = 0
+    seen = set()
+    managed = set(managed)
+    for quota in current:
+        path = (quota.path or '').rstrip('/') or '/'
+        seen.add(path)
+        wanted = spec.get(path)
+        if wanted is None:
+            if prune or path in managed:
+                remove.append(path)
+        elif _matches(quota, wanted):
+            unchanged += 1
+        else:
+            change.append(wanted)
+    add = [wanted for path, wanted in spec.items() if path not in seen]
+    return add, change, sorted(remove), unchanged
+
+
+def _retry(func, attempts, backoff, sleep=time.sleep):
+    """Calls func until it doesn't raise GlusterCmdException, at most
+    attempts times, waiting longer after each failure.
+    """
+    for attempt in range(attempts):
+        try:
+            return func()
+        except gluster_utils.GlusterCmdException:
+            if attempt == attempts - 1:
+                raise
+            sleep(backoff * 2 ** attempt)
+
+
+def apply(volname, add, change, remove, attempts=DEFAULT_ATTEMPTS,
+          backoff=DEFAULT_BACKOFF, gw=None, sleep=time.sleep):
+    """Runs the quota commands for a diff, one at a time.
+
+    Every command is retried on its own, so one path failing doesn't stop
+    the rest.
+
+    :return: dict of path to the error of each command which failed
+    """
+    gw = gw or gateway.get_gateway()
+    tasks = []
+    for wanted in add + change:
+        tasks.append((wanted.path, gw.quota_limit_usage,
+                      (volname, wanted.path, wanted.hard_limit,
+                       wanted.soft_limit_percent)))
+    for path in remove:
+        tasks.append((path, gw.quota_remove_path, (volname, path)))
+
+    failed = {}
+    for path, func, args in tasks:
+        try:
+            _retry(lambda: func(*args), attempts, backoff, sleep)
+        except gluster_utils.GlusterCmdException as e:
+            failed[path] = str(e)
+    return failed
+
+
+def _quota_enabled(volname, gw):
+    for volume in gw.volume_info(volname):
+        value = (volume.options or {}).get('features.quota', 'off')
+        return value.lower() in ('on', 'true', 'yes', 'enable')
+    return False
+
+
+def reconcile(volname, spec, prune=False, force=False,
+              attempts=DEFAULT_ATTEMPTS, key=APPLIED_KEY, kv=None, gw=None):
+    """Makes a volume's quotas match spec.
+
+    The current quotas are listed once and only the differences are
+    applied. If spec is the one last applied without failures, nothing is
+    listed or run unless force is set. Paths set by the last spec and left
+    out of this one are removed; with prune, every other quota is too.
+
+    :param spec: OrderedDict of path to QuotaSpec, see parse_spec()
+    :param key: the unitdata key the applied spec is kept under, so that
+                specs from different sources don't remove each other's paths
+    :return: Reconciled
+    """
+    start = time.time()
+    if kv is None:
+        kv = unitdata.kv()
+    gw = gw or gateway.get_gateway()
+    applied = kv.get(key) or {}
+    digest = spec_hash(volname, spec, prune)
+    if not force and applied.get('hash') == digest:
+        return Reconciled([], [], [], len(spec), {}, time.time() - start,
+                          True)
+
+    managed = []
+    if applied.get('volume') == volname:
+        managed = applied.get('paths', [])
+    enabled = _quota_enabled(volname, gw)
+    if spec and not enabled:
+        hookenv.log('Enabling quota on %s' % volname, hookenv.INFO)
+        gw.quota_enable(volname)
+        enabled = True
+    current = gw.iter_quota_list(volname) if enabled else []
+    add, change, remove, unchanged = diff(current, spec, managed, prune)
+    failed = apply(volname, add, change, remove, attempts, gw=gw)
+    for path, error in sorted(failed.items()):
+        hookenv.log('Unable to set the quota on %s of %s: %s' %
+                    (path, volname, error), hookenv.ERROR)
+
+    # Remember the spec only once all of it is in place, so that a
+    # failure is retried next time; paths which failed to be removed stay
+    # managed.
+    kv.set(key, {
+        'volume': volname,
+        'hash': None if failed else digest,
+        'paths': sorted(set(spec) | (set(remove) & set(failed))),
+    })
+    return Reconciled(added=sorted(w.path for w in add),
+                      changed=sorted(w.path for w in change),
+                      removed=sorted(set(remove) - set(failed)),
+                      unchanged=unchanged, failed=failed,
+                      elapsed=time.time() - start, skipped=False)
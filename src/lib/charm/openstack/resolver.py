@@ -0,0 +1,251 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Hostname to address resolution for peers and bricks.
+
+Names are resolved in process with getaddrinfo, several at a time, and
+the answers are kept in the unit's key/value store for DEFAULT_TTL
+seconds, or NEGATIVE_TTL seconds for names which didn't resolve, so that
+a hook on a large cluster doesn't wait on DNS for every peer again. Within
+a hook each name is looked up at most once.
+"""
+
+import ipaddress
+import queue
+import socket
+import threading
+import time
+
+import netifaces
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.unitdata as unitdata
+
+CACHE_KEY = 'resolver-cache'
+
+# Seconds a resolved address, and a failed lookup, are trusted for.
+DEFAULT_TTL = 300
+NEGATIVE_TTL = 60
+
+# Number of names looked up at the same time.
+DEFAULT_CONCURRENCY = 8
+
+# Seconds resolve_all() waits for the lookups before giving up on those
+# still running. getaddrinfo itself can't be interrupted, so those are
+# left to finish in daemon threads, which don't hold up the hook's exit.
+DEFAULT_TIMEOUT = 10
+
+# Names which always mean this unit.
+LOCAL_NAMES = ('localhost', 'localhost.localdomain', 'ip6-localhost')
+
+
+def _literal(name):
+    """Returns name as an address if it is one already, or None."""
+    try:
+        return str(ipaddress.ip_address(name.split('%')[0]))
+    except ValueError:
+        return None
+
+
+def _getaddrinfo(name):
+    """Returns the first address name resolves to, preferring IPv4."""
+    try:
+        infos = socket.getaddrinfo(name, None, 0, socket.SOCK_STREAM)
+    except (socket.gaierror, socket.herror, UnicodeError):
+        return None
+    addresses = [info[4][0] for info in infos]
+    for address in addresses:
+        if ':' not in address:
+            return address
+    return addresses[0] if addresses else None
+
+
+def local_addresses():
+    """Returns the set of addresses and names this host is known by."""
+    addresses = set(LOCAL_NAMES)
+    addresses.update((socket.gethostname(), socket.getfqdn()))
+    for iface in netifaces.interfaces():
+        for family in (netifaces.AF_INET, netifaces.AF_INET6):
+            for addr in netifaces.ifaddresses(iface).get(family, []):
+                addresses.add(addr['addr'].split('%')[0])
+    return addresses
+
+
+class Resolver(object):
+    """Resolves hostnames to addresses through a persisted TTL cache.
+
+    Lookups are answered from, in order: the names already resolved in
+    this hook, the unit's key/value store while the entry is fresh, and
+    getaddrinfo. Changes to the store are written by flush(), which
+    resolve_all() calls once when it is done.
+    """
+
+    def __init__(self, kv=None, ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL,
+                 lookup=_getaddrinfo, now=time.time):
+        self._kv = unitdata.kv() if kv is None else kv
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._lookup = lookup
+        self._now = now
+        self._lock = threading.Lock()
+        self._memo = {}
+        self._cache = dict(self._kv.get(CACHE_KEY) or {})
+        self._dirty = False
+        self._local = None
+        self.lookups = 0
+
+    def _cached(self, name):
+        """Returns (True, address or None) for a known name, else
+        (False, None).
+        """
+        with self._lock:
+            if name in self._memo:
+                return True, self._memo[name]
+            entry = self._cache.get(name)
+            if entry and self._now() < entry[1]:
+                self._memo[name] = entry[0]
+                return True, entry[0]
+        return False, None
+
+    def _known(self, name):
+        """Indicates whether name can be answered without a lookup."""
+        return bool(_literal(name) or name in LOCAL_NAMES or
+                    self._cached(name)[0])
+
+    def _store(self, name, address):
+        ttl = self._ttl if address else self._negative_ttl
+        with self._lock:
+            self.lookups += 1
+            self._memo[name] = address
+            self._cache[name] = [address, self._now() + ttl]
+            self._dirty = True
+
+    def resolve(self, name):
+        """Returns the address of name, or None if it doesn't resolve.
+
+        Addresses are returned as they are and the local names as the
+        unit's own address.
+        """
+        if not name:
+            return None
+        literal = _literal(name)
+        if literal:
+            return literal
+        if name in LOCAL_NAMES:
+            return self.get_host_ip()
+        known, address = self._cached(name)
+        if known:
+            return address
+        address = self._lookup(name)
+        self._store(name, address)
+        return address
+
+    def resolve_all(self, names, concurrency=DEFAULT_CONCURRENCY,
+                    timeout=DEFAULT_TIMEOUT):
+        """Resolves many names, looking up those not cached concurrently.
+
+        A lookup still running after timeout seconds is reported as
+        unresolved but not cached, so it is tried again next time.
+
+        :param names: an iterable of hostnames or addresses
+        :return: dict of name to address or None
+        """
+        names = [n for n in dict.fromkeys(names) if n]
+        pending = [n for n in names if not self._known(n)]
+        timed_out = set()
+        if len(pending) > 1:
+            todo = queue.Queue()
+            for name in pending:
+                todo.put(name)
+            answers = queue.Queue()
+
+            def work():
+                while True:
+                    try:
+                        name = todo.get_nowait()
+                    except queue.Empty:
+                        return
+                    answers.put((name, self._lookup(name)))
+
+            # Daemon threads, since the interpreter joins every other
+            # thread at exit, a lookup stuck on DNS included.
+            for _ in range(max(1, min(concurrency, len(pending)))):
+                threading.Thread(target=work, name='resolver',
+                                 daemon=True).start()
+            deadline = time.monotonic() + timeout
+            timed_out = set(pending)
+            while timed_out:
+                try:
+                    name, address = answers.get(
+                        timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                self._store(name, address)
+                timed_out.discard(name)
+        result = {}
+        for name in names:
+            result[name] = None if name in timed_out else self.resolve(name)
+        self.flush()
+        return result
+
+    def get_host_ip(self):
+        """Returns the address this unit is reached at by its peers."""
+        address = hookenv.unit_private_ip()
+        return _literal(address) or self.resolve(address)
+
+    def local_addresses(self):
+        """Returns the set of addresses and names of this host, worked out
+        once per hook.
+        """
+        if self._local is None:
+            self._local = local_addresses()
+        return self._local
+
+    def is_local(self, name):
+        """Indicates whether name refers to this unit."""
+        local = self.local_addresses()
+        return name in local or self.resolve(name) in local
+
+    def flush(self):
+        """Writes the cache back to the key/value store, dropping expired
+        entries, if anything was looked up.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            now = self._now()
+            self._cache = {k: v for k, v in self._cache.items()
+                           if v[1] > now}
+            self._kv.set(CACHE_KEY, self._cache)
+            self._dirty = False
+
+
+_resolver = None
+
+
+def get_resolver():
+    """Returns the resolver for the current hook invocation."""
+    global _resolver
+    if _resolver is None:
+        _resolver = Resolver()
+        hookenv.atexit(_resolver.flush)
+    return _resolver
+
+
+def resolve(name):
+    return get_resolver().resolve(name)
+
+
+def resolve_all(names, concurrency=DEFAULT_CONCURRENCY):
+    return get_resolver().resolve_all(names, concurrency)
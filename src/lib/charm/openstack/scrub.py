@@ -0,0 +1,278 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Control of the bitrot scrubber.
+
+The scrubber reads every file on every brick to verify its checksum,
+which competes with clients for the brick disks. It is only let run
+inside the scrub_window and is paused while any unit reports a self-heal
+backlog or brick disk latency above its threshold. Each unit publishes
+its own pressure on the server relation; the leader takes the worst of
+them and pauses or resumes the volume's scrubber.
+"""
+
+import collections
+import os
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.unitdata as unitdata
+
+from charm.openstack.model import ScrubNode
+
+PEER_RELATION = 'server'
+HEAL_KEY = 'heal-pending'
+LATENCY_KEY = 'disk-latency-ms'
+
+THROTTLES = ('lazy', 'normal', 'aggressive')
+FREQUENCIES = ('hourly', 'daily', 'weekly', 'biweekly', 'monthly')
+
+# The volume options gluster keeps the scrubber settings in.
+BITROT_OPTION = 'features.bitrot'
+SCRUB_OPTION = 'features.scrub'
+THROTTLE_OPTION = 'features.scrub-throttle'
+FREQUENCY_OPTION = 'features.scrub-freq'
+
+# unitdata keys
+DISK_SAMPLE_KEY = 'scrub-disk-sample'
+STATUS_KEY = 'scrub-status'
+
+OUTSIDE_WINDOW = 'outside scrub_window'
+
+# The fraction of the thresholds the pressure must fall to before a paused
+# scrubber is resumed.
+RESUME_FACTOR = 0.5
+
+# The heal backlog and disk latency are published rounded down to a
+# multiple of these, so that small changes don't rewrite the relation, and
+# so wake every peer, on every update-status.
+HEAL_BUCKET = 100
+LATENCY_BUCKET_MS = 5
+
+# Fields of a /proc/diskstats line, after major, minor and name: reads
+# completed, ms spent reading, writes completed and ms spent writing.
+_READS, _READ_MS, _WRITES, _WRITE_MS = 0, 3, 4, 7
+
+Pressure = collections.namedtuple('Pressure', ['heal_pending', 'latency_ms'])
+
+
+def parse_window(text):
+    """Parses a scrub_window such as "22:00-06:00".
+
+    :return: (start, end) in minutes after midnight, or None for no window
+    :raises ValueError: if text is malformed
+    """
+    text = (text or '').strip()
+    if not text:
+        return None
+    try:
+        start, end = [_minutes(t) for t in text.split('-')]
+    except ValueError:
+        raise ValueError('Invalid scrub_window %s, expected HH:MM-HH:MM' %
+                         text)
+    return start, end
+
+
+def _minutes(text):
+    hours, minutes = text.strip().split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(text)
+    return hours * 60 + minutes
+
+
+def in_window(window, now):
+    """Indicates whether now falls in window.
+
+    A window whose end is before its start runs over midnight.
+
+    :param window: see parse_window()
+    :param now: a time.struct_time, in the unit's local time
+    """
+    if window is None:
+        return True
+    start, end = window
+    minute = now.tm_hour * 60 + now.tm_min
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+def device_names(paths, sysfs='/sys'):
+    """Returns the kernel names of the block devices holding paths."""
+    names = set()
+    for path in paths:
+        try:
+            dev = os.stat(path).st_dev
+        except OSError:
+            continue
+        link = os.path.join(sysfs, 'dev', 'block', '%d:%d' % (
+            os.major(dev), os.minor(dev)))
+        if os.path.exists(link):
+            names.add(os.path.basename(os.path.realpath(link)))
+    return sorted(names)
+
+
+def disk_counters(names, proc='/proc'):
+    """Returns the completed I/Os and the milliseconds spent on them,
+    summed over the devices called names.
+
+    :return: (ios, ms)
+    """
+    ios = ms = 0
+    try:
+        with open(os.path.join(proc, 'diskstats'), 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 14 or fields[2] not in names:
+                    continue
+                stats = [int(v) for v in fields[3:]]
+                ios += stats[_READS] + stats[_WRITES]
+                ms += stats[_READ_MS] + stats[_WRITE_MS]
+    except (IOError, OSError, ValueError):
+        pass
+    return ios, ms
+
+
+def disk_latency(names, kv=None, proc='/proc'):
+    """Returns the mean latency in ms of the I/Os completed on the devices
+    since the previous call, or 0 the first time.
+    """
+    if kv is None:
+        kv = unitdata.kv()
+    ios, ms = disk_counters(names, proc)
+    previous = kv.get(DISK_SAMPLE_KEY)
+    kv.set(DISK_SAMPLE_KEY, [ios, ms])
+    if not previous or ios <= previous[0]:
+        return 0.0
+    return max(0, ms - previous[1]) / float(ios - previous[0])
+
+
+def publish_pressure(pressure):
+    """Tells the peers this unit's heal backlog and disk latency, rounded
+    to HEAL_BUCKET and LATENCY_BUCKET_MS, if they changed.
+    """
+    settings = {
+        HEAL_KEY: str(pressure.heal_pending -
+                      pressure.heal_pending % HEAL_BUCKET),
+        LATENCY_KEY: str(int(pressure.latency_ms) -
+                         int(pressure.latency_ms) % LATENCY_BUCKET_MS),
+    }
+    for rid in hookenv.relation_ids(PEER_RELATION):
+        published = hookenv.relation_get(
+            rid=rid, unit=hookenv.local_unit()) or {}
+        if any(published.get(k) != v for k, v in settings.items()):
+            hookenv.relation_set(relation_id=rid, relation_settings=settings)
+
+
+def cluster_pressure(local):
+    """Returns the worst heal backlog and disk latency of this unit and
+    its peers.
+
+    :param local: this unit's Pressure
+    :return: Pressure
+    """
+    heal_pending, latency = local
+    for rid in hookenv.relation_ids(PEER_RELATION):
+        for unit in hookenv.related_units(rid):
+            data = hookenv.relation_get(rid=rid, unit=unit) or {}
+            try:
+                heal_pending = max(heal_pending,
+                                   int(data.get(HEAL_KEY) or 0))
+                latency = max(latency, float(data.get(LATENCY_KEY) or 0))
+            except ValueError:
+                continue
+    return Pressure(heal_pending, latency)
+
+
+def decide(window_open, pressure, max_heal_pending, max_latency_ms,
+           paused=False):
+    """Decides whether the scrubber may run.
+
+    A paused scrubber is only resumed once the pressure has fallen to
+    RESUME_FACTOR of the thresholds, so that the scrubber's own load
+    doesn't flip it between running and paused on every update-status.
+
+    :param window_open: whether now is within scrub_window
+    :param pressure: the cluster's Pressure
+    :param max_heal_pending: the heal backlog to pause at, 0 to ignore
+    :param max_latency_ms: the disk latency to pause at, 0 to ignore
+    :param paused: whether the scrubber is paused now
+    :return: (True, None) to run, or (False, the reason to pause)
+    """
+    if not window_open:
+        return False, OUTSIDE_WINDOW
+    factor = RESUME_FACTOR if paused else 1.0
+    heal_limit = max_heal_pending * factor
+    if max_heal_pending and pressure.heal_pending > heal_limit:
+        return False, 'heal backlog %d' % pressure.heal_pending
+    if max_latency_ms and pressure.latency_ms > max_latency_ms * factor:
+        return False, 'disk latency %.0fms' % pressure.latency_ms
+    return True, None
+
+
+def local_node(status, local):
+    """Returns this unit's ScrubNode from a ScrubStatus, or None.
+
+    :param local: the set of addresses this host is known by
+    """
+    for node in status.nodes:
+        if node.node in local:
+            return node
+    return None
+
+
+def save_status(volume, node, paused, kv=None):
+    """Keeps this unit's scrub progress for collect-metrics and status,
+    which mustn't ask gluster themselves.
+
+    :param node: the ScrubNode of this unit, or None
+    :param paused: the reason the scrubber is paused, or None
+    """
+    if kv is None:
+        kv = unitdata.kv()
+    kv.set(STATUS_KEY, {
+        'volume': volume,
+        'node': node._asdict() if node else None,
+        'paused': paused,
+    })
+
+
+def load_status(kv=None):
+    """Returns (volume, ScrubNode or None, paused reason) as saved by
+    save_status(), or None.
+    """
+    if kv is None:
+        kv = unitdata.kv()
+    saved = kv.get(STATUS_KEY)
+    if not saved:
+        return None
+    node = saved.get('node')
+    return (saved.get('volume'), ScrubNode(**node) if node else None,
+            saved.get('paused'))
+
+
+def status_message(saved):
+    """Describes scrub progress for the workload status, or returns None
+    when there's nothing worth reporting.
+    """
+    if not saved:
+        return None
+    volume, node, paused = saved
+    if node is not None and node.errors:
+        return 'Bitrot scrub found %d corrupted files on %s' % (
+            node.errors, volume)
+    # Pausing outside the window is routine and not worth a status.
+    if paused and paused != OUTSIDE_WINDOW:
+        return 'Scrub of %s paused: %s' % (volume, paused)
+    return None
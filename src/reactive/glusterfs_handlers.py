@@ -13,10 +13,14 @@
 # limitations under the License.
 
 import charm.openstack.glusterfs as glusterfs
+import charm.openstack.instrumentation as instrumentation
 import charms.reactive as reactive
 
+instrumentation.install()
+
 
 @reactive.when_not('installed')
+@instrumentation.timed
 def install_packages():
     """Install packages for glusterfs"""
     glusterfs.install()
@@ -24,6 +28,7 @@ def install_packages():
 
 
 @reactive.when('server.connected')
+@instrumentation.timed
 def peer_available(peer):
     """
     The peer.available state is set when there are one or more peer units
@@ -35,6 +40,7 @@ def peer_available(peer):
 
 
 @reactive.when('storage.available')
+@instrumentation.timed
 def storage_available():
     """
     The storage.available state is set when local disks are available to
@@ -45,13 +51,160 @@ def storage_available():
     glusterfs.prepare_storage()
 
 
+@reactive.hook('update-status')
+@instrumentation.timed
+def update_status():
+    """Pauses or resumes the bitrot scrubber and rebalances the virtual
+    IPs, then refreshes the workload status, including any self-heal
+    backlog."""
+    if reactive.is_state('volume.created'):
+        glusterfs.control_scrub()
+    if reactive.is_state('config.set.virtual_ip_addresses'):
+        glusterfs.configure_ctdb()
+    glusterfs.assess_status()
+
+
+@reactive.when('volume.created', 'config.changed')
+@instrumentation.timed
+def control_scrub():
+    """
+    Applies bitrot_detection and the scrub options when the config changes.
+    update-status also runs this to follow the scrub window and the load on
+    the bricks.
+
+    :return:
+    """
+    glusterfs.control_scrub()
+
+
 @reactive.when('bricks.available', 'peering.complete')
 @reactive.when_not('volume.created')
+@instrumentation.timed
 def create_volume():
     """
+    Once bricks are prepared and every peer has been probed, the leader
+    creates the volume from the bricks offered so far.
 
     :return:
     """
+    glusterfs.create_volume()
+
+
+@reactive.when('volume.created', 'server.connected', 'peering.complete')
+@instrumentation.timed
+def expand_volume(peer):
+    """
+    Adds bricks offered by new peers, or new devices on existing ones, to
+    the volume and rebalances it, once every peer is in the pool.
+
+    :return:
+    """
+    glusterfs.expand_volume()
+
+
+@reactive.when_any('config.changed.volume_profile', 'config.changed.sysctl')
+@instrumentation.timed
+def apply_sysctl():
+    """
+    Sets the sysctls of the volume_profile and sysctl options whenever
+    either changes.
+
+    :return:
+    """
+    glusterfs.apply_sysctl()
+
+
+@reactive.when('installed', 'config.changed.virtual_ip_addresses')
+@instrumentation.timed
+def configure_ctdb():
+    """
+    Writes the CTDB configuration for virtual_ip_addresses. update-status
+    and the peer relation hooks run this too, so that the leader
+    rebalances the virtual IPs after units join, leave or fail.
+
+    :return:
+    """
+    glusterfs.configure_ctdb()
+
+
+@reactive.hook('server-relation-{joined,changed,departed}')
+@instrumentation.timed
+def ctdb_peers_changed(*args):
+    """
+    Updates the CTDB node list and virtual IP placement when a peer joins,
+    leaves or publishes a different load.
+
+    :return:
+    """
+    if (reactive.is_state('installed') and
+            reactive.is_state('config.set.virtual_ip_addresses')):
+        glusterfs.configure_ctdb()
+
+
+@reactive.when('volume.created')
+@reactive.when_not('clients.published')
+@instrumentation.timed
+def publish_client_contract():
+    """
+    Publishes the volume, the servers to fail over to and the mount
+    options to the fuse and nfs relations once the volume exists, and again
+    whenever the options, the clients or the peers change.
+
+    :return:
+    """
+    glusterfs.publish_client_contract()
+
+
+@reactive.when_any('config.changed.volume_name',
+                   'config.changed.volume_profile',
+                   'config.changed.virtual_ip_addresses')
+@instrumentation.timed
+def client_options_changed():
+    reactive.remove_state('clients.published')
+
+
+@reactive.hook('fuse-relation-{joined,changed}',
+               'nfs-relation-{joined,changed}',
+               'server-relation-{joined,changed,departed}')
+@instrumentation.timed
+def clients_changed(*args):
+    reactive.remove_state('clients.published')
+
+
+@reactive.when('volume.created')
+@reactive.when_not('quotas.applied')
+@instrumentation.timed
+def apply_quotas():
+    """
+    Sets the directory quotas of the quotas option once the volume exists,
+    and again when the option changes or a previous attempt failed.
+
+    :return:
+    """
+    glusterfs.apply_quotas()
+
+
+@reactive.when_any('config.changed.volume_name', 'config.changed.quotas')
+@instrumentation.timed
+def quotas_changed():
+    reactive.remove_state('quotas.applied')
+
+
+@reactive.when('volume.created')
+@reactive.when_not('volume.profiled')
+@instrumentation.timed
+def apply_volume_profile():
+    """
+    Tunes the volume for the workload named by volume_profile once it
+    exists, and again whenever the option changes.
+
+    :return:
+    """
+    glusterfs.apply_volume_profile()
 
-#
 
+@reactive.when_any('config.changed.volume_name',
+                   'config.changed.volume_profile')
+@instrumentation.timed
+def volume_profile_changed():
+    reactive.remove_state('volume.profiled')
@@ -15,3 +15,24 @@
 import sys
 
 sys.path.append('src')
+sys.path.append('src/lib')
+
+
+class FakeKV(object):
+    """An in-memory stand-in for the unit's key/value store.
+
+    Like a dict it is false while empty, so code taking kv=None must test
+    for None rather than fall back on kv or unitdata.kv().
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        self.data[key] = value
@@ -0,0 +1,137 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from charm.openstack import blocktune
+from charm.openstack.devices import BlockDevice
+
+
+def _write(path, content):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class TestBlockTune(unittest.TestCase):
+    def setUp(self):
+        self.sysfs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sysfs)
+        # md0 is a mirror of a partition on sda and the whole of nvme0n1.
+        self.disk('sda', 'noop [deadline] cfq', rotational='1')
+        self.disk('nvme0n1', '[mq-deadline] kyber none', rotational='0')
+        part = os.path.join(self.sysfs, 'devices', 'sda', 'sda1')
+        _write(os.path.join(part, 'partition'), '1')
+        os.symlink(part, os.path.join(self.sysfs, 'class', 'block', 'sda1'))
+        self.disk('md0', 'none', rotational='0')
+        os.makedirs(os.path.join(self.sysfs, 'block', 'md0', 'slaves'))
+        for slave in ('sda1', 'nvme0n1'):
+            os.symlink(os.path.join(self.sysfs, 'class', 'block', slave),
+                       os.path.join(self.sysfs, 'block', 'md0', 'slaves',
+                                    slave))
+
+    def disk(self, name, scheduler, rotational):
+        path = os.path.join(self.sysfs, 'devices', name)
+        for attr, value in (('scheduler', scheduler),
+                            ('rotational', rotational),
+                            ('read_ahead_kb', '128'),
+                            ('rq_affinity', '1')):
+            _write(os.path.join(path, 'queue', attr), value)
+        for link in ('block', os.path.join('class', 'block')):
+            if not os.path.isdir(os.path.join(self.sysfs, link)):
+                os.makedirs(os.path.join(self.sysfs, link))
+            os.symlink(path, os.path.join(self.sysfs, link, name))
+
+    def read(self, name, attr):
+        with open(os.path.join(self.sysfs, 'block', name, 'queue',
+                               attr)) as f:
+            return f.read()
+
+    def testParseScheduler(self):
+        self.assertEqual((['noop', 'deadline', 'cfq'], 'deadline'),
+                         blocktune.parse_scheduler('noop [deadline] cfq'))
+        self.assertEqual(([], None), blocktune.parse_scheduler(None))
+
+    def testChooseScheduler(self):
+        mq = ['mq-deadline', 'kyber', 'bfq', 'none']
+        self.assertEqual('mq-deadline',
+                         blocktune.choose_scheduler('deadline', mq, False))
+        self.assertEqual('none',
+                         blocktune.choose_scheduler('noop', mq, False))
+        self.assertEqual('none', blocktune.choose_scheduler('auto', mq, False))
+        self.assertEqual('deadline', blocktune.choose_scheduler(
+            'auto', ['noop', 'deadline', 'cfq'], True))
+        self.assertIsNone(blocktune.choose_scheduler('kyber', ['none'], True))
+
+    def testParseSettings(self):
+        self.assertEqual({'read_ahead_kb': '4096'},
+                         blocktune.parse_settings('{ read_ahead_kb: 4096 }'))
+        with self.assertRaises(ValueError):
+            blocktune.parse_settings('{ max_sectors_kb: 1 }')
+
+    def testStack(self):
+        self.assertEqual(['md0', 'nvme0n1', 'sda'],
+                         blocktune.stack('md0', self.sysfs))
+        self.assertEqual(['sda'], blocktune.stack('sda1', self.sysfs))
+
+    def testPlanAndApply(self):
+        index = mock.MagicMock()
+        index.get.side_effect = lambda path: {
+            '/dev/sda': BlockDevice(
+                'sda', '/dev/sda', 'disk', 0, True, (), (), None, None,
+                'SATA_DISK_1', '0x5000c500a1b2c3d4', ())}.get(path)
+        tunings = blocktune.plan(['md0'], 'auto', {'read_ahead_kb': '4096'},
+                                 index=index, sysfs=self.sysfs)
+        self.assertEqual([
+            ('md0', 'KERNEL=="md0"', {'scheduler': 'none',
+                                      'read_ahead_kb': '4096'}),
+            ('nvme0n1', 'KERNEL=="nvme0n1"', {'scheduler': 'none',
+                                              'read_ahead_kb': '4096'}),
+            ('sda', 'ENV{ID_WWN}=="0x5000c500a1b2c3d4"',
+             {'scheduler': 'deadline', 'read_ahead_kb': '4096'}),
+        ], [(t.name, t.match, dict(t.attributes)) for t in tunings])
+
+        written, failed = blocktune.apply(tunings, self.sysfs)
+        # md0 and sda already have their scheduler.
+        self.assertEqual([('md0', 'read_ahead_kb', '4096'),
+                          ('nvme0n1', 'scheduler', 'none'),
+                          ('nvme0n1', 'read_ahead_kb', '4096'),
+                          ('sda', 'read_ahead_kb', '4096')], written)
+        self.assertEqual([], failed)
+        self.assertEqual('none', self.read('nvme0n1', 'scheduler'))
+        self.assertEqual('4096', self.read('sda', 'read_ahead_kb'))
+
+        rules = blocktune.render_rules(tunings)
+        self.assertIn('ENV{DEVTYPE}=="disk", '
+                      'ENV{ID_WWN}=="0x5000c500a1b2c3d4", '
+                      'ATTR{queue/scheduler}="deadline", '
+                      'ATTR{queue/read_ahead_kb}="4096"\n', rules)
+
+    @mock.patch('charm.openstack.blocktune.subprocess')
+    def testWriteRules(self, _subprocess):
+        path = os.path.join(self.sysfs, '60-test.rules')
+        self.assertTrue(blocktune.write_rules('# rules\n', path))
+        self.assertFalse(blocktune.write_rules('# rules\n', path))
+        _subprocess.call.assert_called_once_with(
+            ['udevadm', 'control', '--reload-rules'])
+
+
+if __name__ == "__main__":
+    unittest.main()
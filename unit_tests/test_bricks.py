@@ -0,0 +1,96 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from charm.openstack import bricks
+
+
+class TestControllerOf(unittest.TestCase):
+    def setUp(self):
+        self.sysfs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sysfs)
+        devices = os.path.join(self.sysfs, 'devices')
+        self._disk('sdb', os.path.join(
+            devices, 'pci0000:00', '0000:00:01.0', '0000:03:00.0',
+            'host0', 'target0:0:1', '0:0:1:0'))
+        os.makedirs(os.path.join(self.sysfs, 'class', 'block', 'dm-0'))
+
+    def _disk(self, name, device_dir):
+        os.makedirs(device_dir)
+        block = os.path.join(self.sysfs, 'class', 'block', name)
+        os.makedirs(block)
+        os.symlink(device_dir, os.path.join(block, 'device'))
+
+    def testPhysical(self):
+        self.assertEqual('0000:03:00.0',
+                         bricks.controller_of('/dev/sdb', self.sysfs))
+
+    def testVirtual(self):
+        self.assertEqual('virtual',
+                         bricks.controller_of('/dev/dm-0', self.sysfs))
+
+
+class TestPrepareAll(unittest.TestCase):
+    def testFailuresAreCollected(self):
+        def prepare(device):
+            if device == '/dev/sdc':
+                raise IOError('mkfs failed')
+
+        progress = []
+        result = bricks.prepare_all(
+            ['/dev/sdb', '/dev/sdc', '/dev/sdd'], prepare,
+            progress=lambda *args: progress.append(args),
+            controller=lambda d: 'hba0')
+        self.assertEqual(['/dev/sdb', '/dev/sdd'], result.prepared)
+        self.assertEqual(['/dev/sdc'], list(result.failed.keys()))
+        self.assertEqual([1, 2, 3], sorted(p[0] for p in progress))
+
+    def testPerControllerLimit(self):
+        lock = threading.Lock()
+        running = {'hba0': 0, 'hba1': 0}
+        peak = {'hba0': 0, 'hba1': 0}
+
+        def controller(device):
+            return 'hba0' if device < '/dev/sdm' else 'hba1'
+
+        def prepare(device):
+            key = controller(device)
+            with lock:
+                running[key] += 1
+                peak[key] = max(peak[key], running[key])
+            time.sleep(0.01)
+            with lock:
+                running[key] -= 1
+
+        devices = ['/dev/sd%s' % c for c in 'bcdefghijklmnopqrstuvwxy']
+        result = bricks.prepare_all(devices, prepare, per_controller=2,
+                                    controller=controller)
+        self.assertEqual(devices, result.prepared)
+        self.assertEqual({'hba0': 2, 'hba1': 2}, peak)
+
+    def testEmpty(self):
+        self.assertEqual(([], {}), bricks.prepare_all([], None))
+
+    def testBrickMountPoint(self):
+        self.assertEqual('/mnt/sdb', bricks.brick_mount_point('/dev/sdb'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import mock
+
+from charm.openstack import brickstate
+from charm.openstack.devices import BlockDevice
+from unit_tests import FakeKV
+
+sdb = BlockDevice(name='sdb', path='/dev/sdb', devtype='disk', size=0,
+                  rotational=True, holders=(), partitions=(), fs_type='xfs',
+                  fs_uuid='6a0f2e8c-0b5e-4f4e-9d3c-44f0c2a5b1e7',
+                  serial='ST4000_Z1Z0', wwn='0x5000c500a1b2c3d4', links=())
+
+
+class TestBrickStateStore(unittest.TestCase):
+    def testIdentity(self):
+        self.assertEqual('0x5000c500a1b2c3d4', brickstate.identity(sdb))
+        self.assertEqual('ST4000_Z1Z0',
+                         brickstate.identity(sdb._replace(wwn=None)))
+        self.assertEqual('/dev/sdb', brickstate.identity(
+            sdb._replace(wwn=None, serial=None)))
+
+    def testConfigHash(self):
+        config = {'filesystem_type': 'xfs', 'inode_size': 512,
+                  'volume_name': 'test'}
+        h = brickstate.config_hash(config)
+        self.assertEqual(h, brickstate.config_hash(
+            dict(config, volume_name='other')))
+        self.assertNotEqual(h, brickstate.config_hash(
+            dict(config, inode_size=1024)))
+
+    def testRoundTrip(self):
+        kv = FakeKV()
+        store = brickstate.BrickStateStore(kv)
+        self.assertFalse(store.is_prepared(sdb))
+        store.record(sdb, '/mnt/sdb', 'abc')
+        store.save()
+
+        store = brickstate.BrickStateStore(kv)
+        self.assertTrue(store.is_prepared(sdb))
+        # The kernel name may change across reboots.
+        self.assertTrue(store.is_prepared(sdb._replace(path='/dev/sdc')))
+        self.assertFalse(store.is_prepared(sdb._replace(fs_uuid=None)))
+        self.assertFalse(store.is_prepared(sdb._replace(fs_uuid='other')))
+        self.assertEqual('/mnt/sdb', store.get(sdb).mount_point)
+
+    @mock.patch('charm.openstack.brickstate.unitdata')
+    def testEmptyStore(self, _unitdata):
+        kv = FakeKV()
+        store = brickstate.BrickStateStore(kv)
+        store.record(sdb, '/mnt/sdb', 'abc')
+        store.save()
+        self.assertIn(brickstate.BrickStateStore.KEY, kv.data)
+        _unitdata.kv.assert_not_called()
+
+    def testSaveOnlyWhenChanged(self):
+        kv = mock.MagicMock()
+        kv.get.return_value = {
+            '0x5000c500a1b2c3d4': ['0x5000c500a1b2c3d4', '/dev/sdb',
+                                   sdb.fs_uuid, '/mnt/sdb', 'abc']}
+        store = brickstate.BrickStateStore(kv)
+        store.record(sdb, '/mnt/sdb', 'abc')
+        store.save()
+        self.assertFalse(kv.set.called)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import mock
+
+import charmhelpers.core.unitdata as unitdata
+
+# charms.layer comes from the base layer when the charm is built.
+sys.modules.setdefault('charms.layer', mock.MagicMock())
+
+from actions import actions  # noqa: E402
+
+
+class TestApplyQuotas(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.db = os.path.join(self.tmp, '.unit-state.db')
+        patcher = mock.patch.object(unitdata, '_KV', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gw = mock.MagicMock()
+        self.gw.volume_info.return_value = [
+            mock.MagicMock(options={'features.quota': 'on'})]
+        self.gw.iter_quota_list.side_effect = lambda volname: iter([])
+        patcher = mock.patch('charm.openstack.quota.gateway.get_gateway',
+                             return_value=self.gw)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.params = {'volume': 'test', 'prune': False, 'force': False}
+        patcher = mock.patch.object(actions, 'hookenv')
+        self.hookenv = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.hookenv.action_get.side_effect = self.params.get
+
+    def run_action(self, spec):
+        """Runs the action as its own process would, with a fresh store."""
+        self.params['spec'] = spec
+        unitdata._KV = unitdata.Storage(self.db)
+        try:
+            actions.main(['actions/apply-quotas'])
+        finally:
+            unitdata._KV.close()
+            unitdata._KV = None
+        self.assertFalse(self.hookenv.action_fail.called)
+        return self.hookenv.action_set.call_args[0][0]
+
+    def testSpecPersistsAcrossRuns(self):
+        result = self.run_action('/a: 1GB\n/b: 2GB')
+        self.assertEqual(2, result['added'])
+        self.assertFalse(result['skipped'])
+
+        self.gw.reset_mock()
+        result = self.run_action('/a: 1GB\n/b: 2GB')
+        self.assertTrue(result['skipped'])
+        self.assertFalse(self.gw.iter_quota_list.called)
+
+        self.gw.iter_quota_list.side_effect = lambda volname: iter([
+            mock.MagicMock(path='/a', hard_limit=1024 ** 3),
+            mock.MagicMock(path='/b', hard_limit=2 * 1024 ** 3)])
+        result = self.run_action('/a: 1GB')
+        self.assertEqual(1, result['removed'])
+        self.gw.quota_remove_path.assert_called_once_with('test', '/b')
+        self.hookenv._run_atexit.assert_called_with()
@@ -0,0 +1,93 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import mock
+
+from charm.openstack import client
+from charm.openstack.client import Server
+from unit_tests import FakeKV
+
+
+SERVERS = [Server('10.0.0.4', 'az2', 0),
+           Server('10.0.0.3', 'az1', 25),
+           Server('10.0.0.2', 'az1', 3),
+           Server('10.0.0.5', None, 0)]
+
+
+class TestClient(unittest.TestCase):
+    def testOrderServers(self):
+        self.assertEqual(['10.0.0.2', '10.0.0.3', '10.0.0.4', '10.0.0.5'],
+                         client.order_servers(SERVERS, {'az1'}))
+        # Without zones only the load counts, in buckets.
+        self.assertEqual(['10.0.0.2', '10.0.0.4', '10.0.0.5', '10.0.0.3'],
+                         client.order_servers(SERVERS, [None]))
+
+    def testFuseSettings(self):
+        settings = client.fuse_settings('test', '10.0.0.1',
+                                        ['10.0.0.2', '10.0.0.3'],
+                                        'small-file')
+        self.assertEqual('10.0.0.1', settings['volfile-server'])
+        self.assertEqual('10.0.0.2:10.0.0.3',
+                         settings['backup-volfile-servers'])
+        self.assertEqual('backup-volfile-servers=10.0.0.2:10.0.0.3,'
+                         'attribute-timeout=600,entry-timeout=600,'
+                         'negative-timeout=600,fopen-keep-cache',
+                         settings['mount-options'])
+        self.assertEqual('', client.fuse_settings(
+            'test', '10.0.0.1', [], 'default')['mount-options'])
+        self.assertIn('direct-io-mode=enable', client.fuse_settings(
+            'test', '10.0.0.1', [], 'vm-image')['mount-options'])
+
+    def testNfsSettings(self):
+        settings = client.nfs_settings('test', '10.0.0.1',
+                                       ['10.0.0.6', '10.0.0.7'], 'small-file')
+        self.assertEqual('10.0.0.6', settings['server'])
+        self.assertEqual('10.0.0.6 10.0.0.7', settings['addresses'])
+        self.assertEqual('65536', settings['rsize'])
+        self.assertEqual('vers=3,proto=tcp,hard,timeo=600,retrans=2,'
+                         'rsize=65536,wsize=65536', settings['mount-options'])
+        settings = client.nfs_settings('test', '10.0.0.1', [], 'unknown')
+        self.assertEqual('10.0.0.1', settings['server'])
+        self.assertEqual('1048576', settings['wsize'])
+
+    @mock.patch('charm.openstack.client.hookenv')
+    def testPublish(self, hookenv):
+        kv = FakeKV()
+        settings = {'volume': 'test'}
+        self.assertTrue(client.publish('fuse:1', settings, kv))
+        self.assertFalse(client.publish('fuse:1', dict(settings), kv))
+        self.assertTrue(client.publish('fuse:2', settings, kv))
+        self.assertTrue(client.publish('fuse:1', {'volume': 'other'}, kv))
+        self.assertEqual(3, hookenv.relation_set.call_count)
+
+    @mock.patch('charm.openstack.client.unitdata')
+    @mock.patch('charm.openstack.client.hookenv')
+    def testPublishEmptyStore(self, hookenv, unitdata):
+        kv = FakeKV()
+        client.publish('fuse:1', {'volume': 'test'}, kv)
+        self.assertIn('fuse:1', kv.data[client.PUBLISHED_KEY])
+        unitdata.kv.assert_not_called()
+
+    @mock.patch('charm.openstack.client.hookenv')
+    def testClientZones(self, hookenv):
+        hookenv.relation_ids.return_value = ['fuse:1']
+        hookenv.related_units.return_value = ['app/0', 'app/1']
+        hookenv.relation_get.side_effect = [{'availability-zone': 'az1'}, {}]
+        self.assertEqual({'fuse:1': {'az1'}}, client.client_zones('fuse'))
+
+
+if __name__ == "__main__":
+    unittest.main()
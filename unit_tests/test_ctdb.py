@@ -0,0 +1,170 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import ipaddress
+import os
+import shutil
+import tempfile
+import unittest
+
+from charm.openstack import ctdb
+
+CTDB_IP = """\
+|Public IP|Node|
+|10.0.0.6|0|
+|10.0.0.7|1|
+|10.0.0.8|-1|
+"""
+
+CTDB_STATUS = """\
+|Node|IP|Disconnected|Banned|Disabled|Unhealthy|Stopped|Inactive|\
+PartiallyOnline|ThisNode|
+|0|10.0.0.1|0|0|0|0|0|0|0|Y|
+|1|10.0.0.2|1|0|0|0|0|1|0|N|
+|2|10.0.0.3|0|0|0|0|0|0|0|N|
+"""
+
+# 10.0.0.6:2049 <-> 10.0.1.1 and 10.0.1.2, 10.0.0.7:445 <-> 10.0.1.1,
+# and a connection to glusterd.
+PROC_NET_TCP = """\
+  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt
+   0: 0600000A:0801 0101000A:C000 01 00000000:00000000 00:00000000 00000000
+   1: 0600000A:0801 0201000A:C001 01 00000000:00000000 00:00000000 00000000
+   2: 0700000A:01BD 0101000A:C002 01 00000000:00000000 00:00000000 00000000
+   3: 0600000A:5DC7 0301000A:C003 01 00000000:00000000 00:00000000 00000000
+"""
+
+VIPS = ['10.0.0.%d' % i for i in range(6, 12)]
+
+
+def counts(placed):
+    return collections.Counter(placed.values())
+
+
+class TestCtdb(unittest.TestCase):
+    def testParse(self):
+        addresses = ctdb.parse_addresses('10.0.0.6/24 10.0.0.7/24 '
+                                         '2001:db8::7/64 10.0.0.6/24')
+        self.assertEqual(['10.0.0.6/24', '10.0.0.7/24', '2001:db8::7/64'],
+                         [str(a) for a in addresses])
+        with self.assertRaises(ValueError):
+            ctdb.parse_addresses('10.0.0.300/24')
+        self.assertEqual({'10.0.0.6': 0, '10.0.0.7': 1, '10.0.0.8': None},
+                         ctdb.parse_ip_output(CTDB_IP))
+        self.assertEqual({0: True, 1: False, 2: True},
+                         ctdb.parse_status(CTDB_STATUS))
+
+    def testInterfaceFor(self):
+        ifaddresses = {'eth0': [('192.168.1.5', '255.255.255.0')],
+                       'eth1': [('10.0.0.1', '255.255.255.0'),
+                                ('2001:db8::1', '64')]}
+        self.assertEqual('eth1', ctdb.interface_for(
+            ipaddress.ip_interface('10.0.0.6/24'), ifaddresses))
+        self.assertEqual('eth1', ctdb.interface_for(
+            ipaddress.ip_interface('2001:db8::7/64'), ifaddresses))
+        self.assertIsNone(ctdb.interface_for(
+            ipaddress.ip_interface('172.16.0.6/24'), ifaddresses))
+
+    def testClients(self):
+        proc = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, proc)
+        os.makedirs(os.path.join(proc, 'net'))
+        with open(os.path.join(proc, 'net', 'tcp'), 'w') as f:
+            f.write(PROC_NET_TCP)
+        self.assertEqual({'10.0.0.6': 2, '10.0.0.7': 1, '10.0.0.8': 0},
+                         ctdb.clients_per_address(
+                             ['10.0.0.6', '10.0.0.7', '10.0.0.8'], proc))
+
+    def testPublishedClients(self):
+        self.assertEqual({'10.0.0.6': 20, '10.0.0.7': 10},
+                         ctdb.published_clients({'10.0.0.6': 27,
+                                                 '10.0.0.7': 10,
+                                                 '10.0.0.8': 9}))
+
+    def testUpdateNodes(self):
+        nodes = ctdb.update_nodes([], ['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+        self.assertEqual(['10.0.0.1', '10.0.0.2', '10.0.0.3'], nodes)
+        nodes = ctdb.update_nodes(nodes, ['10.0.0.1', '10.0.0.3'])
+        self.assertEqual(['10.0.0.1', '#10.0.0.2', '10.0.0.3'], nodes)
+        self.assertEqual(nodes, ctdb.update_nodes(nodes,
+                                                  ['10.0.0.3', '10.0.0.1']))
+        # A new unit takes a departed unit's line, a returning one its own.
+        nodes = ctdb.update_nodes(nodes, ['10.0.0.1', '10.0.0.3',
+                                          '10.0.0.4'])
+        self.assertEqual(['10.0.0.1', '10.0.0.4', '10.0.0.3'], nodes)
+        nodes = ctdb.update_nodes(['10.0.0.1', '#10.0.0.2'],
+                                  ['10.0.0.1', '10.0.0.2'])
+        self.assertEqual(['10.0.0.1', '10.0.0.2'], nodes)
+
+    def testRender(self):
+        addresses = ctdb.parse_addresses('10.0.0.6/24 10.0.0.7/24')
+        self.assertEqual(
+            '10.0.0.6/24 eth1\n10.0.0.7/24\n',
+            ctdb.render_public_addresses(addresses,
+                                         {addresses[0]: 'eth1'}))
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'ctdb', 'nodes')
+        content = ctdb.render_nodes(['10.0.0.1', '#10.0.0.2'])
+        self.assertEqual('10.0.0.1\n#10.0.0.2\n', content)
+        self.assertTrue(ctdb.write_file(path, content))
+        self.assertFalse(ctdb.write_file(path, content))
+        self.assertEqual(['nodes'], os.listdir(os.path.dirname(path)))
+
+    def testPlanEven(self):
+        placed = ctdb.plan(VIPS, {0: 1, 1: 1, 2: 1})
+        self.assertEqual(set(VIPS), set(placed))
+        self.assertEqual({0: 2, 1: 2, 2: 2}, counts(placed))
+        # Planning again moves nothing.
+        self.assertEqual([], ctdb.moves(placed, ctdb.plan(
+            VIPS, {0: 1, 1: 1, 2: 1}, placed)))
+
+    def testPlanWeighted(self):
+        placed = ctdb.plan(VIPS[:4], {0: 2000, 1: 1000, 2: 1000})
+        self.assertEqual({0: 2, 1: 1, 2: 1}, counts(placed))
+        placed = ctdb.plan(VIPS, {0: 10000, 1: 1000, 2: 1000})
+        self.assertEqual({0: 6}, counts(placed))
+        self.assertEqual({}, ctdb.plan(VIPS, {0: 0}))
+
+    def testPlanFailure(self):
+        placed = ctdb.plan(VIPS, {0: 1, 1: 1, 2: 1})
+        # Node 2 fails: only its addresses move.
+        survivors = ctdb.plan(VIPS, {0: 1, 1: 1}, placed)
+        moved = ctdb.moves(placed, survivors)
+        self.assertEqual(2, len(moved))
+        self.assertTrue(all(m.source == 2 for m in moved))
+        self.assertEqual({0: 3, 1: 3}, counts(survivors))
+        # It comes back and takes two addresses back, no more.
+        back = ctdb.plan(VIPS, {0: 1, 1: 1, 2: 1}, survivors)
+        self.assertEqual(2, len(ctdb.moves(survivors, back)))
+        self.assertEqual({0: 2, 1: 2, 2: 2}, counts(back))
+
+    def testPlanClients(self):
+        current = {'10.0.0.6': 0, '10.0.0.7': 0, '10.0.0.8': 1,
+                   '10.0.0.9': 1}
+        costs = {'10.0.0.6': 41, '10.0.0.7': 1, '10.0.0.8': 21,
+                 '10.0.0.9': 21}
+        placed = ctdb.plan(sorted(current), {0: 1, 1: 1}, current, costs)
+        # Swapping any one address only moves the imbalance around.
+        self.assertEqual(current, placed)
+        costs['10.0.0.7'] = 31
+        placed = ctdb.plan(sorted(current), {0: 1, 1: 1, 2: 1}, current,
+                           costs)
+        moved = ctdb.moves(current, placed)
+        self.assertEqual([(0, 2)], [(m.source, m.target) for m in moved])
+
+
+if __name__ == "__main__":
+    unittest.main()
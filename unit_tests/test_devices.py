@@ -0,0 +1,151 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+import mock
+
+from charm.openstack import bricks
+from charm.openstack import devices
+
+
+class TestDeviceIndex(unittest.TestCase):
+    def setUp(self):
+        self.sysfs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sysfs)
+        self.context = mock.MagicMock()
+        self.context.list_devices.return_value = [
+            self._device('sda', 'disk', size=1000, rotational=1,
+                         links=['/dev/disk/by-id/wwn-0x5000c500a1b2c3d4'],
+                         properties={'ID_SERIAL': 'ST4000_Z1Z0',
+                                     'ID_WWN': '0x5000c500a1b2c3d4'}),
+            self._device('sda1', 'partition', parent='sda', size=900,
+                         properties={'ID_FS_TYPE': 'ext4',
+                                     'ID_FS_UUID': 'abcd'}),
+            self._device('sdb', 'disk', size=2000, rotational=0,
+                         holders=['md0'],
+                         properties={'ID_FS_TYPE': 'linux_raid_member'}),
+            self._device('nvme0n1', 'disk', size=4000, rotational=0,
+                         properties={'ID_SERIAL_SHORT': 'S3EVNX0J'}),
+        ]
+        self.index = devices.DeviceIndex(context=self.context)
+
+    def _device(self, name, devtype, parent=None, size=0, rotational=None,
+                holders=(), links=(), properties=None):
+        if parent:
+            sys_path = os.path.join(self.sysfs, 'block', parent, name)
+        else:
+            sys_path = os.path.join(self.sysfs, 'block', name)
+        os.makedirs(os.path.join(sys_path, 'holders'))
+        for holder in holders:
+            os.mkdir(os.path.join(sys_path, 'holders', holder))
+        with open(os.path.join(sys_path, 'size'), 'w') as f:
+            f.write('%d\n' % size)
+        if rotational is not None:
+            os.mkdir(os.path.join(sys_path, 'queue'))
+            with open(os.path.join(sys_path, 'queue', 'rotational'),
+                      'w') as f:
+                f.write('%d\n' % rotational)
+
+        device = mock.MagicMock(sys_path=sys_path,
+                                device_node='/dev/%s' % name,
+                                device_type=devtype,
+                                device_links=list(links),
+                                properties=properties or {})
+        return device
+
+    def testSingleEnumeration(self):
+        self.assertEqual(4, len(self.index))
+        self.context.list_devices.assert_called_once_with(subsystem='block')
+
+    def testLookup(self):
+        sda = self.index.get('/dev/sda')
+        self.assertEqual(512000, sda.size)
+        self.assertTrue(sda.rotational)
+        self.assertEqual(('sda1',), sda.partitions)
+        self.assertEqual('ST4000_Z1Z0', sda.serial)
+        self.assertEqual('0x5000c500a1b2c3d4', sda.wwn)
+        self.assertIs(sda, self.index.get(
+            '/dev/disk/by-id/wwn-0x5000c500a1b2c3d4'))
+
+    def testPartitionInheritsQueue(self):
+        sda1 = self.index.get('/dev/sda1')
+        self.assertTrue(sda1.rotational)
+        self.assertEqual('ext4', sda1.fs_type)
+        self.assertEqual('abcd', sda1.fs_uuid)
+
+    def testAvailability(self):
+        self.assertFalse(self.index.is_available(self.index.get('/dev/sda')))
+        self.assertFalse(self.index.is_available(self.index.get('/dev/sdb')))
+        nvme = self.index.get('/dev/nvme0n1')
+        self.assertTrue(self.index.is_available(nvme))
+        self.assertFalse(nvme.rotational)
+        self.assertEqual('S3EVNX0J', nvme.serial)
+
+    def testMissing(self):
+        self.assertIsNone(self.index.get('/dev/sdz'))
+
+
+class TestSharedIndex(unittest.TestCase):
+    def tearDown(self):
+        devices.invalidate()
+
+    @mock.patch('charm.openstack.devices.DeviceIndex')
+    def testShared(self, _index):
+        self.assertIs(devices.get_index(), devices.get_index())
+        devices.invalidate()
+        devices.get_index()
+        self.assertEqual(2, _index.call_count)
+
+    @mock.patch('charm.openstack.devices.DeviceIndex')
+    def testConcurrent(self, _index):
+        # Enumerating udev takes a while; workers asking meanwhile wait
+        # for the one index rather than each enumerating.
+        _index.side_effect = lambda: time.sleep(0.01) or mock.Mock()
+        result = bricks.prepare_all(
+            ['/dev/sdb', '/dev/sdc', '/dev/sdd'],
+            lambda device: devices.get_index().get(device),
+            controller=lambda d: 'hba0')
+        self.assertEqual({}, result.failed)
+        self.assertEqual(1, _index.call_count)
+
+
+class TestProbe(unittest.TestCase):
+    @mock.patch('charm.openstack.devices.subprocess.check_output')
+    def testFilesystem(self, check_output):
+        check_output.return_value = (b'DEVNAME=/dev/sdb\nUUID=2a9c-41\n'
+                                     b'TYPE=xfs\nUSAGE=filesystem\n')
+        tags = devices.probe('/dev/sdb')
+        self.assertEqual('2a9c-41', tags['UUID'])
+        self.assertEqual('xfs', tags['TYPE'])
+        check_output.assert_called_once_with(
+            ['blkid', '-p', '-o', 'export', '/dev/sdb'],
+            stderr=subprocess.STDOUT)
+
+    @mock.patch('charm.openstack.devices.subprocess.check_output')
+    def testBlank(self, check_output):
+        check_output.side_effect = subprocess.CalledProcessError(2, 'blkid')
+        self.assertEqual({}, devices.probe('/dev/sdb'))
+        check_output.side_effect = subprocess.CalledProcessError(4, 'blkid')
+        self.assertRaises(subprocess.CalledProcessError, devices.probe,
+                          '/dev/sdb')
+
+
+if __name__ == "__main__":
+    unittest.main()
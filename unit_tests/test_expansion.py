@@ -0,0 +1,116 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from charm.openstack import expansion, layout
+from charm.openstack.layout import Disk
+from charm.openstack.model import RebalanceStatus
+
+GB = 1024 ** 3
+
+
+class TestExpansion(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('charm.openstack.expansion.hookenv')
+        self.hookenv = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(os.environ,
+                                  {'JUJU_AVAILABILITY_ZONE': 'az1'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testLocalBricks(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        bricks = expansion.local_bricks([tmp, os.path.join(tmp, 'gone')])
+        self.assertEqual(1, len(bricks))
+        self.assertEqual(os.path.join(tmp, 'brick'), bricks[0][0])
+        self.assertTrue(os.path.isdir(bricks[0][0]))
+
+    def testPublishAndCollect(self):
+        self.hookenv.relation_ids.return_value = ['server:1']
+        expansion.publish_bricks([['/mnt/sdb/brick', GB]])
+        self.hookenv.relation_set.assert_called_once_with(
+            relation_id='server:1',
+            relation_settings={'bricks': '[["/mnt/sdb/brick",%d]]' % GB,
+                               'zone': 'az1'})
+
+        self.hookenv.related_units.return_value = ['gluster/1', 'gluster/2']
+        self.hookenv.relation_get.side_effect = [
+            {'private-address': '10.0.0.2', 'zone': 'az2',
+             'bricks': json.dumps([['/mnt/sdb/brick', GB]])},
+            {'private-address': '10.0.0.3'},
+        ]
+        self.assertEqual([Disk('10.0.0.1', '/mnt/sdc/brick', GB, 'az1'),
+                          Disk('10.0.0.2', '/mnt/sdb/brick', GB, 'az2')],
+                         expansion.cluster_disks(
+                             '10.0.0.1', [['/mnt/sdc/brick', GB]]))
+
+    def testCollectPoolMembers(self):
+        self.hookenv.relation_ids.return_value = ['server:1']
+        self.hookenv.related_units.return_value = ['gluster/1', 'gluster/2']
+        self.hookenv.relation_get.side_effect = [
+            {'private-address': '10.0.0.2',
+             'bricks': json.dumps([['/mnt/sdb/brick', GB]])},
+            {'private-address': '10.0.0.3',
+             'bricks': json.dumps([['/mnt/sdb/brick', GB]])},
+        ]
+        self.assertEqual([Disk('10.0.0.1', '/mnt/sdc/brick', GB, 'az1'),
+                          Disk('10.0.0.2', '/mnt/sdb/brick', GB, None)],
+                         expansion.cluster_disks(
+                             '10.0.0.1', [['/mnt/sdc/brick', GB]],
+                             members={'10.0.0.2'}))
+
+    def testBatches(self):
+        disks = [Disk('10.0.0.%d' % h, '/mnt/b%d' % d, GB, None)
+                 for h in range(3) for d in range(5)]
+        plan = layout.plan(disks)
+        commands = expansion.batches(plan, max_sets=2)
+        self.assertEqual([6, 6, 3], [len(c) for c in commands])
+        self.assertEqual(plan.bricks, sum(commands, []))
+        self.assertEqual({'replica': 3, 'arbiter': 1},
+                         expansion.add_brick_options(
+                             {'replica': 3, 'arbiter': 1}))
+        self.assertEqual({}, expansion.add_brick_options(
+            {'disperse': 6, 'redundancy': 2}))
+
+    def testFingerprint(self):
+        a = Disk('10.0.0.1', '/mnt/b0', GB, None)
+        b = Disk('10.0.0.2', '/mnt/b0', GB, None)
+        self.assertEqual(expansion.fingerprint([a, b]),
+                         expansion.fingerprint([b, a]))
+        self.assertNotEqual(expansion.fingerprint([a]),
+                            expansion.fingerprint([a, b]))
+
+    def testProgressMessage(self):
+        status = RebalanceStatus(None, 2000, 8 * GB, 7500, 1, 2,
+                                 'in progress', 300.0, 1260)
+        self.assertEqual('Rebalancing test: 2000 files, 8.0 GiB moved, '
+                         '1 failures, ETA 21m',
+                         expansion.progress_message('test', status))
+        self.assertEqual('Rebalancing test: 2000 files, 8.0 GiB moved, '
+                         'running 1h05m',
+                         expansion.progress_message('test', status._replace(
+                             failures=0, time_left=None, runtime=3900.0)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,34 +13,47 @@
 # limitations under the License.
 
 import os
-import sys
+import shutil
+import tempfile
 import unittest
 
-import mock
-from mock import patch
-from result import Ok
+from charm.openstack.fstab import FsEntry, FsTab, brick_entry, parse_line
 
-from reactive.fstab import FsEntry, FsTab
-
-mock_apt = mock.MagicMock()
-sys.modules['apt'] = mock_apt
-mock_apt.apt_pkg = mock.MagicMock()
+BRICK = FsEntry(fs_spec="UUID=0d4a4e4b-b5d3-4f5e-a1b6-2c4ab3e1b0a1",
+                mountpoint="/mnt/sdb",
+                vfs_type="xfs",
+                mount_options=["inode64", "logbsize=256k", "noatime"],
+                dump=False,
+                fsck_order=2)
 
 
 class Test(unittest.TestCase):
-    @patch.object(FsTab, 'save_fstab')
-    def testAddEntry(self, _save_fstab):
-        _save_fstab.return_value = Ok(())
-        fstab = FsTab(os.path.join("unit_tests", "fstab"))
-        result = fstab.add_entry(FsEntry(
-            fs_spec="/dev/test",
-            mountpoint="/mnt/test",
-            vfs_type="xfs",
-            mount_options=["defaults"],
-            dump=False,
-            fsck_order=2
-        ))
-        self.assertTrue(result.is_ok())
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'fstab')
+        shutil.copy(os.path.join("unit_tests", "fstab"), self.path)
+        with open(self.path) as f:
+            self.original = f.read()
+
+    def read(self):
+        with open(self.path) as f:
+            return f.read()
+
+    def testAddEntry(self):
+        fstab = FsTab(self.path)
+        self.assertTrue(fstab.add_entry(BRICK))
+        self.assertEqual(1, fstab.writes)
+        # The fixture's last line has no newline; one is added before the
+        # new entry.
+        self.assertEqual(
+            self.original + "\nUUID=0d4a4e4b-b5d3-4f5e-a1b6-2c4ab3e1b0a1 "
+            "/mnt/sdb xfs inode64,logbsize=256k,noatime 0 2\n", self.read())
+        # Adding the same entry again doesn't touch the file.
+        self.assertFalse(fstab.add_entry(BRICK))
+        self.assertEqual(1, fstab.writes)
+        self.assertEqual(BRICK, FsTab(self.path).get_by_mountpoint(
+            "/mnt/sdb/"))
 
     def testParser(self):
         expected_results = [
@@ -73,11 +86,51 @@ class Test(unittest.TestCase):
                 dump=False,
                 fsck_order=1)
         ]
-        with open('unit_tests/fstab', 'r') as f:
-            fstab = FsTab(os.path.join(os.sep, "fake"))
-            results = fstab.parse_entries(f)
-            for result in results.value:
-                self.assertTrue(result in expected_results)
+        fstab = FsTab(self.path)
+        self.assertEqual(expected_results, fstab.entries())
+        self.assertEqual(expected_results[1], fstab.get_by_uuid(
+            "378F3C86-B21A-4172-832D-E2B3D4BC7511"))
+        self.assertEqual(expected_results[2], fstab.get_by_spec(
+            "/dev/mapper/xubuntu--vg--ssd-swap_1"))
+
+    def testParseEscapes(self):
+        # Characters beyond latin-1 appear as they are; only \NNN is decoded.
+        entry = parse_line('/dev/sdc /mnt/\u6570\u636e\\040d\u00e9j\u00e0'
+                           '\\134x xfs defaults 0 2\n')
+        self.assertEqual('/mnt/\u6570\u636e d\u00e9j\u00e0\\x',
+                         entry.mountpoint)
+
+    def testTransaction(self):
+        fstab = FsTab(self.path)
+        with fstab.transaction():
+            for n in range(24):
+                fstab.add_entry(brick_entry(
+                    "%08d-0000-0000-0000-000000000000" % n, "/mnt/b%d" % n,
+                    "xfs", {"noatime": None, "inode64": None}))
+            self.assertEqual(self.original, self.read())
+        self.assertEqual(1, fstab.writes)
+        self.assertEqual(28, len(FsTab(self.path).entries()))
+
+        with self.assertRaises(RuntimeError):
+            with fstab.transaction():
+                fstab.remove_entry("/mnt/b0")
+                raise RuntimeError()
+        self.assertIsNotNone(fstab.get_by_mountpoint("/mnt/b0"))
+        self.assertEqual(1, fstab.writes)
+
+    def testReplacePreservesLayout(self):
+        fstab = FsTab(self.path)
+        fstab.add_entry(BRICK._replace(mountpoint="/mnt/raid",
+                                       fs_spec="UUID=new"))
+        lines = self.read().splitlines()
+        original = self.original.splitlines()
+        self.assertEqual(len(original), len(lines))
+        self.assertEqual("UUID=new /mnt/raid xfs "
+                         "inode64,logbsize=256k,noatime 0 2", lines[-2])
+        self.assertEqual(original[:-2] + original[-1:],
+                         lines[:-2] + lines[-1:])
+        self.assertTrue(fstab.remove_entry("/mnt/raid"))
+        self.assertIsNone(FsTab(self.path).get_by_uuid("new"))
 
 
 if __name__ == "__main__":
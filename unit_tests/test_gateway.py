@@ -0,0 +1,92 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import mock
+
+import gluster.cli.utils as gluster_utils
+
+from charm.openstack import gateway
+
+
+class TestGlusterGateway(unittest.TestCase):
+    def setUp(self):
+        self.execute = mock.MagicMock(
+            side_effect=lambda args, parser: [' '.join(args)])
+        self.gw = gateway.GlusterGateway(execute=self.execute)
+
+    def testMemoizes(self):
+        self.assertEqual(['pool list'], self.gw.pool_list())
+        self.assertEqual(['pool list'], self.gw.pool_list())
+        self.gw.volume_info('test')
+        self.gw.volume_info('test')
+        self.gw.volume_info('other')
+        self.assertEqual(3, self.execute.call_count)
+        self.assertEqual({'hits': 2, 'misses': 3, 'invalidations': 0,
+                          'cached': 3}, self.gw.stats())
+
+    @mock.patch('charm.openstack.gateway.gluster_volume')
+    def testMutationInvalidates(self, gluster_volume):
+        self.gw.pool_list()
+        self.gw.volume_info()
+        self.gw.volume_info('test')
+        self.gw.volume_info('other')
+        self.gw.volume_status('test')
+        self.gw.volume_set('test', {'nfs.disable': 'on'})
+        gluster_volume.optset.assert_called_once_with(
+            'test', {'nfs.disable': 'on'})
+        # info for test and for all volumes are dropped, the rest is kept.
+        self.assertEqual(2, self.gw.invalidations)
+        self.execute.reset_mock()
+        self.gw.pool_list()
+        self.gw.volume_info('other')
+        self.gw.volume_status('test')
+        self.assertFalse(self.execute.called)
+        self.gw.volume_info()
+        self.gw.volume_info('test')
+        self.assertEqual(2, self.execute.call_count)
+
+    @mock.patch('charm.openstack.gateway.gluster_peer')
+    def testFailedMutationInvalidates(self, gluster_peer):
+        gluster_peer.probe.side_effect = gluster_utils.GlusterCmdException(
+            (1, '', 'failed'))
+        self.gw.peer_status()
+        with self.assertRaises(gluster_utils.GlusterCmdException):
+            self.gw.peer_probe('10.0.0.1')
+        self.gw.peer_status()
+        self.assertEqual(2, self.execute.call_count)
+
+    def testIterQuotaList(self):
+        stream = mock.MagicMock(return_value=iter(['streamed']))
+        gw = gateway.GlusterGateway(execute=self.execute, stream=stream)
+        self.assertEqual(['streamed'], list(gw.iter_quota_list('test')))
+        stream.assert_called_once_with(['volume', 'quota', 'test', 'list'],
+                                       mock.ANY)
+        # Streamed limits aren't cached, but cached ones are reused.
+        self.assertEqual(0, gw.stats()['cached'])
+        gw.quota_list('test')
+        self.assertEqual(['volume quota test list'],
+                         list(gw.iter_quota_list('test')))
+        self.assertEqual(1, stream.call_count)
+
+    def testInvalidateAll(self):
+        self.gw.pool_list()
+        self.gw.quota_list('test')
+        self.gw.invalidate()
+        self.assertEqual(0, self.gw.stats()['cached'])
+
+
+if __name__ == "__main__":
+    unittest.main()
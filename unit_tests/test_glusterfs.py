@@ -0,0 +1,301 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import sys
+import unittest
+
+import mock
+
+from unit_tests import FakeKV
+
+# charms.openstack is only installed with the charm. The charm classes
+# derive from its base classes, so those have to be real classes.
+os_classes = mock.MagicMock()
+os_classes.BaseOpenStackCharm = type('BaseOpenStackCharm', (object,), {})
+os_classes.BaseOpenStackCharmActions = type('BaseOpenStackCharmActions',
+                                            (object,), {})
+os_classes.BaseOpenStackCharmAssessStatus = type(
+    'BaseOpenStackCharmAssessStatus', (object,), {})
+charms_openstack = mock.MagicMock()
+charms_openstack.charm.classes = os_classes
+sys.modules.setdefault('charms_openstack', charms_openstack)
+sys.modules.setdefault('charms_openstack.adapters',
+                       charms_openstack.adapters)
+sys.modules.setdefault('charms_openstack.charm', charms_openstack.charm)
+sys.modules.setdefault('charms_openstack.charm.classes', os_classes)
+
+# charmhelpers refuses to load off Ubuntu.
+with mock.patch('charmhelpers.osplatform.get_platform',
+                return_value='ubuntu'):
+    from charm.openstack import bricks
+    from charm.openstack import devices
+    from charm.openstack import glusterfs
+    from charm.openstack.layout import Disk
+    from charm.openstack.model import Peer, State
+
+import charmhelpers.core.hookenv as hookenv
+
+
+class CharmTestCase(unittest.TestCase):
+    def setUp(self):
+        self.options = {}
+        self.leader = {}
+        self.kv = FakeKV()
+        for name, kwargs in (
+                ('config', {'side_effect': self._config}),
+                ('is_leader', {'return_value': True}),
+                ('leader_get', {'side_effect': self.leader.get}),
+                ('leader_set', {'side_effect': self.leader.update}),
+                ('local_unit', {'return_value': 'gluster/0'}),
+                ('unit_private_ip', {'return_value': '10.0.0.1'}),
+                ('relation_ids', {'return_value': []}),
+                ('related_units', {'return_value': []}),
+                ('relation_get', {}),
+                ('relation_set', {}),
+                ('status_set', {}),
+                ('log', {})):
+            patcher = mock.patch.object(hookenv, name, **kwargs)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('charmhelpers.core.unitdata.kv',
+                             return_value=self.kv)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(glusterfs, 'reactive')
+        self.reactive = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.charm = glusterfs.GlusterFSCharm()
+
+    def _config(self, key=None):
+        return self.options if key is None else self.options.get(key)
+
+
+class TestProbePeers(CharmTestCase):
+    def _ledger(self):
+        return json.loads(self.leader['probed-units'])['u']
+
+    def testForgetsDepartedUnits(self):
+        self.leader['probed-units'] = json.dumps({'g': 1, 'u': {
+            'gluster/1': [None, '10.0.0.2', 1],
+            'gluster/2': [None, '10.0.0.3', 1]}})
+        peer = mock.Mock()
+        peer.ip_map.return_value = [('gluster/1', '10.0.0.2')]
+        self.charm.probe_peers(peer)
+        self.assertEqual(['gluster/1'], list(self._ledger()))
+        self.reactive.set_state.assert_called_once_with('peering.complete')
+
+    @mock.patch('charm.openstack.peering.probe_all')
+    def testWaitsForNewPeers(self, _probe_all):
+        _probe_all.return_value = []
+        peer = mock.Mock()
+        peer.ip_map.return_value = [('gluster/1', '10.0.0.2')]
+        self.charm.probe_peers(peer)
+        self.reactive.remove_state.assert_called_once_with(
+            'peering.complete')
+        self.reactive.set_state.assert_not_called()
+
+    def testNothingDeparted(self):
+        self.leader['probed-units'] = json.dumps({'g': 1, 'u': {
+            'gluster/1': [None, '10.0.0.2', 1]}})
+        peer = mock.Mock()
+        peer.ip_map.return_value = [('gluster/1', '10.0.0.2')]
+        self.charm.probe_peers(peer)
+        self.leader_set.assert_not_called()
+
+
+class TestPrepareBricks(CharmTestCase):
+    def setUp(self):
+        super(TestPrepareBricks, self).setUp()
+        entry = devices.BlockDevice(
+            'sdb', '/dev/sdb', 'disk', 1 << 30, True, [], [], 'ext4',
+            'c8a6d0b3-5f9a-4c1e-9b8e-2a4f6d7e8f90', 'S1', None, [])
+        index = mock.Mock()
+        index.get.return_value = entry
+        for target, kwargs in (
+                ('charm.openstack.devices.get_index',
+                 {'return_value': index}),
+                ('charm.openstack.devices.probe',
+                 {'return_value': {'TYPE': 'ext4'}}),
+                ('charm.openstack.fstab.FsTab', {}),
+                ('charm.openstack.bricks.prepare_all',
+                 {'return_value': bricks.PrepareResult([], {})})):
+            patcher = mock.patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(self.charm, 'is_mounted',
+                                    return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testRefusesExistingData(self):
+        self.charm.prepare_bricks(['/dev/sdb'])
+        bricks.prepare_all.assert_not_called()
+        self.status_set.assert_called_once_with(
+            'blocked', 'Devices hold existing data, set force_reformat to '
+                       'wipe them: /dev/sdb')
+
+    def testForceReformat(self):
+        self.options['force_reformat'] = True
+        self.charm.prepare_bricks(['/dev/sdb'])
+        self.assertEqual(['/dev/sdb'],
+                         bricks.prepare_all.call_args[0][0])
+
+    def testBlankDevice(self):
+        devices.probe.return_value = {}
+        self.charm.prepare_bricks(['/dev/sdb'])
+        self.assertEqual(['/dev/sdb'],
+                         bricks.prepare_all.call_args[0][0])
+
+
+class TestClusterDisks(CharmTestCase):
+    def setUp(self):
+        super(TestClusterDisks, self).setUp()
+        self.relation_ids.return_value = ['server:1']
+        self.related_units.return_value = ['gluster/1', 'gluster/2',
+                                           'gluster/3']
+        offers = {
+            'gluster/1': '10.0.0.2',
+            'gluster/2': '10.0.0.3',
+            'gluster/3': '10.0.0.4',
+        }
+        self.relation_get.side_effect = lambda rid=None, unit=None: {
+            'private-address': offers[unit],
+            'bricks': json.dumps([['/mnt/sdb/brick', 1024]])}
+        self.leader['probed-units'] = json.dumps({'g': 1, 'u': {
+            'gluster/3': [None, '10.0.0.4', 1]}})
+        self.gw = mock.Mock()
+        # gluster/1 was probed by name, gluster/2 is still being probed.
+        self.gw.peer_status.return_value = [
+            Peer(None, 'gluster-1', State.PeerInCluster),
+            Peer(None, '10.0.0.3', State.ProbeSentToPeer)]
+        for target, kwargs in (
+                ('charm.openstack.gateway.get_gateway',
+                 {'return_value': self.gw}),
+                ('charm.openstack.resolver.resolve_all',
+                 {'side_effect': lambda names: {
+                     n: '10.0.0.2' for n in names if n == 'gluster-1'}}),
+                ('charm.openstack.expansion.local_bricks',
+                 {'return_value': []})):
+            patcher = mock.patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def testOnlyPoolMembers(self):
+        self.assertEqual(
+            [Disk('10.0.0.2', '/mnt/sdb/brick', 1024, None),
+             Disk('10.0.0.4', '/mnt/sdb/brick', 1024, None)],
+            self.charm._cluster_disks())
+
+    def testPeerStatusFails(self):
+        self.gw.peer_status.side_effect = (
+            glusterfs.gluster_utils.GlusterCmdException((1, '', 'down')))
+        self.assertEqual(
+            [Disk('10.0.0.4', '/mnt/sdb/brick', 1024, None)],
+            self.charm._cluster_disks())
+
+
+class TestConfigureCtdb(CharmTestCase):
+    def setUp(self):
+        super(TestConfigureCtdb, self).setUp()
+        self.options['virtual_ip_addresses'] = '10.0.0.100/24'
+        self.relation_ids.return_value = ['server:1']
+        self.published = {}
+        self.relation_get.side_effect = (
+            lambda rid=None, unit=None: dict(self.published)
+            if unit == 'gluster/0' else {})
+        self.relation_set.side_effect = (
+            lambda relation_id=None, relation_settings=None:
+            self.published.update(relation_settings))
+        self.is_leader.return_value = False
+        for target, kwargs in (
+                ('charm.openstack.ctdb.interface_for',
+                 {'return_value': 'eth0'}),
+                ('charm.openstack.ctdb.nic_speed',
+                 {'return_value': 10000}),
+                ('charm.openstack.ctdb.clients_per_address', {})):
+            patcher = mock.patch(target, **kwargs)
+            setattr(self, target.rsplit('.', 1)[1], patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def testUnchangedLoadIsNotRepublished(self):
+        self.clients_per_address.return_value = {'10.0.0.100': 13}
+        self.charm.configure_ctdb()
+        self.assertEqual({'ctdb-weight': '10000',
+                          'ctdb-clients': '{"10.0.0.100": 10}'},
+                         self.published)
+        self.clients_per_address.return_value = {'10.0.0.100': 17}
+        self.charm.configure_ctdb()
+        self.assertEqual(1, self.relation_set.call_count)
+        self.clients_per_address.return_value = {'10.0.0.100': 21}
+        self.charm.configure_ctdb()
+        self.assertEqual(2, self.relation_set.call_count)
+        self.assertEqual('{"10.0.0.100": 20}', self.published['ctdb-clients'])
+
+
+class TestPublishClientContract(CharmTestCase):
+    def setUp(self):
+        super(TestPublishClientContract, self).setUp()
+        self.options.update(volume_name='test', volume_profile='vm-image')
+        self.relation_ids.side_effect = lambda relation: {
+            'server': ['server:1'], 'fuse': ['fuse:2']}.get(relation, [])
+        self.related_units.side_effect = lambda rid: {
+            'server:1': ['gluster/1']}.get(rid, [])
+        self.published = {'fuse-clients': '10'}
+        self.relation_get.side_effect = lambda rid=None, unit=None: (
+            dict(self.published) if unit == 'gluster/0' else
+            {'private-address': '10.0.0.2'} if unit == 'gluster/1' else {})
+        patcher = mock.patch(
+            'charm.openstack.metrics.established_remotes',
+            return_value={'10.0.1.%d' % i for i in range(12)})
+        self.remotes = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testOnlyChangesArePublished(self):
+        self.charm.publish_client_contract()
+        self.assertEqual(['fuse:2'], [c[1]['relation_id'] for c in
+                                      self.relation_set.call_args_list])
+        self.assertIn('fuse:2', self.kv.data['client-contract'])
+        self.reactive.set_state.assert_called_once_with('clients.published')
+
+        self.relation_set.reset_mock()
+        self.remotes.return_value = {'10.0.1.%d' % i for i in range(25)}
+        self.charm.publish_client_contract()
+        self.relation_set.assert_called_once_with(
+            relation_id='server:1',
+            relation_settings={'fuse-clients': '20'})
+
+
+class TestApplyQuotas(CharmTestCase):
+    def setUp(self):
+        super(TestApplyQuotas, self).setUp()
+        self.options.update(volume_name='test', quotas='{/a: 1GB}')
+        patcher = mock.patch('charm.openstack.quota.reconcile')
+        self.reconcile = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testApplied(self):
+        self.reconcile.return_value.failed = {}
+        self.charm.apply_quotas()
+        self.reactive.set_state.assert_called_once_with('quotas.applied')
+
+    def testFailedIsRetried(self):
+        self.reconcile.return_value.skipped = False
+        self.reconcile.return_value.failed = {'/a': 'busy'}
+        self.charm.apply_quotas()
+        self.reactive.set_state.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
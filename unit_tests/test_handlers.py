@@ -0,0 +1,110 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import importlib
+import inspect
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import mock
+
+
+class HandlersTestCase(unittest.TestCase):
+    def setUp(self):
+        # charmhelpers refuses to load off Ubuntu, and the charm class needs
+        # the packages of a deployed unit.
+        patcher = mock.patch('charmhelpers.osplatform.get_platform',
+                             return_value='ubuntu')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.glusterfs = mock.MagicMock()
+        patcher = mock.patch.dict(sys.modules, {
+            'charm.openstack.glusterfs': self.glusterfs})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Other tests may have imported the real module already.
+        patcher = mock.patch('charm.openstack.glusterfs', self.glusterfs,
+                             create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sys.modules.pop('reactive.glusterfs_handlers', None)
+        self.addCleanup(sys.modules.pop, 'reactive.glusterfs_handlers', None)
+        self.bus = importlib.import_module('charms.reactive.bus')
+        self.bus.Handler.clear()
+        self.addCleanup(self.bus.Handler.clear)
+
+
+class TestHandlers(HandlersTestCase):
+    def testOneHandlerPerFunction(self):
+        with mock.patch('charm.openstack.instrumentation.hookenv'):
+            handlers = importlib.import_module('reactive.glusterfs_handlers')
+        functions = sorted(
+            name for name, f in inspect.getmembers(handlers,
+                                                   inspect.isfunction)
+            if f.__module__ == handlers.__name__)
+        registered = sorted(h.id().rsplit(':', 1)[1]
+                            for h in self.bus.Handler.get_handlers())
+        self.assertEqual(functions, registered)
+        self.assertIn('configure_ctdb', registered)
+
+
+class TestDispatch(HandlersTestCase):
+    """Runs the handlers as a hook would, against a real flag store."""
+
+    def setUp(self):
+        super(TestDispatch, self).setUp()
+        with mock.patch('charm.openstack.instrumentation.hookenv'):
+            importlib.import_module('reactive.glusterfs_handlers')
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        unitdata = importlib.import_module('charmhelpers.core.unitdata')
+        patcher = mock.patch.object(
+            unitdata, '_KV', unitdata.Storage(os.path.join(tmp, 'kv.db')))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name in ('log', 'hook_name'):
+            patcher = mock.patch('charmhelpers.core.hookenv.%s' % name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.reactive = importlib.import_module('charms.reactive')
+        for flag in ('installed', 'volume.created', 'clients.published',
+                     'quotas.applied', 'volume.profiled'):
+            self.reactive.set_state(flag)
+
+    def dispatch(self, hook):
+        self.glusterfs.reset_mock()
+        self.hook_name.return_value = hook
+        self.bus.dispatch()
+
+    def testUpdateStatus(self):
+        self.dispatch('update-status')
+        self.assertTrue(self.glusterfs.assess_status.called)
+        self.assertFalse(self.glusterfs.publish_client_contract.called)
+        self.assertFalse(self.glusterfs.apply_quotas.called)
+        self.assertFalse(self.glusterfs.apply_volume_profile.called)
+
+    def testClientJoins(self):
+        self.dispatch('fuse-relation-joined')
+        self.assertTrue(self.glusterfs.publish_client_contract.called)
+        self.assertFalse(self.glusterfs.apply_quotas.called)
+
+    def testOptionChanged(self):
+        self.reactive.set_state('config.changed.quotas')
+        self.dispatch('config-changed')
+        self.assertTrue(self.glusterfs.apply_quotas.called)
+        self.assertFalse(self.glusterfs.apply_volume_profile.called)
+        self.assertFalse(self.glusterfs.publish_client_contract.called)
@@ -12,26 +12,75 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import sys
+import os
+import shutil
+import tempfile
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
-import mock
+from charm.openstack import heal
+from unit_tests import FakeKV
 
-from lib.gluster import heal
 
-mock_apt = MagicMock()
-sys.modules['apt'] = mock_apt
-mock_apt.apt_pkg = MagicMock()
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
 
+    def make_brick(self, name, entries):
+        path = os.path.join(self.tmp, name)
+        index = os.path.join(path, heal.INDEX)
+        os.makedirs(index)
+        for entry in ['xattrop-7b1a'] + entries:
+            open(os.path.join(index, entry), 'w').close()
+        return path
 
-class Test(unittest.TestCase):
-    @mock.patch('os.listdir')
-    def testGetHealCount(self, _listdir):
-        _listdir.return_value = ['xattrop_one', 'healme', 'andme']
-        brick = MagicMock(path='/export/brick1/')
+    def testGetHealCount(self):
+        path = self.make_brick('brick1', ['healme', 'andme'])
+        brick = MagicMock(path=path)
         count = heal.get_self_heal_count(brick)
         self.assertEqual(2, count, "Expected 2 objects to need healing")
+        self.assertEqual(0, heal.get_self_heal_count(self.tmp))
+
+    def testThreshold(self):
+        path = self.make_brick('brick1', [str(i) for i in range(10)])
+        self.assertEqual(4, heal.get_self_heal_count(path, threshold=3))
+        self.assertTrue(heal.is_healing(path, threshold=9))
+        self.assertFalse(heal.is_healing(path, threshold=10))
+
+    def testSummarise(self):
+        one = self.make_brick('brick1', ['a', 'b'])
+        two = self.make_brick('brick2', ['c', 'd', 'e'])
+        three = self.make_brick('brick3', [])
+        summary = heal.summarise([('test', one), ('test', two),
+                                  ('other', three)], limit=2)
+        self.assertEqual(heal.HealSummary('test', 4, 2, True),
+                         summary['test'])
+        self.assertEqual(heal.HealSummary('other', 0, 1, False),
+                         summary['other'])
+        self.assertEqual('Self-heal pending: test (4+)',
+                         heal.status_message(summary))
+
+    def testCachedSummary(self):
+        kv = FakeKV()
+        path = self.make_brick('brick1', ['a'])
+        bricks = [('test', path)]
+        summary = heal.cached_summary(bricks, kv=kv, now=1000)
+        self.assertEqual(1, summary['test'].pending)
+        open(os.path.join(path, heal.INDEX, 'b'), 'w').close()
+        summary = heal.cached_summary(bricks, kv=kv, now=1000 + 10)
+        self.assertEqual(1, summary['test'].pending)
+        summary = heal.cached_summary(bricks, kv=kv,
+                                      now=1000 + heal.DEFAULT_TTL)
+        self.assertEqual(2, summary['test'].pending)
+
+    @patch('charm.openstack.heal.unitdata')
+    def testCachedSummaryEmptyStore(self, _unitdata):
+        kv = FakeKV()
+        heal.cached_summary([('test', self.make_brick('brick1', []))],
+                            kv=kv, now=1000)
+        self.assertIn('heal-summary', kv.data)
+        _unitdata.kv.assert_not_called()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,116 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import mock
+
+from charm.openstack import instrumentation
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        patcher = mock.patch('charm.openstack.instrumentation.hookenv')
+        self.hookenv = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.hookenv.charm_dir.return_value = self.tmp
+        self.hookenv.hook_name.return_value = 'config-changed'
+        state = dict(instrumentation._state, handlers=[], commands={},
+                     subprocesses=0)
+        patcher = mock.patch.dict(instrumentation._state, state)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testTimedHandler(self):
+        @instrumentation.timed
+        def handler(peer):
+            """A handler."""
+            instrumentation._TrackedPopen(['true']).wait()
+            return peer
+
+        self.assertEqual('peer', handler('peer'))
+        self.assertEqual('handler', handler.__name__)
+        record = instrumentation.snapshot()
+        self.assertEqual(1, len(record['handlers']))
+        self.assertEqual('handler', record['handlers'][0]['name'])
+        self.assertEqual(1, record['handlers'][0]['subprocesses'])
+        self.assertEqual(1, record['commands']['true'][0])
+
+    def testInstall(self):
+        instrumentation._state['installed'] = False
+        instrumentation.install()
+        instrumentation.install()
+        self.assertIs(instrumentation._Popen, subprocess.Popen)
+        self.hookenv.atexit.assert_called_once_with(instrumentation.flush)
+
+    def testTracking(self):
+        with instrumentation.tracking():
+            self.assertIs(instrumentation._TrackedPopen, subprocess.Popen)
+            with instrumentation.tracking():
+                subprocess.check_output(['echo', 'hello'])
+            self.assertIs(instrumentation._TrackedPopen, subprocess.Popen)
+        self.assertIs(instrumentation._Popen, subprocess.Popen)
+        subprocess.check_output(['echo', 'hello'])
+        self.assertEqual([1, mock.ANY],
+                         instrumentation.snapshot()['commands']['echo'])
+
+    def testTimedKeepsActionId(self):
+        def first():
+            pass
+
+        def second():
+            pass
+
+        first, second = instrumentation.timed(first), instrumentation.timed(
+            second)
+        self.assertNotEqual(first._action_id, second._action_id)
+        self.assertTrue(first._action_id.endswith(':first'))
+        self.assertTrue(second._short_action_id.endswith(':second'))
+
+    def testFlushTrims(self):
+        path = os.path.join(self.tmp, instrumentation.TIMELINE)
+        with mock.patch.object(instrumentation, 'MAX_HOOKS', 3):
+            for _ in range(5):
+                instrumentation.flush()
+        records = instrumentation.read_timeline(path)
+        self.assertEqual(3, len(records))
+        self.assertEqual('config-changed', records[-1]['hook'])
+
+    def testSlowestHandlers(self):
+        records = [
+            {'handlers': [{'name': 'install_packages', 'wall': 30.0,
+                           'cpu': 2.0, 'subprocesses': 12},
+                          {'name': 'peer_available', 'wall': 1.0,
+                           'cpu': 0.1, 'subprocesses': 1}]},
+            {'handlers': [{'name': 'peer_available', 'wall': 45.0,
+                           'cpu': 0.2, 'subprocesses': 30}]},
+        ]
+        costs = instrumentation.slowest_handlers(count=1, records=records)
+        self.assertEqual(1, len(costs))
+        self.assertEqual('peer_available', costs[0].name)
+        self.assertEqual(2, costs[0].calls)
+        self.assertEqual(23.0, costs[0].mean_wall)
+        self.assertEqual(31, costs[0].subprocesses)
+        costs = instrumentation.slowest_handlers(hooks=1, records=records)
+        self.assertEqual(['peer_available'], [c.name for c in costs])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from charm.openstack import layout
+from charm.openstack.layout import Disk
+
+TB = 1024 ** 4
+
+
+def disks(hosts, per_host, size=TB, zones=None):
+    return [Disk('10.0.0.%d' % h, '/mnt/brick%d' % d, size,
+                 zones[h % len(zones)] if zones else None)
+            for h in range(1, hosts + 1) for d in range(per_host)]
+
+
+class TestLayout(unittest.TestCase):
+    def testVolumeOptions(self):
+        self.assertEqual((3, {'replica': 3}, True), layout.volume_options(
+            'Distributed-Replicate', 3, 1))
+        self.assertEqual((3, {'replica': 3, 'arbiter': 1}, True),
+                         layout.volume_options('Arbiter', 3, 1))
+        self.assertEqual((4, {'replica': 2, 'stripe': 2}, True),
+                         layout.volume_options(
+                             'Distributed-Striped-Replicate', 2, 2))
+        self.assertEqual((6, {'disperse': 6, 'redundancy': 2}, False),
+                         layout.volume_options('Disperse', 6, 2))
+        self.assertRaises(ValueError, layout.volume_options, 'Mirror', 3, 1)
+
+    def testReplicaSetsSpanHosts(self):
+        plan = layout.plan(disks(4, 3))
+        self.assertEqual(4, len(plan.sets))
+        self.assertEqual([], plan.unplaced)
+        for s in plan.sets:
+            self.assertEqual(3, len({d.host for d in s}))
+        self.assertEqual({'replica': 3}, plan.options)
+        self.assertEqual(12, len(set(plan.bricks)))
+
+    def testZoneSpread(self):
+        plan = layout.plan(disks(6, 2, zones=['az1', 'az2', 'az3']))
+        self.assertEqual(4, len(plan.sets))
+        for s in plan.sets:
+            self.assertEqual(3, len({d.zone for d in s}))
+
+    def testCapacityBalance(self):
+        mixed = [d._replace(size=TB * (4 if d.path == '/mnt/brick0' else 1))
+                 for d in disks(3, 2)]
+        plan = layout.plan(mixed, 'Arbiter', 3, 1)
+        self.assertEqual([{4 * TB}, {TB}],
+                         [{d.size for d in s} for s in plan.sets])
+
+    def testNotDistributed(self):
+        plan = layout.plan(disks(3, 2), 'Disperse', 3, 1)
+        self.assertEqual(1, len(plan.sets))
+        self.assertEqual(3, len(plan.unplaced))
+        plan = layout.plan(disks(3, 2), 'Disperse', 3, 1,
+                           existing=plan.bricks)
+        self.assertEqual([], plan.sets)
+
+    def testIncremental(self):
+        current = layout.plan(disks(3, 2))
+        # One new host can't make a replica 3 set on its own.
+        plan = layout.plan(disks(4, 2), existing=current.bricks)
+        self.assertEqual([], plan.sets)
+        self.assertEqual(2, len(plan.unplaced))
+        # Three can, and nothing already in the volume moves.
+        plan = layout.plan(disks(6, 2), existing=current.bricks)
+        self.assertEqual(2, len(plan.sets))
+        self.assertFalse(set(plan.bricks) & set(current.bricks))
+        # Spare disks on existing hosts are used alongside a new host.
+        spare = disks(3, 3) + disks(4, 2)[6:]
+        plan = layout.plan(spare, existing=current.bricks)
+        self.assertEqual(1, len(plan.sets))
+        self.assertIn('10.0.0.4', {d.host for d in plan.sets[0]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from charm.openstack import metrics
+from charm.openstack.model import ScrubNode
+
+# 10.0.0.2:24007 <-> 10.0.0.1:49152 established, and a listening socket.
+PROC_NET_TCP = """\
+  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt
+   0: 00000000:5DC7 00000000:0000 0A 00000000:00000000 00:00000000 00000000
+   1: 0200000A:5DC7 0100000A:C000 01 00000000:00000000 00:00000000 00000000
+"""
+
+
+def write(path, content):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.glusterd = os.path.join(self.tmp, 'glusterd')
+        self.proc = os.path.join(self.tmp, 'proc')
+        self.brick = os.path.join(self.tmp, 'brick')
+        vol = os.path.join(self.glusterd, 'vols', 'test', 'bricks')
+        write(os.path.join(vol, '10.0.0.2:-brick'),
+              'hostname=10.0.0.2\npath=%s\nlisten-port=49152\n' % self.brick)
+        write(os.path.join(vol, '10.0.0.1:-brick'),
+              'hostname=10.0.0.1\npath=/brick\n')
+        write(os.path.join(self.glusterd, 'peers', 'uuid-1'),
+              'uuid=uuid-1\nstate=3\nhostname1=10.0.0.1\n')
+        write(os.path.join(self.glusterd, 'peers', 'uuid-3'),
+              'uuid=uuid-3\nstate=3\nhostname1=10.0.0.3\n')
+        write(os.path.join(self.proc, 'net', 'tcp'), PROC_NET_TCP)
+        write(os.path.join(self.proc, '42', 'stat'),
+              '42 (glusterfsd x) S 1 42 42 0 -1 4194560 1 0 0 0 '
+              '300 200 0 0 20 0 10 0 100 0 0\n')
+        write(os.path.join(self.proc, '42', 'statm'), '1000 256 10 1 0 1 0\n')
+        index = os.path.join(self.brick, '.glusterfs', 'indices', 'xattrop')
+        for name in ('xattrop-7b1a', 'gfid-1', 'gfid-2'):
+            write(os.path.join(index, name), '')
+
+    def testLocalBricks(self):
+        self.assertEqual([('test', '10.0.0.2', self.brick)],
+                         metrics.local_bricks({'10.0.0.2'}, self.glusterd))
+
+    def testProcessUsage(self):
+        with mock.patch('os.sysconf', side_effect=[100, 4096]):
+            self.assertEqual((5.0, 256 * 4096),
+                             metrics.process_usage(42, self.proc))
+        self.assertEqual((0.0, 0), metrics.process_usage(43, self.proc))
+
+    def testPeers(self):
+        peers = metrics.peers(self.glusterd, self.proc)
+        self.assertEqual([('uuid-1', '10.0.0.1', True, True),
+                          ('uuid-3', '10.0.0.3', True, False)], peers)
+
+    @mock.patch.object(metrics, 'local_addresses')
+    @mock.patch.object(metrics, 'brick_pid')
+    def testCollect(self, brick_pid, local_addresses):
+        local_addresses.return_value = {'10.0.0.2'}
+        brick_pid.return_value = 42
+        sample = metrics.collect(self.glusterd, proc=self.proc)
+        self.assertEqual(1, len(sample.bricks))
+        brick = sample.bricks[0]
+        self.assertTrue(brick.online)
+        self.assertEqual(2, brick.heal_pending)
+        self.assertGreater(brick.size_total, 0)
+
+        values = metrics.juju_metrics(sample)
+        self.assertEqual(1, values['bricks-online'])
+        self.assertEqual(2, values['heal-pending'])
+        self.assertEqual(1, values['peers-connected'])
+        self.assertEqual(2, values['peers-total'])
+
+        text = metrics.prometheus_text(sample)
+        self.assertIn('# TYPE gluster_brick_heal_pending gauge\n', text)
+        self.assertIn('gluster_brick_heal_pending{brick="10.0.0.2:%s",'
+                      'volume="test"} 2\n' % self.brick, text)
+        self.assertIn('gluster_peer_connected{hostname="10.0.0.3",'
+                      'uuid="uuid-3"} 0\n', text)
+
+        self.assertNotIn('gluster_scrub', text)
+        sample = sample._replace(scrub=('test', ScrubNode(
+            'localhost', 20431, 12, '2017-06-18 03:12:41', 3725, 1), None))
+        self.assertEqual(1, metrics.juju_metrics(sample)['scrub-errors'])
+        text = metrics.prometheus_text(sample)
+        self.assertIn('gluster_scrub_errors{volume="test"} 1\n', text)
+        self.assertIn('gluster_scrub_paused{volume="test"} 0\n', text)
+
+        out = os.path.join(self.tmp, 'textfile')
+        metrics.write_textfile(text, out)
+        self.assertEqual([metrics.TEXTFILE_NAME], os.listdir(out))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from charm.openstack import mkfs
+
+# A RAID6 md array of 10 disks with a 256KiB chunk.
+RAID6 = mkfs.Geometry(logical_block_size=512, physical_block_size=4096,
+                      minimum_io_size=262144, optimal_io_size=2097152,
+                      size=0, rotational=True)
+
+# An NVMe drive reporting a 128KiB preferred write size.
+NVME = mkfs.Geometry(logical_block_size=512, physical_block_size=512,
+                     minimum_io_size=4096, optimal_io_size=131072,
+                     size=0, rotational=False)
+
+
+class TestStripe(unittest.TestCase):
+    def testFromConfig(self):
+        self.assertEqual(mkfs.Stripe(128 * 1024, 10),
+                         mkfs.stripe_for(RAID6, 128, 10))
+
+    def testFromGeometry(self):
+        self.assertEqual(mkfs.Stripe(256 * 1024, 8), mkfs.stripe_for(RAID6))
+
+    def testPlainDisk(self):
+        self.assertIsNone(mkfs.stripe_for(mkfs.DEFAULT_GEOMETRY))
+
+    def testNonRotational(self):
+        self.assertIsNone(mkfs.stripe_for(NVME))
+        self.assertIsNone(mkfs.stripe_for(RAID6._replace(rotational=False)))
+
+    def testNonRotationalFromConfig(self):
+        self.assertEqual(mkfs.Stripe(64 * 1024, 4),
+                         mkfs.stripe_for(NVME, 64, 4))
+
+    def testHalfConfigured(self):
+        self.assertRaises(ValueError, mkfs.stripe_for, RAID6, 128, None)
+
+    def testNotPowerOfTwo(self):
+        self.assertRaises(ValueError, mkfs.stripe_for, RAID6, 96, 4)
+
+
+class TestPlan(unittest.TestCase):
+    def testXfsPlainDisk(self):
+        self.assertEqual(['mkfs.xfs', '-f', '-n', 'size=8192',
+                          '-i', 'size=512'],
+                         mkfs.plan('xfs'))
+
+    def testXfsRaid(self):
+        self.assertEqual(['mkfs.xfs', '-f', '-n', 'size=8192',
+                          '-i', 'size=512', '-s', 'size=4096',
+                          '-d', 'su=256k,sw=8', '-l', 'su=256k'],
+                         mkfs.plan('xfs', RAID6))
+
+    def testXfsLargeStripeUnit(self):
+        geometry = RAID6._replace(size=4 * mkfs.GiB * 1024)
+        cmd = mkfs.plan('xfs', geometry, stripe_unit_kb=1024,
+                        stripe_width=4)
+        self.assertIn('su=1m,sw=4', cmd)
+        self.assertIn('su=32k,size=512m', cmd)
+
+    def testXfsLogSize(self):
+        size = 2 * mkfs.GiB * 1024
+        self.assertEqual(['mkfs.xfs', '-f', '-n', 'size=8192',
+                          '-i', 'size=512', '-l', 'size=512m'],
+                         mkfs.plan('xfs', mkfs.DEFAULT_GEOMETRY._replace(
+                             size=size)))
+        self.assertEqual(['mkfs.xfs', '-f', '-n', 'size=8192',
+                          '-i', 'size=512', '-l', 'size=128m'],
+                         mkfs.plan('xfs', NVME._replace(size=size)))
+
+    def testExt4Raid(self):
+        self.assertEqual(['mkfs.ext4', '-F', '-b', '4096', '-I', '256',
+                          '-E', 'stride=64,stripe_width=512'],
+                         mkfs.plan('ext4', RAID6, inode_size=256))
+
+    def testExt4NonRotational(self):
+        self.assertEqual(['mkfs.ext4', '-F', '-b', '4096', '-I', '512'],
+                         mkfs.plan('ext4', NVME))
+
+    def testBtrfs(self):
+        self.assertEqual(['mkfs.btrfs', '-f'], mkfs.plan('btrfs', RAID6))
+
+    def testUnsupported(self):
+        self.assertRaises(ValueError, mkfs.plan, 'zfs')
+
+
+class TestReadGeometry(unittest.TestCase):
+    def setUp(self):
+        self.sysfs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sysfs)
+        queue = os.path.join(self.sysfs, 'class', 'block', 'md0', 'queue')
+        os.makedirs(queue)
+        for name, value in (('logical_block_size', 512),
+                            ('physical_block_size', 4096),
+                            ('minimum_io_size', 262144),
+                            ('optimal_io_size', 2097152),
+                            ('rotational', 1)):
+            with open(os.path.join(queue, name), 'w') as f:
+                f.write('%d\n' % value)
+        with open(os.path.join(queue, '..', 'size'), 'w') as f:
+            f.write('2048\n')
+
+    def testReadGeometry(self):
+        self.assertEqual(RAID6._replace(size=1048576),
+                         mkfs.read_geometry('/dev/md0', self.sysfs))
+
+    def testNonRotational(self):
+        with open(os.path.join(self.sysfs, 'class', 'block', 'md0', 'queue',
+                               'rotational'), 'w') as f:
+            f.write('0\n')
+        self.assertFalse(
+            mkfs.read_geometry('/dev/md0', self.sysfs).rotational)
+
+    def testMissingDevice(self):
+        self.assertEqual(mkfs.DEFAULT_GEOMETRY,
+                         mkfs.read_geometry('/dev/sdz', self.sysfs))
+
+
+if __name__ == "__main__":
+    unittest.main()
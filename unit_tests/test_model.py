@@ -0,0 +1,57 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import uuid
+
+from charm.openstack.model import Brick, Peer, State, Volume
+
+peer1 = Peer(uuid=uuid.UUID('3da2c343-7c67-499d-a6bb-68591cc72bc1'),
+             hostname="server1", status=State.PeerInCluster)
+peer2 = Peer(uuid=uuid.UUID('3da2c343-7c67-499d-a6bb-68591cc72bc2'),
+             hostname="server2", status=State.AcceptedPeerRequest)
+
+
+def brick(peer, path):
+    return Brick(brick_uuid=None, peer=peer, path=path, is_arbiter=False)
+
+
+def volume(bricks):
+    return Volume(name="test", vol_type='Replicate', vol_id=uuid.uuid4(),
+                  status="Started", bricks=bricks, arbiter_count=0,
+                  disperse_count=0, dist_count=0, replica_count=3,
+                  redundancy_count=0, stripe_count=0, transport='tcp',
+                  snapshot_count=0, options={})
+
+
+class TestModel(unittest.TestCase):
+    def testIdentity(self):
+        renamed = peer1._replace(hostname='10.0.0.1', status=None)
+        self.assertEqual(peer1, renamed)
+        self.assertEqual(1, len({peer1, renamed}))
+        self.assertNotEqual(peer1, peer2)
+        self.assertEqual(brick(peer1, '/mnt/brick1'),
+                         brick(renamed, '/mnt/brick1'))
+        self.assertEqual('server1:/mnt/brick1',
+                         brick(peer1, '/mnt/brick1').name)
+        vol = volume([])
+        self.assertEqual(vol, vol._replace(status='Stopped'))
+        self.assertEqual(1, len({vol, vol._replace(bricks=[1])}))
+        with self.assertRaises(AttributeError):
+            peer1.hostname = 'other'
+        self.assertFalse(hasattr(peer1, '__dict__'))
+
+
+if __name__ == "__main__":
+    unittest.main()
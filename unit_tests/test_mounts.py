@@ -0,0 +1,127 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import time
+import unittest
+
+import mock
+
+from charm.openstack import bricks
+from charm.openstack import mounts
+
+MOUNTINFO = """\
+22 28 0:20 / /sys rw,nosuid,nodev,noexec,relatime shared:7 - sysfs sysfs rw
+28 0 252:1 / / rw,relatime shared:1 - ext4 /dev/vda1 rw,data=ordered
+41 28 8:16 / /mnt/sdb rw,noatime shared:30 - xfs /dev/sdb rw,inode64
+42 28 8:16 / /srv/bind rw,noatime shared:30 - xfs /dev/sdb rw,inode64
+43 28 8:32 / /mnt/with\\040space rw shared:31 - xfs /dev/sdc rw
+44 28 8:64 / /mnt/\u6570\u636e\\040\u00e9 rw shared:32 - xfs /dev/sde rw
+"""
+
+
+class TestMountTable(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write(MOUNTINFO)
+        self.addCleanup(os.remove, self.path)
+
+    def testParse(self):
+        table = mounts.MountTable(self.path)
+        self.addCleanup(table.close)
+        self.assertEqual(6, len(table.mounts))
+        self.assertEqual(('/mnt/sdb', '/dev/sdb', 'xfs'), table.mounts[2])
+
+    def testIndexes(self):
+        table = mounts.MountTable(self.path)
+        self.addCleanup(table.close)
+        self.assertTrue(table.is_mounted('/dev/sdb'))
+        self.assertTrue(table.is_mounted('/srv/bind'))
+        self.assertFalse(table.is_mounted('/dev/sdd'))
+        self.assertEqual('/mnt/sdb', table.mount_point('/dev/sdb'))
+        self.assertEqual('/dev/sdc', table.device('/mnt/with space'))
+        self.assertEqual('/dev/sde',
+                         table.device('/mnt/\u6570\u636e \u00e9'))
+        self.assertIsNone(table.mount_point('/dev/sdd'))
+
+    def testClosedIsStale(self):
+        table = mounts.MountTable(self.path)
+        table.close()
+        self.assertTrue(table.stale())
+
+
+class TestSharedTable(unittest.TestCase):
+    def tearDown(self):
+        mounts.invalidate()
+
+    @mock.patch('charm.openstack.mounts.MountTable')
+    def testShared(self, _table):
+        _table.return_value.stale.return_value = False
+        self.assertIs(mounts.get_mount_table(), mounts.get_mount_table())
+        self.assertEqual(1, _table.call_count)
+
+    @mock.patch('charm.openstack.mounts.MountTable')
+    def testInvalidate(self, _table):
+        _table.return_value.stale.return_value = False
+        mounts.get_mount_table()
+        mounts.invalidate()
+        mounts.get_mount_table()
+        self.assertEqual(2, _table.call_count)
+
+    @mock.patch('charm.openstack.mounts.MountTable')
+    def testStale(self, _table):
+        _table.return_value.stale.return_value = True
+        mounts.get_mount_table()
+        mounts.get_mount_table()
+        self.assertEqual(2, _table.call_count)
+
+    @mock.patch('charm.openstack.mounts.MountTable')
+    def testConcurrentPrepare(self, _table):
+        class FakeTable(object):
+            def __init__(self):
+                self.closed = False
+
+            def stale(self):
+                return False
+
+            def is_mounted(self, path):
+                return False
+
+            def close(self):
+                if self.closed:
+                    raise AssertionError('closed twice')
+                self.closed = True
+                # Give the other workers time to find this table still
+                # shared.
+                time.sleep(0.01)
+
+        _table.side_effect = FakeTable
+
+        def prepare(device):
+            # What reformat and mount do for each brick.
+            for _ in range(5):
+                mounts.get_mount_table().is_mounted(device)
+                mounts.invalidate()
+
+        devices = ['/dev/sd%s' % c for c in 'bcdefghi']
+        result = bricks.prepare_all(devices, prepare,
+                                    controller=lambda d: 'hba0')
+        self.assertEqual({}, result.failed)
+        self.assertEqual(devices, result.prepared)
+
+
+if __name__ == "__main__":
+    unittest.main()
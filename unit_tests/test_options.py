@@ -0,0 +1,115 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+
+import mock
+
+import gluster.cli.utils as gluster_utils
+
+from charm.openstack import gateway, options, parsers
+
+
+def vol_get(args, parser):
+    with open(os.path.join('unit_tests', 'vol_get.xml'), 'rb') as f:
+        return parser(f)
+
+
+class TestOptions(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('charm.openstack.options.hookenv')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.execute = mock.MagicMock(side_effect=vol_get)
+        self.gw = gateway.GlusterGateway(execute=self.execute)
+        patcher = mock.patch('charm.openstack.gateway.gluster_volume')
+        self.gluster_volume = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testParse(self):
+        current = dict(vol_get(None, parsers.parse_volume_options))
+        self.assertEqual(6, len(current))
+        self.assertEqual('32MB', current['performance.cache-size'])
+
+    def testDiff(self):
+        changed, unchanged, unknown = options.diff(
+            {'a': 'on', 'b': '16', 'c': 'off (DEFAULT)'},
+            {'a': 'true', 'b': 32, 'c': 'disable', 'd': 'x', 'group': 'virt'})
+        self.assertEqual([('b', '32'), ('group', 'virt')],
+                         list(changed.items()))
+        self.assertEqual(['a', 'c'], unchanged)
+        self.assertEqual(['d'], unknown)
+
+    def testTransactions(self):
+        changed = options.diff({}, {'group': 'virt'})[0]
+        changed.update(('o%d' % i, 'v') for i in range(5))
+        self.assertEqual([1, 2, 2, 1], [
+            len(t) for t in options.transactions(changed, size=2)])
+
+    def testApplyOnlyChanges(self):
+        result = options.apply_options('test', {
+            'cluster.lookup-optimize': 'on',
+            'cluster.rebal-throttle': 'lazy',
+            'performance.cache-size': '32MB',
+            'performance.readdir-ahead': 'enable',
+            'nfs.disable': 'true',
+            'no.such-option': '1',
+        }, gw=self.gw)
+        self.gluster_volume.optset.assert_called_once_with('test', {
+            'cluster.lookup-optimize': 'on',
+            'cluster.rebal-throttle': 'lazy'})
+        self.assertEqual(['nfs.disable', 'performance.cache-size',
+                          'performance.readdir-ahead'], result.unchanged)
+        self.assertEqual(['no.such-option'], result.unknown)
+        self.assertEqual({}, result.failed)
+        self.assertEqual(1, result.transactions)
+
+        # volume set dropped the cached volume get, so it is read again.
+        self.gluster_volume.optset.reset_mock()
+        options.apply_options('test', {'performance.cache-size': '32MB'},
+                              gw=self.gw)
+        self.assertEqual(2, self.execute.call_count)
+        self.assertFalse(self.gluster_volume.optset.called)
+
+    def testFailedTransactionRetriesEachOption(self):
+        def optset(volname, opts):
+            if 'performance.io-thread-count' in opts:
+                raise gluster_utils.GlusterCmdException((1, '', 'bad'))
+        self.gluster_volume.optset.side_effect = optset
+        result = options.apply_options('test', {
+            'cluster.lookup-optimize': 'on',
+            'performance.io-thread-count': '999',
+        }, gw=self.gw)
+        self.assertEqual(['cluster.lookup-optimize'], list(result.changed))
+        self.assertEqual(['performance.io-thread-count'], list(result.failed))
+        self.assertEqual(3, result.transactions)
+
+    def testDryRun(self):
+        result = options.apply_options(
+            'test', {'cluster.lookup-optimize': 'on'}, dry_run=True,
+            gw=self.gw)
+        self.assertEqual(['cluster.lookup-optimize'], list(result.changed))
+        self.assertFalse(self.gluster_volume.optset.called)
+
+    def testParseOptions(self):
+        self.assertEqual({'auth.allow': '10.0.0.1,10.0.0.2', 'a': 'b'},
+                         options.parse_options(
+                             'auth.allow=10.0.0.1,10.0.0.2\n a=b'))
+        with self.assertRaises(ValueError):
+            options.parse_options('novalue')
+
+
+if __name__ == "__main__":
+    unittest.main()
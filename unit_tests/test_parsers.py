@@ -0,0 +1,172 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+import uuid
+
+import gluster.cli.utils as gluster_utils
+
+from charm.openstack import parsers
+from charm.openstack.model import Quota, State
+
+FAILED = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<cliOutput>
+  <opRet>-1</opRet>
+  <opErrno>30800</opErrno>
+  <opErrstr>Volume nope does not exist</opErrstr>
+</cliOutput>
+"""
+
+
+def fixture(name):
+    with open(os.path.join('unit_tests', name), 'rb') as f:
+        return f.read()
+
+
+class TestParsers(unittest.TestCase):
+    def testParsePeerStatus(self):
+        peers = parsers.parse_peer_status(fixture('peer_status.xml'))
+        # Peers compare on their UUID alone, so compare every field.
+        self.assertEqual([
+            {'uuid': uuid.UUID("663bbc5b-c9b4-4a02-8b56-85e05e1b01c8"),
+             'hostname': "172.31.12.7", 'status': State.PeerInCluster},
+            {'uuid': uuid.UUID("15af92ad-ae64-4aba-89db-73730f2ca6ec"),
+             'hostname': "172.31.21.242", 'status': State.PeerInCluster},
+        ], [dict(p._asdict()) for p in peers])
+
+    def testParsePeerList(self):
+        peers = parsers.parse_peer_list(fixture('pool_list.xml'))
+        self.assertEqual(3, len(peers))
+        self.assertEqual(
+            {'uuid': uuid.UUID("cebf02bb-a304-4058-986e-375e2e1e5313"),
+             'hostname': "localhost", 'status': None},
+            dict(peers[2]._asdict()))
+
+    def testParseVolumeList(self):
+        self.assertEqual(['chris'],
+                         parsers.parse_volume_list(fixture('vol_list.xml')))
+
+    def testParseVolumeInfo(self):
+        volumes = parsers.parse_volume_info(fixture('vol_info.xml'))
+        self.assertEqual(1, len(volumes))
+        vol = volumes[0]
+        self.assertEqual('chris', vol.name)
+        self.assertEqual('Distributed-Replicate', vol.vol_type)
+        self.assertEqual(3, vol.replica_count)
+        self.assertEqual('tcp', vol.transport)
+        self.assertEqual(12, len(vol.bricks))
+        self.assertEqual('172.31.12.7', vol.bricks[0].peer.hostname)
+        self.assertEqual(uuid.UUID("663bbc5b-c9b4-4a02-8b56-85e05e1b01c8"),
+                         vol.bricks[0].peer.uuid)
+        self.assertEqual('/mnt/xvdb', vol.bricks[0].path)
+        self.assertFalse(vol.bricks[0].is_arbiter)
+        self.assertEqual(11, len(vol.options))
+        self.assertEqual('Off', vol.options['nfs.disable'])
+
+    def testParseVolumeStatus(self):
+        status = parsers.parse_volume_status(fixture('vol_status.xml'))
+        self.assertEqual(12, len(status))
+        self.assertEqual('/mnt/xvdb', status[0].brick.path)
+        self.assertEqual(49152, status[0].tcp_port)
+        self.assertIsNone(status[0].rdma_port)
+        self.assertTrue(status[0].online)
+        self.assertEqual(23772, status[0].pid)
+
+    def testParseQuotaList(self):
+        quotas = parsers.parse_quota_list(fixture('quota_list.xml'))
+        self.assertEqual([
+            Quota(path="/", hard_limit=10240, soft_limit=8192,
+                  soft_limit_percentage="80%", used=0, avail=10240,
+                  soft_limit_exceeded="No", hard_limit_exceeded="No"),
+            Quota(path="/test2", hard_limit=10240, soft_limit=8192,
+                  soft_limit_percentage="80%", used=0, avail=10240,
+                  soft_limit_exceeded="No", hard_limit_exceeded="No"),
+        ], quotas)
+
+    def testParseRebalanceStatus(self):
+        status = parsers.parse_rebalance_status(
+            fixture('rebalance_status.xml'))
+        self.assertEqual(['localhost', '172.31.12.7', None],
+                         [s.node for s in status])
+        self.assertEqual(2000, status[-1].files)
+        self.assertEqual('in progress', status[-1].status)
+        self.assertEqual(300.0, status[-1].runtime)
+        self.assertEqual(1260, status[-1].time_left)
+        self.assertIsNone(status[0].time_left)
+
+    def testParseScrubStatus(self):
+        status = parsers.parse_scrub_status(fixture('scrub_status.xml'))[0]
+        self.assertEqual('test', status.volume)
+        self.assertEqual('lazy', status.throttle)
+        self.assertEqual(['localhost', '172.31.12.7'],
+                         [n.node for n in status.nodes])
+        self.assertEqual(20431, status.nodes[0].scrubbed)
+        self.assertEqual(3725, status.nodes[0].duration)
+        self.assertEqual(2, status.nodes[1].errors)
+
+    def testOpError(self):
+        with self.assertRaises(gluster_utils.GlusterCmdException) as e:
+            parsers.parse_volume_info(FAILED)
+        self.assertEqual((-1, '', 'Volume nope does not exist'),
+                         e.exception.args[0])
+
+    def testExecute(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        fake = os.path.join(tmp, 'gluster')
+        with open(fake, 'w') as f:
+            f.write('#!/bin/sh\ncat %s\n' %
+                    os.path.abspath('unit_tests/vol_list.xml'))
+        os.chmod(fake, os.stat(fake).st_mode | stat.S_IEXEC)
+        self.addCleanup(gluster_utils.set_gluster_path,
+                        gluster_utils.GLUSTERCMD)
+        gluster_utils.set_gluster_path(fake)
+        self.assertEqual(['chris'], parsers.execute(
+            ['volume', 'list'], parsers.parse_volume_list))
+
+        gluster_utils.set_gluster_path('/bin/false')
+        with self.assertRaises(gluster_utils.GlusterCmdException):
+            parsers.execute(['volume', 'list'], parsers.parse_volume_list)
+
+    def testStream(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        fake = os.path.join(tmp, 'gluster')
+        with open(fake, 'w') as f:
+            f.write('#!/bin/sh\ncat %s\n' %
+                    os.path.abspath('unit_tests/quota_list.xml'))
+        os.chmod(fake, os.stat(fake).st_mode | stat.S_IEXEC)
+        self.addCleanup(gluster_utils.set_gluster_path,
+                        gluster_utils.GLUSTERCMD)
+        gluster_utils.set_gluster_path(fake)
+        args = ['volume', 'quota', 'test', 'list']
+        self.assertEqual(['/', '/test2'], [
+            q.path for q in parsers.stream(args, parsers.iter_quotas)])
+
+        # Stopping early doesn't wait for or fail on the rest.
+        records = parsers.stream(args, parsers.iter_quotas)
+        self.assertEqual('/', next(records).path)
+        records.close()
+
+        gluster_utils.set_gluster_path('/bin/false')
+        with self.assertRaises(gluster_utils.GlusterCmdException):
+            list(parsers.stream(args, parsers.iter_quotas))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import unittest
+
+import mock
+
+import gluster.cli.utils as gluster_utils
+
+from charm.openstack import peering
+
+
+class TestProbe(unittest.TestCase):
+    @mock.patch('charm.openstack.peering.subprocess.Popen')
+    def testProbe(self, _popen):
+        _popen.return_value.communicate.return_value = (
+            b'peer probe: success. \n', b'')
+        _popen.return_value.returncode = 0
+        out = peering.probe('172.31.21.242', timeout=5)
+        self.assertEqual(b'peer probe: success.', out)
+        _popen.assert_called_with(['gluster', '--mode=script', 'peer',
+                                   'probe', '172.31.21.242'],
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE)
+        _popen.return_value.communicate.assert_called_with(timeout=5)
+
+    @mock.patch('charm.openstack.peering.subprocess.Popen')
+    def testProbeTimeout(self, _popen):
+        _popen.return_value.communicate.side_effect = [
+            subprocess.TimeoutExpired('gluster', 5), (b'', b'')]
+        self.assertRaises(gluster_utils.GlusterCmdException,
+                          peering.probe, '172.31.21.242', timeout=5)
+        _popen.return_value.kill.assert_called_with()
+
+    @mock.patch('charm.openstack.peering.subprocess.Popen')
+    def testProbeFailure(self, _popen):
+        _popen.return_value.communicate.return_value = (b'', b'failed')
+        _popen.return_value.returncode = 1
+        self.assertRaises(gluster_utils.GlusterCmdException,
+                          peering.probe, '172.31.21.242')
+
+
+class TestProbeAll(unittest.TestCase):
+    @mock.patch('charm.openstack.peering.probe')
+    def testProbeAll(self, _probe):
+        def fake_probe(address, timeout):
+            if address == '10.0.0.2':
+                raise gluster_utils.GlusterCmdException((1, b'', b'dead'))
+            return b'success'
+
+        _probe.side_effect = fake_probe
+        targets = [('gluster/1', '10.0.0.1'),
+                   ('gluster/2', '10.0.0.2'),
+                   ('gluster/3', '10.0.0.3')]
+        results = peering.probe_all(targets, concurrency=2, timeout=5)
+        self.assertEqual(['gluster/1', 'gluster/2', 'gluster/3'],
+                         [r.unit for r in results])
+        self.assertIsNone(results[0].error)
+        self.assertIsNotNone(results[1].error)
+        self.assertIsNone(results[2].error)
+        self.assertEqual(b'success', results[2].output)
+
+    def testProbeAllEmpty(self):
+        self.assertEqual([], peering.probe_all([]))
+
+
+class TestProbeLedger(unittest.TestCase):
+    @mock.patch('charm.openstack.peering.hookenv')
+    def testLoadEmpty(self, _hookenv):
+        _hookenv.leader_get.return_value = None
+        ledger = peering.ProbeLedger.load()
+        self.assertEqual(0, len(ledger))
+        self.assertTrue(ledger.needs_probe('gluster/1', '10.0.0.1'))
+
+    @mock.patch('charm.openstack.peering.hookenv')
+    def testLoadLegacy(self, _hookenv):
+        _hookenv.leader_get.return_value = "['gluster/1']"
+        ledger = peering.ProbeLedger.load()
+        self.assertEqual(0, len(ledger))
+
+    @mock.patch('charm.openstack.peering.hookenv')
+    def testRoundTrip(self, _hookenv):
+        _hookenv.leader_get.return_value = None
+        ledger = peering.ProbeLedger.load()
+        ledger.record('gluster/1', '10.0.0.1',
+                      '663bbc5b-c9b4-4a02-8b56-85e05e1b01c8')
+        ledger.record('gluster/2', '10.0.0.2')
+        self.assertTrue(ledger.save())
+        settings = _hookenv.leader_set.call_args[0][0]
+        self.assertEqual(['probed-units'], list(settings.keys()))
+
+        _hookenv.leader_get.return_value = settings['probed-units']
+        ledger = peering.ProbeLedger.load()
+        self.assertEqual(1, ledger.generation)
+        self.assertFalse(ledger.needs_probe('gluster/1', '10.0.0.1'))
+        self.assertTrue(ledger.needs_probe('gluster/1', '10.0.0.9'))
+        self.assertTrue(ledger.needs_probe('gluster/3', '10.0.0.3'))
+        self.assertEqual(['gluster/1', 'gluster/2'], list(ledger))
+        self.assertEqual('10.0.0.2', ledger.address('gluster/2'))
+        self.assertIsNone(ledger.address('gluster/3'))
+
+        ledger.forget('gluster/2')
+        self.assertTrue(ledger.save())
+        _hookenv.leader_get.return_value = (
+            _hookenv.leader_set.call_args[0][0]['probed-units'])
+        ledger = peering.ProbeLedger.load()
+        self.assertEqual(['gluster/1'], list(ledger))
+        self.assertTrue(ledger.needs_probe('gluster/2', '10.0.0.2'))
+
+    @mock.patch('charm.openstack.peering.hookenv')
+    def testSaveUnchanged(self, _hookenv):
+        ledger = peering.ProbeLedger(
+            entries={'gluster/1': (None, '10.0.0.1', 1)}, generation=1)
+        ledger.record('gluster/1', '10.0.0.1')
+        self.assertFalse(ledger.dirty)
+        self.assertFalse(ledger.save())
+        self.assertFalse(_hookenv.leader_set.called)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import mock
+
+import gluster.cli.utils as gluster_utils
+
+from charm.openstack import profiles
+
+
+class TestProfiles(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('charm.openstack.profiles.hookenv')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('charm.openstack.options.hookenv')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def testSysctlSettings(self):
+        self.assertEqual({'vm.dirty_ratio': 10,
+                          'vm.dirty_background_ratio': 2,
+                          'vm.swappiness': 1},
+                         profiles.sysctl_settings(
+                             'vm-image',
+                             '{ vm.dirty_ratio: 10, vm.swappiness: 1 }'))
+        with self.assertRaises(ValueError):
+            profiles.sysctl_settings('nope')
+
+    @mock.patch('charm.openstack.profiles.subprocess')
+    def testApplySysctl(self, _subprocess):
+        path = os.path.join(self.tmp, 'gluster.conf')
+        self.assertTrue(profiles.apply_sysctl({'vm.swappiness': 1}, path))
+        with open(path) as f:
+            self.assertEqual('vm.swappiness=1\n', f.read())
+        _subprocess.check_output.assert_called_once_with(
+            ['sysctl', '-p', path], stderr=_subprocess.STDOUT)
+        self.assertFalse(profiles.apply_sysctl({'vm.swappiness': 1}, path))
+
+    @mock.patch('charm.openstack.profiles.subprocess.call')
+    @mock.patch('charm.openstack.profiles.subprocess.check_output')
+    def testApplySysctlRollsBack(self, _check_output, _call):
+        path = os.path.join(self.tmp, 'gluster.conf')
+        proc = os.path.join(self.tmp, 'proc')
+        os.makedirs(os.path.join(proc, 'vm'))
+        with open(os.path.join(proc, 'vm', 'swappiness'), 'w') as f:
+            f.write('60\n')
+        with open(path, 'w') as f:
+            f.write('vm.swappiness=60\n')
+        _check_output.side_effect = subprocess.CalledProcessError(
+            1, 'sysctl', b'bad')
+        with self.assertRaises(subprocess.CalledProcessError):
+            profiles.apply_sysctl({'vm.swappiness': 1, 'no.such': 1},
+                                  path, proc)
+        with open(path) as f:
+            self.assertEqual('vm.swappiness=60\n', f.read())
+        _call.assert_called_once_with(
+            ['sysctl', '-q', '-w', 'vm.swappiness=60'])
+
+    def testApplyProfile(self):
+        gw = mock.MagicMock()
+        gw.volume_get.return_value = [
+            ('performance.read-ahead', 'on'),
+            ('performance.io-cache', 'on'),
+            ('performance.nl-cache', 'on'),
+        ]
+        result = profiles.apply_profile('test', 'vm-image',
+                                        previous='small-file', gw=gw)
+        gw.volume_set.assert_called_once_with('test', {
+            'performance.io-cache': 'off', 'performance.read-ahead': 'off'})
+        self.assertIn('cluster.eager-lock', result.unknown)
+        # Only the small-file options vm-image doesn't set are reset.
+        resets = [c[0][1] for c in gw.volume_reset.call_args_list]
+        self.assertIn('performance.nl-cache', resets)
+        self.assertNotIn('client.event-threads', resets)
+
+    def testApplyProfileRollsBack(self):
+        gw = mock.MagicMock()
+        gw.volume_get.return_value = [
+            ('performance.cache-size', '32MB'),
+            ('performance.io-cache', 'on (DEFAULT)'),
+            ('performance.io-thread-count', '16'),
+            ('performance.read-ahead', 'off'),
+        ]
+
+        def volume_set(volname, opts):
+            if opts.get('performance.io-thread-count') == '32':
+                raise gluster_utils.GlusterCmdException((1, '', 'bad'))
+        gw.volume_set.side_effect = volume_set
+        result = profiles.apply_profile('test', 'large-sequential', gw=gw)
+        self.assertEqual(['performance.io-thread-count'], list(result.failed))
+        self.assertEqual(mock.call('test', {
+            'performance.cache-size': '32MB',
+            'performance.read-ahead': 'off'}), gw.volume_set.call_args)
+        self.assertFalse(gw.volume_reset.called)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,243 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import gluster.cli.utils as gluster_utils
+import mock
+
+from charm.openstack import quota
+from charm.openstack.model import Quota
+from unit_tests import FakeKV
+
+
+def make_quota(path, exceeded='No', hard_limit=10240, percent='80%'):
+    return Quota(path=path, hard_limit=hard_limit, soft_limit=8192,
+                 soft_limit_percentage=percent, used=0, avail=10240,
+                 soft_limit_exceeded=exceeded, hard_limit_exceeded='No')
+
+
+QUOTAS = [make_quota('/'),
+          make_quota('/projects'),
+          make_quota('/projects/a', exceeded='Yes'),
+          make_quota('/projects/b'),
+          make_quota('/projects-old'),
+          make_quota('/scratch', exceeded='Yes')]
+
+
+class FakeGateway(object):
+    def __init__(self, quotas=QUOTAS):
+        self.quotas = quotas
+        self.read = 0
+        self.closed = False
+
+    def _stream(self):
+        try:
+            for q in self.quotas:
+                self.read += 1
+                yield q
+        finally:
+            self.closed = True
+
+    def iter_quota_list(self, volname):
+        return self._stream()
+
+
+def busy():
+    return gluster_utils.GlusterCmdException(
+        (1, '', 'Another transaction is in progress'))
+
+
+class TestQuota(unittest.TestCase):
+    def testSelect(self):
+        self.assertEqual(['/projects', '/projects/a', '/projects/b'], [
+            q.path for q in quota.select(QUOTAS, '/projects/')])
+        self.assertEqual(6, len(list(quota.select(QUOTAS, '/'))))
+        self.assertEqual(['/projects/a', '/scratch'], [
+            q.path for q in quota.select(QUOTAS, exceeded_only=True)])
+        self.assertEqual(['/projects/a'], [
+            q.path for q in quota.select(QUOTAS, '/projects', True)])
+
+    def testPage(self):
+        page = quota.page(iter(QUOTAS), offset=1, limit=2)
+        self.assertEqual(['/projects', '/projects/a'],
+                         [q.path for q in page.quotas])
+        self.assertEqual(3, page.next_offset)
+        page = quota.page(iter(QUOTAS), offset=4, limit=2)
+        self.assertEqual(2, len(page.quotas))
+        self.assertIsNone(page.next_offset)
+        self.assertEqual(6, len(quota.page(iter(QUOTAS), limit=0).quotas))
+        self.assertEqual(quota.Page([], None),
+                         quota.page(iter(QUOTAS), offset=10))
+
+    def testListStopsEarly(self):
+        gw = FakeGateway()
+        page = quota.list_quotas('test', limit=2, gw=gw)
+        self.assertEqual(['/', '/projects'], [q.path for q in page.quotas])
+        self.assertEqual(2, page.next_offset)
+        # One quota past the page is read to know there is another page.
+        self.assertEqual(3, gw.read)
+        self.assertTrue(gw.closed)
+
+    def testExport(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'quotas.jsonl')
+        self.assertEqual(2, quota.export_quotas(
+            'test', path, exceeded_only=True, gw=FakeGateway()))
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(['/projects/a', '/scratch'],
+                         [line['path'] for line in lines])
+        self.assertEqual('Yes', lines[0]['soft-limit-exceeded'])
+
+        gw = FakeGateway()
+        self.assertEqual(1, quota.export_quotas('test', path, offset=1,
+                                                limit=1, gw=gw))
+        self.assertTrue(gw.closed)
+        self.assertEqual(['quotas.jsonl'], os.listdir(tmp))
+
+    @mock.patch('charm.openstack.quota.os.rename')
+    def testExportFailure(self, rename):
+        rename.side_effect = OSError('read-only')
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with self.assertRaises(OSError):
+            quota.export_quotas('test', os.path.join(tmp, 'quotas.jsonl'),
+                                gw=FakeGateway())
+        self.assertEqual([], os.listdir(tmp))
+
+
+class TestReconcile(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('charm.openstack.quota.hookenv')
+        self.hookenv = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.kv = FakeKV()
+        self.gw = mock.MagicMock()
+        self.gw.volume_info.return_value = [
+            mock.MagicMock(options={'features.quota': 'on'})]
+        self.gw.iter_quota_list.side_effect = lambda volname: iter([
+            make_quota('/a', hard_limit=10 * 1024 ** 3),
+            make_quota('/b', hard_limit=1024 ** 3),
+            make_quota('/manual', hard_limit=1024 ** 3)])
+
+    def testParseSpec(self):
+        spec = quota.parse_spec(
+            '{/b/: 1.5GB, /a: {hard-limit: 1T, soft-limit: 90%}, /c: 4096}')
+        self.assertEqual(['/a', '/b', '/c'], list(spec))
+        self.assertEqual(quota.QuotaSpec('/a', 1024 ** 4, 90), spec['/a'])
+        self.assertEqual(1610612736, spec['/b'].hard_limit)
+        self.assertEqual(4096, spec['/c'].hard_limit)
+        self.assertEqual({}, quota.parse_spec(''))
+        for bad in ('[/a]', '{a: 1GB}', '{/a: lots}',
+                    '{/a: {soft-limit: 80%}}', '{/a: {hard-limit: 1GB, '
+                    'soft-limit: 120%}}', '{/a: 1GB'):
+            with self.assertRaises(ValueError):
+                quota.parse_spec(bad)
+
+    def testDiff(self):
+        current = [make_quota('/a'), make_quota('/b'),
+                   make_quota('/c', percent='90%'), make_quota('/old'),
+                   make_quota('/manual')]
+        spec = quota.parse_spec({'/a': 10240, '/b': 20480, '/new': 1024,
+                                 '/c': {'hard-limit': 10240,
+                                        'soft-limit': 80}})
+        add, change, remove, unchanged = quota.diff(current, spec,
+                                                    managed=['/old'])
+        self.assertEqual(['/new'], [w.path for w in add])
+        self.assertEqual(['/b', '/c'], [w.path for w in change])
+        self.assertEqual(['/old'], remove)
+        self.assertEqual(1, unchanged)
+        _, _, remove, _ = quota.diff(current, spec, prune=True)
+        self.assertEqual(['/manual', '/old'], remove)
+
+    def testApplyRetries(self):
+        self.gw.quota_limit_usage.side_effect = [busy(), None, None]
+        self.gw.quota_remove_path.side_effect = busy()
+        sleep = mock.MagicMock()
+        failed = quota.apply(
+            'test', [quota.QuotaSpec('/a', 1024, None)],
+            [quota.QuotaSpec('/b', 2048, 90)], ['/c'], attempts=3,
+            gw=self.gw, sleep=sleep)
+        self.assertEqual(['/c'], list(failed))
+        self.assertEqual(3, self.gw.quota_limit_usage.call_count)
+        self.gw.quota_limit_usage.assert_any_call('test', '/b', 2048, 90)
+        self.assertEqual(3, self.gw.quota_remove_path.call_count)
+        self.assertEqual([mock.call(0.5), mock.call(0.5), mock.call(1.0)],
+                         sleep.call_args_list)
+
+    def testApplyOneAtATime(self):
+        self.assertEqual({}, quota.apply(
+            'test', [quota.QuotaSpec('/a', 1024, None)],
+            [quota.QuotaSpec('/b', 2048, 90)], ['/c'], gw=self.gw))
+        self.assertEqual([
+            mock.call.quota_limit_usage('test', '/a', 1024, None),
+            mock.call.quota_limit_usage('test', '/b', 2048, 90),
+            mock.call.quota_remove_path('test', '/c')],
+            self.gw.method_calls)
+
+    def testReconcile(self):
+        spec = quota.parse_spec('{/a: 10GB, /b: 2GB, /c: 1GB}')
+        result = quota.reconcile('test', spec, kv=self.kv, gw=self.gw)
+        self.assertEqual((['/c'], ['/b'], [], 1, {}, False), (
+            result.added, result.changed, result.removed, result.unchanged,
+            result.failed, result.skipped))
+        self.assertEqual(2, self.gw.quota_limit_usage.call_count)
+        self.assertFalse(self.gw.quota_remove_path.called)
+
+        # The same spec again lists nothing and runs nothing.
+        self.gw.reset_mock()
+        result = quota.reconcile('test', spec, kv=self.kv, gw=self.gw)
+        self.assertTrue(result.skipped)
+        self.assertFalse(self.gw.iter_quota_list.called)
+        self.assertFalse(self.gw.quota_limit_usage.called)
+
+        # Dropping a path removes it, but not quotas set by other means.
+        result = quota.reconcile('test', quota.parse_spec('{/a: 10GB}'),
+                                 kv=self.kv, gw=self.gw)
+        self.assertEqual(['/b'], result.removed)
+        self.gw.quota_remove_path.assert_called_once_with('test', '/b')
+
+    @mock.patch('charm.openstack.quota.unitdata')
+    def testReconcileEmptyStore(self, _unitdata):
+        quota.reconcile('test', quota.parse_spec('{/c: 1GB}'), kv=self.kv,
+                        gw=self.gw)
+        self.assertTrue(self.kv.data)
+        _unitdata.kv.assert_not_called()
+
+    def testReconcileFailureRetried(self):
+        self.gw.quota_limit_usage.side_effect = busy()
+        spec = quota.parse_spec('{/c: 1GB}')
+        result = quota.reconcile('test', spec, attempts=1, kv=self.kv,
+                                 gw=self.gw)
+        self.assertEqual(['/c'], list(result.failed))
+        self.gw.quota_limit_usage.side_effect = None
+        result = quota.reconcile('test', spec, kv=self.kv, gw=self.gw)
+        self.assertFalse(result.skipped)
+        self.assertEqual(['/c'], result.added)
+
+    def testReconcileEnablesQuota(self):
+        self.gw.volume_info.return_value = [mock.MagicMock(options={})]
+        quota.reconcile('test', quota.parse_spec('{/c: 1GB}'), kv=self.kv,
+                        gw=self.gw)
+        self.gw.quota_enable.assert_called_once_with('test')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import unittest
+
+import mock
+
+from charm.openstack import resolver
+from unit_tests import FakeKV
+
+ADDRESSES = {
+    'gluster-0': '10.0.0.1',
+    'gluster-1': '10.0.0.2',
+    'gluster-2': '10.0.0.3',
+}
+
+
+class FakeLookup(object):
+    def __init__(self, addresses=ADDRESSES):
+        self.addresses = addresses
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, name):
+        with self.lock:
+            self.calls.append(name)
+        return self.addresses.get(name)
+
+
+class TestResolver(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('charm.openstack.resolver.hookenv')
+        self.hookenv = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.hookenv.unit_private_ip.return_value = '10.0.0.9'
+        self.kv = FakeKV()
+        self.lookup = FakeLookup()
+        self.clock = [1000.0]
+
+    def make(self):
+        return resolver.Resolver(kv=self.kv, lookup=self.lookup,
+                                 now=lambda: self.clock[0])
+
+    def testResolve(self):
+        r = self.make()
+        self.assertEqual('10.0.0.1', r.resolve('gluster-0'))
+        self.assertEqual('10.0.0.1', r.resolve('gluster-0'))
+        self.assertEqual('192.168.1.1', r.resolve('192.168.1.1'))
+        self.assertEqual('fe80::1', r.resolve('fe80::1%eth0'))
+        self.assertEqual('10.0.0.9', r.resolve('localhost'))
+        self.assertIsNone(r.resolve('missing'))
+        self.assertIsNone(r.resolve('missing'))
+        self.assertEqual(['gluster-0', 'missing'], self.lookup.calls)
+
+    def testResolveAll(self):
+        r = self.make()
+        names = ['gluster-0', 'gluster-1', 'gluster-2', 'missing',
+                 'gluster-1', '10.0.0.7']
+        self.assertEqual({'gluster-0': '10.0.0.1', 'gluster-1': '10.0.0.2',
+                          'gluster-2': '10.0.0.3', 'missing': None,
+                          '10.0.0.7': '10.0.0.7'}, r.resolve_all(names))
+        self.assertEqual(4, len(self.lookup.calls))
+        self.assertEqual(4, len(self.kv.data[resolver.CACHE_KEY]))
+
+    @mock.patch('charm.openstack.resolver.unitdata')
+    def testEmptyStore(self, _unitdata):
+        self.make().resolve_all(['gluster-0'])
+        self.assertIn('gluster-0', self.kv.data[resolver.CACHE_KEY])
+        _unitdata.kv.assert_not_called()
+
+    def testPersistedCache(self):
+        self.make().resolve_all(['gluster-0', 'missing'])
+        self.assertEqual(2, len(self.lookup.calls))
+
+        # A later hook answers from the store while the entries are fresh.
+        self.clock[0] += 30
+        r = self.make()
+        self.assertEqual({'gluster-0': '10.0.0.1', 'missing': None},
+                         r.resolve_all(['gluster-0', 'missing']))
+        self.assertEqual(2, len(self.lookup.calls))
+
+        # Failed lookups expire first.
+        self.clock[0] += resolver.NEGATIVE_TTL
+        self.lookup.addresses = dict(ADDRESSES, missing='10.0.0.4')
+        r = self.make()
+        self.assertEqual({'gluster-0': '10.0.0.1', 'missing': '10.0.0.4'},
+                         r.resolve_all(['gluster-0', 'missing']))
+        self.assertEqual(['gluster-0', 'missing', 'missing'],
+                         self.lookup.calls)
+
+        self.clock[0] += resolver.DEFAULT_TTL
+        self.make().resolve('gluster-0')
+        self.assertEqual(4, len(self.lookup.calls))
+
+    def testTimeout(self):
+        release = threading.Event()
+
+        def lookup(name):
+            if name == 'slow':
+                release.wait(5)
+            return ADDRESSES.get(name)
+
+        r = resolver.Resolver(kv=self.kv, lookup=lookup,
+                              now=lambda: self.clock[0])
+        try:
+            result = r.resolve_all(['gluster-0', 'slow'], timeout=0.1)
+            # The stuck lookup mustn't keep the hook from exiting.
+            stuck = [t for t in threading.enumerate()
+                     if t.name == 'resolver']
+            self.assertTrue(stuck)
+            self.assertTrue(all(t.daemon for t in stuck))
+        finally:
+            release.set()
+        self.assertEqual({'gluster-0': '10.0.0.1', 'slow': None}, result)
+        self.assertNotIn('slow', self.kv.data[resolver.CACHE_KEY])
+
+    @mock.patch.object(resolver, 'local_addresses')
+    def testIsLocal(self, local_addresses):
+        local_addresses.return_value = {'localhost', 'gluster-1', '10.0.0.2'}
+        self.lookup.addresses = dict(ADDRESSES, alias='10.0.0.2')
+        r = self.make()
+        self.assertTrue(r.is_local('gluster-1'))
+        self.assertTrue(r.is_local('alias'))
+        self.assertFalse(r.is_local('gluster-0'))
+        self.assertFalse(r.is_local('missing'))
+        r.is_local('gluster-0')
+        local_addresses.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
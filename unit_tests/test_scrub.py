@@ -0,0 +1,124 @@
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+
+from charm.openstack import scrub
+from charm.openstack.model import ScrubNode, ScrubStatus
+from unit_tests import FakeKV
+
+DISKSTATS = """\
+   8       0 sda 100 0 800 40 50 0 400 60 0 100 100
+   8      16 sdb %d 0 800 %d 0 0 0 0 0 100 100
+"""
+
+
+def at(hour, minute):
+    return time.struct_time((2017, 6, 18, hour, minute, 0, 6, 169, 0))
+
+
+class TestScrub(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('charm.openstack.scrub.hookenv')
+        self.hookenv = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testWindow(self):
+        self.assertIsNone(scrub.parse_window(''))
+        night = scrub.parse_window('22:00-06:00')
+        self.assertEqual((1320, 360), night)
+        self.assertTrue(scrub.in_window(night, at(23, 30)))
+        self.assertTrue(scrub.in_window(night, at(5, 59)))
+        self.assertFalse(scrub.in_window(night, at(6, 0)))
+        self.assertTrue(scrub.in_window(scrub.parse_window('01:00-05:00'),
+                                        at(1, 0)))
+        self.assertTrue(scrub.in_window(None, at(12, 0)))
+        with self.assertRaises(ValueError):
+            scrub.parse_window('25:00-06:00')
+
+    def testDiskLatency(self):
+        proc = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, proc)
+        kv = FakeKV()
+        for ios, ms, latency in ((100, 500, 0.0), (300, 2500, 10.0),
+                                 (300, 2500, 0.0)):
+            with open(os.path.join(proc, 'diskstats'), 'w') as f:
+                f.write(DISKSTATS % (ios, ms))
+            self.assertEqual(latency, scrub.disk_latency(['sdb'], kv, proc))
+
+    def testClusterPressure(self):
+        self.hookenv.relation_ids.return_value = ['server:1']
+        self.hookenv.related_units.return_value = ['gluster/1', 'gluster/2']
+        self.hookenv.relation_get.side_effect = [
+            {'heal-pending': '1500', 'disk-latency-ms': '4.0'},
+            {'heal-pending': 'bogus'},
+        ]
+        self.assertEqual(scrub.Pressure(1500, 12.5),
+                         scrub.cluster_pressure(scrub.Pressure(10, 12.5)))
+
+    def testPublishPressure(self):
+        self.hookenv.relation_ids.return_value = ['server:1']
+        self.hookenv.relation_get.return_value = {}
+        scrub.publish_pressure(scrub.Pressure(1234, 12.5))
+        self.hookenv.relation_set.assert_called_once_with(
+            relation_id='server:1', relation_settings={
+                'heal-pending': '1200', 'disk-latency-ms': '10'})
+        # Within the same buckets nothing is written.
+        self.hookenv.relation_set.reset_mock()
+        self.hookenv.relation_get.return_value = {
+            'heal-pending': '1200', 'disk-latency-ms': '10'}
+        scrub.publish_pressure(scrub.Pressure(1299, 14.9))
+        self.assertFalse(self.hookenv.relation_set.called)
+
+    def testDecide(self):
+        self.assertEqual((False, scrub.OUTSIDE_WINDOW), scrub.decide(
+            False, scrub.Pressure(0, 0), 1000, 50))
+        self.assertEqual((False, 'heal backlog 1500'), scrub.decide(
+            True, scrub.Pressure(1500, 0), 1000, 50))
+        self.assertEqual((False, 'disk latency 80ms'), scrub.decide(
+            True, scrub.Pressure(0, 80), 1000, 50))
+        self.assertEqual((True, None), scrub.decide(
+            True, scrub.Pressure(1500, 80), 0, 0))
+        # A paused scrubber waits for the pressure to halve.
+        self.assertEqual((True, None), scrub.decide(
+            True, scrub.Pressure(0, 40), 1000, 50))
+        self.assertEqual((False, 'disk latency 40ms'), scrub.decide(
+            True, scrub.Pressure(0, 40), 1000, 50, paused=True))
+
+    def testStatus(self):
+        kv = FakeKV()
+        status = ScrubStatus('test', 'Active (Idle)', 'weekly', 'lazy', [
+            ScrubNode('10.0.0.1', 10, 0, None, 60, 0),
+            ScrubNode('localhost', 20, 0, None, 60, 3)])
+        node = scrub.local_node(status, {'localhost', '10.0.0.2'})
+        scrub.save_status('test', node, None, kv)
+        saved = scrub.load_status(kv)
+        self.assertEqual(('test', node, None), saved)
+        self.assertEqual('Bitrot scrub found 3 corrupted files on test',
+                         scrub.status_message(saved))
+        self.assertIsNone(scrub.status_message(
+            ('test', node._replace(errors=0), scrub.OUTSIDE_WINDOW)))
+        self.assertEqual('Scrub of test paused: heal backlog 1500',
+                         scrub.status_message(
+                             ('test', None, 'heal backlog 1500')))
+
+
+if __name__ == "__main__":
+    unittest.main()